@@ -0,0 +1,112 @@
+# Copyright (c) 2020, Anatoli Fedynitch <afedynitch@gmail.com>
+
+# This file is part of the fork (x4i3) of the EXFOR Interface (x4i)
+
+# Please read the LICENCE.txt included in this distribution including "Our [LLNL's]
+# Notice and the GNU General Public License", which applies also to this fork.
+
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License (as published by the
+# Free Software Foundation) version 2, dated June 1991.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the IMPLIED WARRANTY OF
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# terms and conditions of the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+
+"""
+Compares the storage backends of the .x4 files: the size on disk, the
+memory needed to hold all entries and the time to read and decode an entry.
+
+    python benchmarks/bench_entry_store.py [-d path/to/db] [-n rounds]
+
+The memory of the fully populated DataBaseCache (lists of bytes lines) is
+reported as reference for the compressed store, which keeps only the
+compressed entries and the shared dictionary.
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from x4i3 import testDBPath, DataBaseCache
+from x4i3 import exfor_store
+
+
+def cache_bytes(dbpath, keys):
+    cache = DataBaseCache(dbpath, maxBytes=None)
+    total = 0
+    for enum in keys:
+        lines = cache[enum[:3] + "/" + enum + ".x4"]
+        total += sys.getsizeof(lines) + sum(sys.getsizeof(line) for line in lines)
+    return total
+
+
+def read_time(store, keys, rounds):
+    best = None
+    for _ in range(rounds):
+        t0 = time.perf_counter()
+        for enum in keys:
+            exfor_store.decodeEntry(store.read(enum))
+        dt = time.perf_counter() - t0
+        best = dt if best is None else min(best, dt)
+    return best / len(keys)
+
+
+def process_args():
+    parser = argparse.ArgumentParser(description="Benchmark the entry stores")
+    parser.add_argument(
+        "-d", dest="dbpath", default=testDBPath, help="path to the db directory"
+    )
+    parser.add_argument("-n", dest="rounds", default=5, type=int, help="rounds")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = process_args()
+    files = exfor_store.X4FileSystemStore(args.dbpath)
+    keys = files.keys()
+    raw = sum(len(files.read(enum)) for enum in keys)
+    print("{0} entries, {1:.2f} MB of .x4 files".format(len(keys), raw / 1e6))
+    print(
+        "DataBaseCache holding all entries: {0:.2f} MB".format(
+            cache_bytes(args.dbpath, keys) / 1e6
+        )
+    )
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        stores = [("files", files, raw)]
+        fname = os.path.join(tmpdir, "entries.x4pack")
+        exfor_store.buildPackedStore(files, fname)
+        stores.append(("packed", exfor_store.X4PackedStore(fname), os.path.getsize(fname)))
+        codecs = ["zlib"] + ([] if exfor_store.zstandard is None else ["zstd"])
+        for codec in codecs:
+            fname = os.path.join(tmpdir, "entries-" + codec + ".x4zpack")
+            t0 = time.perf_counter()
+            exfor_store.buildCompressedStore(files, fname, codec=codec)
+            build = time.perf_counter() - t0
+            store = exfor_store.X4CompressedStore(fname)
+            print(
+                "Compressed {0}: built in {1:.2f} s, dictionary {2:.1f} kB".format(
+                    codec, build, len(store.zdict) / 1e3
+                )
+            )
+            stores.append(("compressed " + codec, store, os.path.getsize(fname)))
+        for name, store, size in stores:
+            print(
+                "{0:<16} {1:8.2f} MB ({2:5.1%})  {3:8.1f} us per entry".format(
+                    name, size / 1e6, size / raw, 1e6 * read_time(store, keys, args.rounds)
+                )
+            )
+        for name, store, size in stores:
+            store.close()
+    finally:
+        shutil.rmtree(tmpdir)
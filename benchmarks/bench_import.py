@@ -0,0 +1,99 @@
+# Copyright (c) 2020, Anatoli Fedynitch <afedynitch@gmail.com>
+
+# This file is part of the fork (x4i3) of the EXFOR Interface (x4i)
+
+# Please read the LICENCE.txt included in this distribution including "Our [LLNL's]
+# Notice and the GNU General Public License", which applies also to this fork.
+
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License (as published by the
+# Free Software Foundation) version 2, dated June 1991.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the IMPLIED WARRANTY OF
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# terms and conditions of the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+
+"""
+Measures the time it takes to import x4i3 in a fresh interpreter.
+
+Importing the package must not touch the database, the file system or the
+network. The script exits with a non-zero status if the median import time
+of the package exceeds the budget, so that it can be run as a regression
+check. The import times of the submodules are reported for information.
+
+    python benchmarks/bench_import.py --budget 20
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+MODULES = ["x4i3", "x4i3.exfor_manager"]
+
+
+def import_time(module, env):
+    """Cumulative import time of module in microseconds as reported by -X importtime"""
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import " + module],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    if out.stdout:
+        raise RuntimeError(
+            "Importing " + module + " printed to stdout: " + repr(out.stdout)
+        )
+    for line in out.stderr.splitlines():
+        fields = [f.strip() for f in line.split("|")]
+        if len(fields) == 3 and fields[2] == module:
+            return int(fields[1])
+    raise RuntimeError("No import time reported for " + module)
+
+
+def process_args():
+    parser = argparse.ArgumentParser(description="Benchmark the import of x4i3")
+    parser.add_argument(
+        "-n", dest="repeat", default=20, type=int, help="number of fresh interpreters"
+    )
+    parser.add_argument(
+        "--budget",
+        default=20.0,
+        type=float,
+        help="maximum allowed median import time of x4i3 in ms",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = process_args()
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        [os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)]
+        + env.get("PYTHONPATH", "").split(os.pathsep)
+    )
+    # An unusable data path makes sure that nothing is resolved at import
+    env["X43I_DATAPATH"] = os.path.join(tempfile.gettempdir(), "x4i3-not-there")
+
+    exceeded = False
+    for module in MODULES:
+        times = [import_time(module, env) / 1e3 for _ in range(args.repeat)]
+        median = statistics.median(times)
+        print(
+            "{0:<25} median {1:7.2f} ms   min {2:7.2f} ms   max {3:7.2f} ms".format(
+                module, median, min(times), max(times)
+            )
+        )
+        if module == "x4i3" and median > args.budget:
+            exceeded = True
+    if exceeded:
+        print("Import time budget of {0} ms exceeded".format(args.budget))
+        sys.exit(1)
@@ -0,0 +1,66 @@
+# Copyright (c) 2020, Anatoli Fedynitch <afedynitch@gmail.com>
+
+# This file is part of the fork (x4i3) of the EXFOR Interface (x4i)
+
+# Please read the LICENCE.txt included in this distribution including "Our [LLNL's]
+# Notice and the GNU General Public License", which applies also to this fork.
+
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License (as published by the
+# Free Software Foundation) version 2, dated June 1991.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the IMPLIED WARRANTY OF
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# terms and conditions of the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+
+"""
+Measures the time to retrieve and parse all entries of a database with
+X4DBManagerPlainFS.retrieveEntries for an increasing number of worker
+processes.
+
+    python benchmarks/bench_parallel_retrieve.py [-d path/to/datapath] [-w 1,2,4,8]
+
+The entry cache is disabled, so that every run parses all entries.
+"""
+
+import argparse
+import time
+
+from x4i3 import TESTDATAPATH
+from x4i3 import exfor_database, exfor_manager
+
+
+def process_args():
+    parser = argparse.ArgumentParser(description="Benchmark parallel retrieval")
+    parser.add_argument(
+        "-d", dest="datapath", default=TESTDATAPATH, help="path to the database"
+    )
+    parser.add_argument(
+        "-w", dest="workers", default="1,2,4,8", help="comma separated worker counts"
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = process_args()
+    db = exfor_database.X4Database(args.datapath, entryCacheBytes=0)
+    mgr = exfor_manager.X4DBManagerPlainFS(db)
+    smap = mgr.query(reaction="*")
+    print(len(smap), "entries")
+    base = None
+    for workers in [int(w) for w in args.workers.split(",")]:
+        errors = []
+        t0 = time.perf_counter()
+        mgr.retrieveEntries(smap, workers=workers, errors=errors)
+        dt = time.perf_counter() - t0
+        base = dt if base is None else base
+        print(
+            "{0:3d} workers: {1:7.2f} s, speedup {2:5.2f}, {3} errors".format(
+                workers, dt, base / dt, len(errors)
+            )
+        )
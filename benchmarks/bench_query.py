@@ -0,0 +1,167 @@
+# Copyright (c) 2020, Anatoli Fedynitch <afedynitch@gmail.com>
+
+# This file is part of the fork (x4i3) of the EXFOR Interface (x4i)
+
+# Please read the LICENCE.txt included in this distribution including "Our [LLNL's]
+# Notice and the GNU General Public License", which applies also to this fork.
+
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License (as published by the
+# Free Software Foundation) version 2, dated June 1991.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the IMPLIED WARRANTY OF
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# terms and conditions of the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+
+"""
+Measures the latency of X4DBManagerPlainFS.query with and without the SQL
+indexes that X4Database.upgradeIndex adds to the index file.
+
+    python benchmarks/bench_query.py [-i path/to/index.tbl] [-s scale] [-n rounds]
+
+The index is copied to a temporary directory first. With -s, the rows of
+the theworks table are replicated scale times under new ENTRY numbers,
+which turns the small test index into one of the size of the full
+database (about 5000 rows in the test index, so -s 40 gives ~200000).
+The last lines compare the latency of the first and last page of a
+broad query with query_page, and of membership tests (key in manager)
+with the set of accession numbers and with a query.
+"""
+
+import argparse
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+
+from x4i3 import testIndexFileName, testDBPath
+from x4i3 import exfor_database, exfor_manager
+
+QUERIES = [
+    dict(ENTRY="13787"),
+    dict(SUBENT="10001015"),
+    dict(target="PU-239", reaction="N,2N", quantity="CS"),
+    dict(author="Panitkin"),
+    dict(reaction="N,F", quantity="CS"),
+]
+PAGEQUERY = dict(reaction="N,*")
+
+
+def make_index(source, fname, scale):
+    shutil.copy(source, fname)
+    connection = sqlite3.connect(fname)
+    for c in exfor_database.INDEXEDCOLUMNS:
+        connection.execute("drop index if exists theworks_" + c)
+    connection.execute("drop table if exists sqlite_stat1")
+    rows = connection.execute("select * from theworks").fetchall()
+    for i in range(1, scale):
+        prefix = "%02d" % (i % 100)
+        connection.executemany(
+            "insert into theworks values (" + ",".join("?" * len(rows[0])) + ")",
+            [(prefix + r[0][2:], prefix + r[1][2:]) + r[2:] for r in rows],
+        )
+    connection.commit()
+    count = connection.execute("select count(*) from theworks").fetchone()[0]
+    connection.close()
+    return count
+
+
+def latency(mgr, query, rounds):
+    best = None
+    for _ in range(rounds):
+        t0 = time.perf_counter()
+        mgr.query(**query)
+        dt = time.perf_counter() - t0
+        best = dt if best is None else min(best, dt)
+    return best
+
+
+def page_latency(mgr, query, limit, rounds):
+    """Latency of the first and the last page of query, selected by
+    ENTRY number (keyset) and by offset"""
+    pages = []
+    after = None
+    while True:
+        page = mgr.query_page(limit, after=after, **query)
+        if len(page) == 0:
+            break
+        pages.append(after)
+        after = list(page)[-1]
+
+    def best(**kw):
+        return min(timeit(lambda: mgr.query_page(limit, **kw, **query)) for _ in range(rounds))
+    return (len(pages), best(), best(after=pages[-1]), best(offset=limit * (len(pages) - 1)))
+
+
+def contains_latency(mgr, rounds):
+    """Mean latency of key in mgr, with X4Database.accessions and with
+    the query of X4DBManager.__contains__, for existing and missing keys"""
+    keys = [r[0] for r in mgr.CONNECTION.execute("select distinct subent from theworks limit 500")]
+    keys += [k[:5] for k in keys] + [k[:5] + "999" for k in keys]
+    "00000" in mgr  # reads the accession numbers
+
+    def best(contains):
+        return min(timeit(lambda: [contains(k) for k in keys]) for _ in range(rounds)) / len(keys)
+    return (len(keys), best(mgr.__contains__),
+            best(lambda k: exfor_manager.X4DBManager.__contains__(mgr, k)))
+
+
+def timeit(f):
+    t0 = time.perf_counter()
+    f()
+    return time.perf_counter() - t0
+
+
+def process_args():
+    parser = argparse.ArgumentParser(description="Benchmark index queries")
+    parser.add_argument(
+        "-i", dest="index", default=testIndexFileName, help="path to index.tbl"
+    )
+    parser.add_argument("-s", dest="scale", default=1, type=int, help="replicate rows")
+    parser.add_argument("-n", dest="rounds", default=20, type=int, help="rounds")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = process_args()
+    tmpdir = tempfile.mkdtemp()
+    try:
+        fname = os.path.join(tmpdir, "index.tbl")
+        print(make_index(args.index, fname, args.scale), "rows in theworks")
+        # without the indexes, which upgradeIndex adds
+        plain = exfor_database.X4Database(tmpdir, testDBPath, "file:" + fname + "?mode=ro", uri=True,
+                                          queryCacheSize=0)
+        indexed = exfor_database.X4Database(tmpdir, testDBPath, fname, queryCacheSize=0)
+        cached = exfor_database.X4Database(tmpdir, testDBPath, fname)
+        results = []
+        for db in [plain, indexed, cached]:
+            if db is indexed:
+                indexed.upgradeIndex()
+            mgr = exfor_manager.X4DBManagerPlainFS(db)
+            results.append([latency(mgr, q, args.rounds) for q in QUERIES])
+        print("{0:<55} {1:>12} {2:>12} {3:>12}".format("query", "no index", "indexed", "cached"))
+        for q, a, b, c in zip(QUERIES, *results):
+            print(
+                "{0:<55} {1:9.3f} ms {2:9.3f} ms {3:9.3f} ms".format(
+                    ", ".join(k + "=" + v for k, v in q.items()), 1e3 * a, 1e3 * b, 1e3 * c
+                )
+            )
+        print("query cache:", cached.queryCache.cache_info())
+        pages, first, keyset, offset = page_latency(
+            exfor_manager.X4DBManagerPlainFS(indexed), PAGEQUERY, 20, args.rounds)
+        print("query_page(20, reaction=N,*) of", pages, "pages: first {0:.3f} ms, last {1:.3f} ms "
+              "with after, {2:.3f} ms with offset".format(1e3 * first, 1e3 * keyset, 1e3 * offset))
+        count, fast, slow = contains_latency(exfor_manager.X4DBManagerPlainFS(indexed), args.rounds)
+        print("key in manager for", count, "keys: {0:.2f} us with the accession numbers, {1:.2f} us "
+              "with a query".format(1e6 * fast, 1e6 * slow))
+        plain.close()
+        indexed.close()
+        cached.close()
+    finally:
+        shutil.rmtree(tmpdir)
@@ -0,0 +1,116 @@
+# Copyright (c) 2020, Anatoli Fedynitch <afedynitch@gmail.com>
+
+# This file is part of the fork (x4i3) of the EXFOR Interface (x4i)
+
+# Please read the LICENCE.txt included in this distribution including "Our [LLNL's]
+# Notice and the GNU General Public License", which applies also to this fork.
+
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License (as published by the
+# Free Software Foundation) version 2, dated June 1991.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the IMPLIED WARRANTY OF
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# terms and conditions of the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+
+"""
+Measures the throughput of the pyparsing grammar for REACTION and MONITOR
+fields, using all fields found in the .x4 files of a database.
+
+    python benchmarks/bench_reaction_parsing.py [-d path/to/db] [-n rounds]
+
+The time to build the particle and compound matchers from the EXFOR
+dictionaries is reported separately, together with that of the pyparsing
+Or alternation of Literals that was used before.
+"""
+
+import argparse
+import glob
+import os
+import time
+
+from x4i3 import testDBPath
+from x4i3 import exfor_dicts, exfor_field, exfor_grammers
+from x4i3.pyparsing3 import Literal, Or
+
+FIELDTAGS = ("REACTION", "MONITOR")
+
+
+def collect_fields(dbpath):
+    """Returns the text of all REACTION and MONITOR pointers found in dbpath"""
+    result = []
+    for fname in sorted(glob.glob(os.path.join(str(dbpath), "*", "*.x4"))):
+        field = None
+        with open(fname, encoding="latin1") as f:
+            for line in f:
+                line = line.rstrip("\r\n")
+                tag = line[0:10].strip()
+                if tag in FIELDTAGS:
+                    field = [line]
+                elif field is not None and tag == "":
+                    field.append(line)
+                    continue
+                elif field is not None:
+                    for p, subfield in exfor_field.X4PlainField(field).items():
+                        result.append(str(subfield))
+                    field = None
+    return result
+
+
+def parse_all(fields):
+    failures = 0
+    for d in fields:
+        try:
+            exfor_grammers.x4reactionfield.parseString(d)
+        except Exception:
+            failures += 1
+    return failures
+
+
+def build_time(keys, builder, repeat=20):
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        builder(keys)
+    return (time.perf_counter() - t0) / repeat
+
+
+def process_args():
+    parser = argparse.ArgumentParser(description="Benchmark REACTION field parsing")
+    parser.add_argument(
+        "-d", dest="dbpath", default=testDBPath, help="path to the db directory"
+    )
+    parser.add_argument("-n", dest="rounds", default=5, type=int, help="rounds")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = process_args()
+    fields = collect_fields(args.dbpath)
+    print("Collected", len(fields), "REACTION/MONITOR pointers from", args.dbpath)
+
+    best = None
+    for _ in range(args.rounds):
+        t0 = time.perf_counter()
+        failures = parse_all(fields)
+        dt = time.perf_counter() - t0
+        best = dt if best is None else min(best, dt)
+    print(
+        "Parsing: {0:8.1f} fields/s ({1:.3f} s per round, {2} failures)".format(
+            len(fields) / best, best, failures
+        )
+    )
+
+    server = exfor_dicts.X4DictionaryServer()
+    for name in ["Particles", "Compounds"]:
+        keys = list(server[name].keys())
+        legacy = build_time(keys, lambda k: Or([Literal(x) for x in k]))
+        trie = build_time(keys, exfor_grammers.x4LongestMatch)
+        print(
+            "Building {0:<10} {1:4d} keys: Or of Literals {2:8.3f} ms, "
+            "trie regex {3:8.3f} ms".format(name, len(keys), 1e3 * legacy, 1e3 * trie)
+        )
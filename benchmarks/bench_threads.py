@@ -0,0 +1,81 @@
+# Copyright (c) 2020, Anatoli Fedynitch <afedynitch@gmail.com>
+
+# This file is part of the fork (x4i3) of the EXFOR Interface (x4i)
+
+# Please read the LICENCE.txt included in this distribution including "Our [LLNL's]
+# Notice and the GNU General Public License", which applies also to this fork.
+
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License (as published by the
+# Free Software Foundation) version 2, dated June 1991.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the IMPLIED WARRANTY OF
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# terms and conditions of the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+
+"""
+Measures the throughput of index queries through one X4DBManagerPlainFS
+shared by an increasing number of threads, each of which uses its own
+connection to the index.
+
+    python benchmarks/bench_threads.py [-i path/to/index.tbl] [-s scale] [-t 1,2,4,8,16,32] [-n queries]
+
+With -s, the index is enlarged as in bench_query.py.
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bench_query import QUERIES, make_index
+from x4i3 import testIndexFileName, testDBPath
+from x4i3 import exfor_database, exfor_manager
+
+
+def throughput(mgr, threads, count):
+    queries = [QUERIES[i % len(QUERIES)] for i in range(count)]
+    with ThreadPoolExecutor(threads) as executor:
+        # open the connections of the threads before the clock starts
+        list(executor.map(lambda q: mgr.query(**q), queries[:threads]))
+        t0 = time.perf_counter()
+        list(executor.map(lambda q: mgr.query(**q), queries))
+        return count / (time.perf_counter() - t0)
+
+
+def process_args():
+    parser = argparse.ArgumentParser(description="Benchmark concurrent index queries")
+    parser.add_argument(
+        "-i", dest="index", default=testIndexFileName, help="path to index.tbl"
+    )
+    parser.add_argument("-s", dest="scale", default=1, type=int, help="replicate rows")
+    parser.add_argument(
+        "-t", dest="threads", default="1,2,4,8,16,32", help="comma separated thread counts"
+    )
+    parser.add_argument("-n", dest="count", default=2000, type=int, help="queries per run")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = process_args()
+    tmpdir = tempfile.mkdtemp()
+    try:
+        fname = os.path.join(tmpdir, "index.tbl")
+        print(make_index(args.index, fname, args.scale), "rows in theworks")
+        db = exfor_database.X4Database(tmpdir, testDBPath, fname)
+        mgr = exfor_manager.X4DBManagerPlainFS(db)
+        base = None
+        for threads in [int(t) for t in args.threads.split(",")]:
+            rate = throughput(mgr, threads, args.count)
+            base = rate if base is None else base
+            print("{0:3d} threads: {1:9.0f} queries/s, {2:5.2f} x".format(threads, rate, rate / base))
+        db.close()
+    finally:
+        shutil.rmtree(tmpdir)
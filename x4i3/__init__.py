@@ -46,10 +46,13 @@
 
 # General info
 from __future__ import print_function
+import io
 import os
 import sys
 import pathlib
 
+from .exfor_cache import X4LRUCache, DEFAULTCACHEBYTES
+
 MAJOR_VERSION = 1
 MINOR_VERSION = 2
 PATCH = 5
@@ -81,32 +84,24 @@ coupledFileName = "coupled-entries.pickle"
 monitoredFileName = "monitored-entries.pickle"
 reactionCountFileName = "reaction-count.pickle"
 dbPath = "db"
+packFileName = "entries.x4pack"
+compressedFileName = "entries.x4zpack"
 
 # URL to the compressed database files on github
 url = "https://github.com/afedynitch/x4i3/releases/download/last_before_pep8_formatting/x4i3_X4-2023-12-31.tar.gz"
 # url='https://github.com/afedynitch/x4i3/releases/download/last_before_pep8_formatting/x4i3_EXFOR-2016-04-01.tar.gz'
+# Checksum manifest in the format of sha256sum, published as an asset of
+# the same release as url (sha256sum x4i3_X4-*.tar.gz > SHA256SUMS). The
+# default tarball and copies of it under the same name, e.g. on a mirror
+# given by X43I_DATABASE_URL, are verified against it.
+url_manifest = url.rsplit("/", 1)[0] + "/SHA256SUMS"
 current_tag = pathlib.Path(pathlib.Path(url).stem).stem
 
 if "X43I_DATAPATH" in os.environ:
     DATAPATH = pathlib.Path(os.environ["X43I_DATAPATH"])
-    if not DATAPATH.exists():
-        raise FileNotFoundError(
-            f"X43I_DATAPATH={DATAPATH} does not exist. Please point this variable"
-            + " to the x4i3_EXFOR-20XX-XX-XX directory created by unpacking"
-            + " masterfiles with x4i3_tools."
-        )
-    tags = list(DATAPATH.glob("X4-20*"))
-    if len(tags) == 0:
-        raise FileNotFoundError(
-            f"No tag file in the format 'X4-20XX-XX-XX' found in {DATAPATH}"
-        )
-    else:
-        dbTagFile = DATAPATH / tags[0]
 else:
     # Follow default path
     DATAPATH = pathlib.Path(__path__[0], "data").absolute() / current_tag
-    dbTagFile = DATAPATH / current_tag
-
 
 fullIndexFileName = DATAPATH / indexFileName
 fullErrorFileName = DATAPATH / errorFileName
@@ -115,7 +110,16 @@ fullMonitoredFileName = DATAPATH / monitoredFileName
 fullReactionCountFileName = DATAPATH / reactionCountFileName
 fullDBPath = DATAPATH / dbPath
 
-print(f"Using database version {current_tag} located in: {DATAPATH}")
+# Files derived from the package and database files, which can be
+# recreated at any time, are stored here, by default in the cache
+# directory of the user, since the package directory may be read-only
+if "X43I_CACHEPATH" in os.environ:
+    CACHEPATH = pathlib.Path(os.environ["X43I_CACHEPATH"])
+else:
+    CACHEPATH = (
+        pathlib.Path(os.environ.get("XDG_CACHE_HOME") or pathlib.Path.home() / ".cache")
+        / "x4i3"
+    )
 
 # Paths for unit testing only
 # Mock db for testing
@@ -124,75 +128,27 @@ testDBPath = TESTDATAPATH / "db"
 testIndexFileName = TESTDATAPATH / indexFileName
 
 
-def _download_and_unpack_file(url):
+def _download_and_unpack_file(source):
     """Downloads the database files created with setup-exfor-db.py as
-    a tarball and unpacks them to the correct folder."""
-
-    from tqdm import tqdm
-    from glob import glob
-    import requests
-    import math
-    import tarfile
-    import tempfile
-    import shutil
-
-    # cleanup
-    # for f in [
-    #     fullIndexFileName,
-    #     fullErrorFileName,
-    #     fullCoupledFileName,
-    #     fullMonitoredFileName,
-    #     fullReactionCountFileName,
-    #     fullDBPath,
-    #     dbTagFile,
-    # ]:
-    #     try:
-    #         shutil.rmtree(f)
-    #     except NotADirectoryError:
-    #         os.remove(f)
-    #     except FileNotFoundError:
-    #         pass
-    # Tag files:
-    
-    for tagfile in DATAPATH.glob("X4-*"):
-        try:
-            os.remove(tagfile)
-        except FileNotFoundError:
-            pass
-
-    # Streaming, so we can iterate over the response.
-    r = requests.get(url, stream=True)
-    tarname = os.path.basename(url)
-
-    # Total size in bytes.
-    total_size = int(r.headers.get("content-length", 0))
-    block_size = 1024 * 1024
-    wrote = 0
-    tempfile = tempfile.TemporaryFile()
-
-    print("Downloading data file", tarname)
-    for data in tqdm(
-        r.iter_content(block_size),
-        total=math.ceil(total_size // block_size),
-        unit="MB",
-        unit_scale=True,
-    ):
-        wrote = wrote + len(data)
-        tempfile.write(data)
-    if total_size != 0 and wrote != total_size:
-        raise Exception("ERROR, something went wrong")
-    tempfile.flush()
-    tempfile.seek(0)
-    print("Decompressing archive", tarname)
-    with tarfile.open(fileobj=tempfile, mode="r") as _tar:
-        total = len(_tar.getmembers())
-        for member in tqdm(_tar.getmembers(), total=total):
-            _tar.extract(member, DATAPATH)
-    tempfile.close()
-
-    with open(dbTagFile, "wb") as f:
-        print("Installed database version", dbTagFile.stem)
-        pass
+    a tarball and unpacks them to the correct folder.
+
+    source is url or another URL, a file:// URL or the path to a local
+    copy of the tarball. The checksum of the tarball is looked up in the
+    manifest in the format of sha256sum given by X43I_DATABASE_MANIFEST,
+    by default url_manifest. The installation fails if the manifest has
+    no checksum for the tarball."""
+    from .exfor_installer import install_database
+    from .exfor_database import X4Database
+
+    install_database(
+        source,
+        DATAPATH,
+        manifest=os.environ.get("X43I_DATABASE_MANIFEST", url_manifest),
+        tag=current_tag if "X43I_DATAPATH" not in os.environ else _find_tag_file().name,
+    )
+    db = X4Database(DATAPATH)
+    db.upgradeIndex()
+    db.close()
 
 
 def check_if_exists(path, return_bool=False):
@@ -206,74 +162,131 @@ def check_if_exists(path, return_bool=False):
         raise IOError("File/Directory", path, "not found. Check installation.")
 
 
-# Don't download an unpack the files if the module is just tested
-if "pytest" not in sys.modules:
+def _tag_files(datapath):
+    """The tag files in datapath, sorted by name: X4-YYYY-MM-DD, as written
+    by the updates and the x4i3_tools, or x4i3_X4-YYYY-MM-DD (current_tag),
+    as installed from url."""
+    return sorted(list(datapath.glob("X4-20*")) + list(datapath.glob("x4i3_X4-20*")))
+
+
+def _find_tag_file():
+    """Locates the tag file that marks the installed database version."""
+    if "X43I_DATAPATH" not in os.environ:
+        # the tag of an update, or current_tag before the first download
+        tags = _tag_files(DATAPATH)
+        return tags[0] if len(tags) > 0 else DATAPATH / current_tag
+    if not DATAPATH.exists():
+        raise FileNotFoundError(
+            f"X43I_DATAPATH={DATAPATH} does not exist. Please point this variable"
+            + " to the x4i3_EXFOR-20XX-XX-XX directory created by unpacking"
+            + " masterfiles with x4i3_tools."
+        )
+    tags = _tag_files(DATAPATH)
+    if len(tags) == 0:
+        raise FileNotFoundError(
+            f"No tag file in the format 'X4-20XX-XX-XX' found in {DATAPATH}"
+        )
+    return tags[0]
+
+
+def __getattr__(name):
+    # The tag file is looked up on first access, since this requires
+    # listing DATAPATH, which can be slow on network file systems.
+    if name == "dbTagFile":
+        global dbTagFile
+        dbTagFile = _find_tag_file()
+        return dbTagFile
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+_database_checked = False
+
+
+def check_database():
+    """Verifies that the default database is installed and downloads it
+    if needed.
+
+    Importing x4i3 does not touch the file system or the network. This
+    function is called by the managers and entry factories the first time
+    they need the default database and does nothing on subsequent calls."""
+    global _database_checked
+    if _database_checked:
+        return
+    # Don't download an unpack the files if the module is just tested
+    if "pytest" in sys.modules:
+        return
+    paths = [
+        DATAPATH,
+        fullIndexFileName,
+        fullErrorFileName,
+        fullCoupledFileName,
+        fullMonitoredFileName,
+        fullReactionCountFileName,
+        fullDBPath,
+    ]
+    tag_file = _find_tag_file()
+    print(f"Using database version {tag_file.name} located in: {DATAPATH}")
+
     # Check if all files can be located and redownload the archive
-    if not all(
-        [
-            check_if_exists(p, return_bool=True)
-            for p in [
-                DATAPATH,
-                fullIndexFileName,
-                fullErrorFileName,
-                fullCoupledFileName,
-                fullMonitoredFileName,
-                fullReactionCountFileName,
-                fullDBPath,
-                dbTagFile,
-            ]
-        ]
-    ):
-        _download_and_unpack_file(url)
+    if not all([check_if_exists(p, return_bool=True) for p in paths + [tag_file]]):
+        _download_and_unpack_file(os.environ.get("X43I_DATABASE_URL", url))
 
     # Check if all files can be located and raise exception if still not there
-    _ = [
-        check_if_exists(p)
-        for p in [
-            DATAPATH,
-            fullIndexFileName,
-            fullErrorFileName,
-            fullCoupledFileName,
-            fullMonitoredFileName,
-            fullReactionCountFileName,
-            fullDBPath,
-            dbTagFile,
-        ]
-    ]
+    _ = [check_if_exists(p) for p in paths + [tag_file]]
+    _database_checked = True
+
 
 # Applications that query multiple entries subsequently using an in-memory
 # dictionary that contains all .x4 files from the db folder can improve performance
 
 
-class DataBaseCache(dict):
-    """Reads all .x4 files from db folder and strres them
-    in an in-memory dictionary for faster access"""
-
-    def __init__(self):
-        self.__initialized = False
-
-    def __load_cache(self):
-        for sd in os.listdir(fullDBPath):
-            for x4f in os.listdir(os.path.join(fullDBPath, sd)):
-                k = sd + "/" + x4f
-                dict.__setitem__(
-                    self, k, open(os.path.join(fullDBPath, sd, x4f), "rb").readlines()
-                )
-        self.__initialized = True
+class DataBaseCache(X4LRUCache):
+    """Reads .x4 files from the db folder on first access and keeps them
+    in an in-memory cache of at most maxBytes bytes for faster access.
+
+    The keys are the paths of the files relative to dbPath, e.g.
+    '100/10001.x4', and the values the lines of the files as bytes. The
+    files are read from store if given, e.g. the memory mapped
+    exfor_store.X4PackedStore, otherwise from the db/ tree."""
+
+    def __init__(self, dbPath=None, maxBytes=DEFAULTCACHEBYTES, store=None):
+        X4LRUCache.__init__(self, maxBytes, lambda lines: sum(map(len, lines)))
+        self.dbPath = dbPath
+        self.store = store
+
+    def __load(self, key):
+        if self.store is None:
+            if self.dbPath is None:
+                check_database()
+                self.dbPath = fullDBPath
+            from .exfor_store import X4FileSystemStore
+            self.store = X4FileSystemStore(self.dbPath)
+        enum = key.split("/")[-1][:-3]
+        try:
+            data = self.store.read(enum)
+        except FileNotFoundError:
+            raise KeyError(key)
+        return io.BytesIO(data).readlines()
 
     def __getitem__(self, key):
-        if not self.__initialized:
-            self.__load_cache()
-        return dict.__getitem__(self, key)
+        return self.get(key, self.__load)
 
 
-# Does lazy initialization, only loads x4 files into memory on access
+# Does lazy initialization, only loads x4 files into memory on access and
+# keeps the most recently used ones
 database_dict = DataBaseCache()
 
 __all__ = [
     "__init__",
+    "exfor_database",
+    "exfor_store",
+    "exfor_cache",
+    "exfor_index",
+    "exfor_indexer",
+    "exfor_updater",
     "exfor_dataset",
     "exfor_exceptions",
+    "exfor_installer",
     "exfor_manager",
     "exfor_reference",
     "exfor_utilities",
@@ -0,0 +1,179 @@
+# Copyright (c) 2020, Anatoli Fedynitch <afedynitch@gmail.com>
+
+# This file is part of the fork (x4i3) of the EXFOR Interface (x4i)
+
+# Please read the LICENCE.txt included in this distribution including "Our [LLNL's]
+# Notice and the GNU General Public License", which applies also to this fork.
+
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License (as published by the
+# Free Software Foundation) version 2, dated June 1991.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the IMPLIED WARRANTY OF
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# terms and conditions of the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+
+# module exfor_cache.py
+"""
+exfor_cache module - Bounded in-memory caches with least recently used eviction
+"""
+
+import collections
+import os
+import pickle
+import threading
+import time
+
+# Default byte budget of the caches of .x4 files
+DEFAULTCACHEBYTES = 256 * 2**20
+# Default byte budget of the caches of parsed entries
+DEFAULTENTRYCACHEBYTES = 64 * 2**20
+# Default number of query results that are kept
+DEFAULTQUERYCACHESIZE = 256
+
+
+class CacheInfo(collections.namedtuple(
+        'CacheInfo', ['hits', 'misses', 'evictions', 'currbytes', 'maxbytes', 'length'])):
+    __slots__ = ()
+
+    @property
+    def hitrate(self):
+        '''Fraction of the lookups that were hits'''
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class X4LRUCache:
+    """
+    Cache of at most maxBytes bytes, as measured by sizeof for each value,
+    which evicts the least recently used values first. Set maxBytes to
+    None for an unbounded cache. Values larger than the whole budget are
+    returned but not stored. With ttl, values older than ttl seconds are
+    dropped when they are looked up.
+
+    Counters of hits, misses and evictions are returned by cache_info().
+    Evictions include the expired values, which are also counted alone
+    in expirations. The cache can be shared between threads.
+    """
+
+    def __init__(self, maxBytes=DEFAULTCACHEBYTES, sizeof=len, ttl=None):
+        self.maxBytes = maxBytes
+        self.sizeof = sizeof
+        self.ttl = ttl
+        self.currBytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.__data = collections.OrderedDict()
+        self.__lock = threading.RLock()
+
+    def get(self, key, load):
+        '''Returns the value of key, calling load(key) to create it on a miss'''
+        with self.__lock:
+            if key in self.__data:
+                value, size, stamp = self.__data[key]
+                if self.ttl is None or time.monotonic() - stamp < self.ttl:
+                    self.__data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self.__data[key]
+                self.currBytes -= size
+                self.evictions += 1
+                self.expirations += 1
+            self.misses += 1
+        value = load(key)
+        self.put(key, value)
+        return value
+
+    def put(self, key, value):
+        size = self.sizeof(value)
+        with self.__lock:
+            if key in self.__data:
+                self.currBytes -= self.__data.pop(key)[1]
+            if self.maxBytes is not None and size > self.maxBytes:
+                return
+            self.__data[key] = (value, size, time.monotonic())
+            self.currBytes += size
+            while self.maxBytes is not None and self.currBytes > self.maxBytes:
+                self.currBytes -= self.__data.popitem(last=False)[1][1]
+                self.evictions += 1
+
+    def __contains__(self, key):
+        return key in self.__data
+
+    def __len__(self):
+        return len(self.__data)
+
+    def clear(self):
+        '''Drops all values, the counters are kept'''
+        with self.__lock:
+            self.__data.clear()
+            self.currBytes = 0
+
+    def cache_info(self):
+        with self.__lock:
+            return CacheInfo(self.hits, self.misses, self.evictions,
+                             self.currBytes, self.maxBytes, len(self.__data))
+
+
+class X4DiskCache:
+    """
+    Persistent cache of bytes values, e.g. pickled entries, with one file per
+    key below directory. Keys are tuples that start with the database tag
+    and the ENTRY, which select the directory of the file. Each value is
+    stored with the stamp of the data it was made from and is made again
+    if the stamp differs, so changed .x4 files are picked up.
+
+    Files are written to a temporary file of their own and replaced
+    atomically, so that threads and processes can share the directory; if
+    directory cannot be written the cache only reads.
+    """
+
+    def __init__(self, directory):
+        self.directory = str(directory)
+        self.hits = 0
+        self.misses = 0
+
+    def fileName(self, key):
+        import hashlib
+        digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()[:16]
+        tag, enum = str(key[0]), key[1]
+        return os.path.join(self.directory, tag, enum[:3], enum + '-' + digest + '.pickle')
+
+    def get(self, key, stamp, load, refresh=False):
+        '''Returns the value of key, calling load(key) to make it if it is missing or stale,
+        or if refresh is True, e.g. because the value that was read is damaged'''
+        import tempfile
+        fname = self.fileName(key)
+        if not refresh:
+            try:
+                with open(fname, 'rb') as f:
+                    if pickle.load(f) == stamp:
+                        value = f.read()
+                        self.hits += 1
+                        return value
+            except Exception:
+                pass
+        self.misses += 1
+        value = load(key)
+        tmpname = None
+        try:
+            os.makedirs(os.path.dirname(fname), exist_ok=True)
+            fd, tmpname = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(fname))
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(stamp, f, pickle.HIGHEST_PROTOCOL)
+                f.write(value)
+            os.replace(tmpname, fname)
+        except OSError:
+            if tmpname is not None and os.path.exists(tmpname):
+                os.remove(tmpname)
+        return value
+
+    def cache_info(self):
+        return CacheInfo(self.hits, self.misses, 0, None, None, None)
@@ -0,0 +1,437 @@
+# Copyright (c) 2020, Anatoli Fedynitch <afedynitch@gmail.com>
+
+# This file is part of the fork (x4i3) of the EXFOR Interface (x4i)
+
+# Please read the LICENCE.txt included in this distribution including "Our [LLNL's]
+# Notice and the GNU General Public License", which applies also to this fork.
+
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License (as published by the
+# Free Software Foundation) version 2, dated June 1991.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the IMPLIED WARRANTY OF
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# terms and conditions of the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+
+# module exfor_database.py
+"""
+exfor_database module - Handle for an installed EXFOR database
+"""
+
+import os
+import pathlib
+import threading
+import time
+import weakref
+
+import x4i3
+from . import exfor_index
+from .exfor_exceptions import IndexUpgradeError
+from .exfor_cache import X4LRUCache, X4DiskCache, DEFAULTENTRYCACHEBYTES, DEFAULTQUERYCACHESIZE
+from .exfor_store import (X4FileSystemStore, X4PackedStore, X4CompressedStore,
+                          buildPackedStore, buildCompressedStore, decodeEntry)
+
+
+# Columns of the theworks table that the queries search
+INDEXEDCOLUMNS = ['entry', 'subent', 'author', 'target', 'reaction', 'projectile', 'quantity',
+                  'product', 'MF', 'MT'] + exfor_index.RANGECOLUMNS + exfor_index.TARGETCOLUMNS
+
+# Columns that X4Database.upgradeIndex adds to theworks of older index files,
+# and the functions of exfor_index that add and fill them
+COLUMNUPGRADES = [
+    (exfor_index.REACTIONCOLUMNS, exfor_index.addReactionColumns),
+    (exfor_index.RANGECOLUMNS, exfor_index.addRangeColumns),
+    (exfor_index.TARGETCOLUMNS, exfor_index.addTargetColumns),
+]
+
+
+class _ThreadConnection:
+    '''The connection of a thread to the index, kept in the thread-local storage of
+    X4Database, so that the connection is closed when the thread ends'''
+    __slots__ = ('connection', '__weakref__')
+
+    def __init__(self, connection):
+        self.connection = connection
+
+
+class X4Database:
+    """
+    An EXFOR database release, i.e. a directory with the index file, the db/
+    tree of .x4 files and the tag file X4-YYYY-MM-DD, as unpacked from the
+    database tarballs.
+
+    The database owns its paths, the connection to the index and caches of
+    its entries. Pass it to the managers and the entry factories to work
+    with several releases in one process. Managers that share an X4Database
+    share its caches.
+
+    The paths default to the layout of the tarballs in DATAPATH. Keyword
+    arguments that are not paths are passed on to sqlite3.connect.
+
+    The .x4 files are read from store, which is 'files' for the db/ tree
+    (the default), 'packed' for the packed store in DATAPATH that pack()
+    creates, 'compressed' for the compressed store that compress() creates,
+    or any object with the interface of X4FileSystemStore.
+    database_dict keeps at most cacheBytes bytes of .x4 files in memory,
+    entryCache at most entryCacheBytes bytes of parsed entries. Parsed
+    entries are also kept on disk if diskCache is True (in CACHEPATH) or a
+    directory, see X4DiskCache. queryCache keeps the results of the last
+    queryCacheSize queries, for at most queryCacheTTL seconds if it is not
+    None; set queryCacheSize to 0 to run every query.
+    """
+
+    def __init__(self, DATAPATH, fullDBPath=None, fullIndexFileName=None, store='files',
+                 cacheBytes=x4i3.DEFAULTCACHEBYTES, entryCacheBytes=DEFAULTENTRYCACHEBYTES,
+                 diskCache=None, queryCacheSize=DEFAULTQUERYCACHESIZE, queryCacheTTL=None, **kw):
+        self.DATAPATH = pathlib.Path(DATAPATH)
+        self.fullDBPath = pathlib.Path(
+            fullDBPath if fullDBPath is not None else self.DATAPATH / x4i3.dbPath)
+        self.fullIndexFileName = pathlib.Path(
+            fullIndexFileName if fullIndexFileName is not None
+            else self.DATAPATH / x4i3.indexFileName)
+        self.fullErrorFileName = self.DATAPATH / x4i3.errorFileName
+        self.fullCoupledFileName = self.DATAPATH / x4i3.coupledFileName
+        self.fullMonitoredFileName = self.DATAPATH / x4i3.monitoredFileName
+        self.fullReactionCountFileName = self.DATAPATH / x4i3.reactionCountFileName
+        self.fullPackFileName = self.DATAPATH / x4i3.packFileName
+        self.fullCompressedFileName = self.DATAPATH / x4i3.compressedFileName
+        self.storeType = store
+        self.__store = None
+        self.connectArgs = kw
+        self.__lock = threading.RLock()
+        self.__local = threading.local()
+        self.__connections = weakref.WeakSet()
+        self.cacheBytes = cacheBytes
+        self.__database_dict = None
+        self.entryCacheBytes = entryCacheBytes
+        self.__entryCache = None
+        self.queryCacheSize = queryCacheSize
+        self.queryCacheTTL = queryCacheTTL
+        self.__queryCache = None
+        self.__accessions = None
+        self.__tagFile = None
+        self.__indexColumns = None
+        if diskCache is True:
+            diskCache = x4i3.CACHEPATH / 'entries'
+        self.diskCache = None if diskCache is None else X4DiskCache(diskCache)
+
+    def __repr__(self):
+        return 'X4Database(' + repr(str(self.DATAPATH)) + ')'
+
+    def __reduce__(self):
+        '''Databases are passed to other processes by their options and opened again there'''
+        diskCache = None if self.diskCache is None else self.diskCache.directory
+        return (_openDatabase, (str(self.DATAPATH), str(self.fullDBPath), str(self.fullIndexFileName),
+                                self.storeType, self.cacheBytes, self.entryCacheBytes, diskCache,
+                                self.queryCacheSize, self.queryCacheTTL,
+                                tuple(sorted(self.connectArgs.items()))))
+
+    @property
+    def dbTagFile(self):
+        '''The tag file in DATAPATH, see x4i3._tag_files, or None if there is none. DATAPATH is
+        listed again only when its modification time changes, or if it changed recently.'''
+        try:
+            stamp = self.DATAPATH.stat().st_mtime_ns
+        except OSError:
+            stamp = None
+        tagFile = self.__tagFile
+        if stamp is not None and tagFile is not None and tagFile[0] == stamp:
+            return tagFile[1]
+        tags = x4i3._tag_files(self.DATAPATH)
+        # a directory modified in the last second may change again within the resolution of its time stamp
+        if stamp is not None and time.time_ns() - stamp < 10**9:
+            stamp = None
+        tagFile = (stamp, tags[0] if len(tags) > 0 else None)
+        self.__tagFile = tagFile
+        return tagFile[1]
+
+    @property
+    def tag(self):
+        '''Database version, taken from the name of the tag file'''
+        tagFile = self.dbTagFile
+        return None if tagFile is None else tagFile.name
+
+    def connect(self):
+        '''
+        Returns the connection to the SQLite index of the calling thread,
+        which is opened on first use and closed when the thread ends. Each
+        thread gets a connection of its own, so that a database and its
+        managers can be shared by threads.
+
+        A connection opened while no other thread holds one, usually that
+        of the thread that creates the managers, may write to the index
+        file, as the CONNECTION of the managers always could. The others
+        are read-only, unless the keyword arguments of the database select
+        another mode, so that the threads serving queries never take the
+        write lock of the file. The index file is not changed on
+        connecting, see upgradeIndex.
+        '''
+        local = getattr(self.__local, 'connection', None)
+        if local is None:
+            with self.__lock:
+                connection = self.openConnection(readOnly=len(self.__connections) > 0)
+                local = _ThreadConnection(connection)
+                weakref.finalize(local, connection.close)
+                self.__local.connection = local
+                self.__connections.add(local)
+        return local.connection
+
+    @property
+    def CONNECTION(self):
+        '''The connection to the index of the calling thread, see connect'''
+        return self.connect()
+
+    def openConnection(self, readOnly=False):
+        '''
+        Opens a new connection to the index. Read-only connections use the
+        mode=ro URI of SQLite. The connections may be closed by any thread
+        (check_same_thread=False), but must be used by one at a time.
+        '''
+        import sqlite3
+        kw = dict(self.connectArgs)
+        kw.setdefault('check_same_thread', False)
+        if readOnly and not kw.get('uri', False):
+            kw['uri'] = True
+            return sqlite3.connect(self.fullIndexFileName.absolute().as_uri() + '?mode=ro', **kw)  # pylint: disable=no-member
+        return sqlite3.connect(self.fullIndexFileName, **kw)  # pylint: disable=no-member
+
+    def upgradeIndex(self):
+        '''
+        Adds the columns of the steps in COLUMNUPGRADES, the SQL indexes on
+        the columns used by the queries and their statistics, and the
+        full-text index of exfor_index.addBibText (if SQLite supports FTS5)
+        to the index file if they are missing. The new columns are filled
+        from the .x4 files, which takes minutes for a whole release, so this
+        is done when the database is installed and otherwise only when it
+        is called. Queries on missing columns raise IndexUpgradeError.
+
+        Returns True if the index file was up to date. Raises
+        IndexUpgradeError if it cannot be written, e.g. because it is
+        read-only or locked by another process.
+        '''
+        import sqlite3
+        connection = None
+        try:
+            # a connection of its own, since that of the calling thread may be read-only
+            connection = self.openConnection()
+            upgrades = [add for columns, add in COLUMNUPGRADES
+                        if not exfor_index.hasColumns(connection, 'theworks', columns)]
+            existing = set(row[0] for row in connection.execute(
+                "select name from sqlite_master where type = 'index'"))
+            missing = [c for c in INDEXEDCOLUMNS if 'theworks_' + c not in existing]
+            # the statistics of ANALYZE let SQLite choose between the indexes
+            # when a query constrains several columns
+            tables = set(row[0] for row in connection.execute(
+                "select name from sqlite_master where type = 'table'"))
+            hasStatistics = 'sqlite_stat1' in tables
+            hasBibText = 'x4bib' in tables or not exfor_index.hasFTS5(connection)
+            if len(upgrades) == 0 and len(missing) == 0 and hasStatistics and hasBibText:
+                return True
+            with connection:
+                if not connection.in_transaction:
+                    connection.execute('begin')
+                for add in upgrades:
+                    add(connection, self)
+                if not hasBibText:
+                    exfor_index.addBibText(connection, self)
+                for c in missing:
+                    connection.execute(
+                        'create index if not exists theworks_%s on theworks (%s)' % (c, c))
+                connection.execute('analyze theworks')
+        except sqlite3.OperationalError as e:
+            raise IndexUpgradeError('Cannot upgrade ' + str(self.fullIndexFileName) + ': ' + str(e))
+        finally:
+            if connection is not None:
+                connection.close()
+            self.__indexColumns = None
+        return False
+
+    @property
+    def indexColumns(self):
+        '''The tables of the index file and their columns, {table: set of columns}, read on first use'''
+        indexColumns = self.__indexColumns
+        if indexColumns is None:
+            connection = self.connect()
+            indexColumns = {}
+            for (table,) in connection.execute("select name from sqlite_master where type = 'table'"):
+                indexColumns[table] = set(row[1] for row in connection.execute(
+                    'pragma table_info("' + table.replace('"', '""') + '")'))
+            self.__indexColumns = indexColumns
+        return indexColumns
+
+    def checkIndex(self, table, columns=()):
+        '''Raises IndexUpgradeError if the index file has no table or no column of columns in it'''
+        known = self.indexColumns.get(table)
+        if known is None:
+            raise IndexUpgradeError(str(self.fullIndexFileName) + ' has no table ' + table
+                                    + ', add it with X4Database.upgradeIndex()')
+        missing = [c for c in columns if c not in known]
+        if len(missing) > 0:
+            raise IndexUpgradeError(str(self.fullIndexFileName) + ' has no column ' + ', '.join(missing)
+                                    + ' in ' + table + ', add it with X4Database.upgradeIndex()')
+
+    def close(self):
+        '''Closes the connections of all threads and the store'''
+        with self.__lock:
+            for local in list(self.__connections):
+                local.connection.close()
+            self.__connections = weakref.WeakSet()
+            self.__local = threading.local()
+            if self.__store is not None:
+                self.__database_dict = None
+                self.__store.close()
+                self.__store = None
+
+    @property
+    def store(self):
+        '''Storage backend of the .x4 files, which is opened on first use'''
+        with self.__lock:
+            if self.__store is None:
+                self.__store = self.__openStore()
+        return self.__store
+
+    def __openStore(self):
+        if self.storeType == 'files':
+            return X4FileSystemStore(self.fullDBPath)
+        elif self.storeType == 'packed':
+            return X4PackedStore(self.fullPackFileName)
+        elif self.storeType == 'compressed':
+            return X4CompressedStore(self.fullCompressedFileName)
+        elif isinstance(self.storeType, str):
+            raise ValueError('Unknown store ' + repr(self.storeType))
+        return self.storeType
+
+    def pack(self):
+        '''Builds the packed store in DATAPATH from the db/ tree'''
+        buildPackedStore(X4FileSystemStore(self.fullDBPath), self.fullPackFileName)
+
+    def compress(self, codec=None):
+        '''Builds the compressed store in DATAPATH from the db/ tree, see exfor_store.buildCompressedStore'''
+        buildCompressedStore(X4FileSystemStore(self.fullDBPath), self.fullCompressedFileName, codec)
+
+    def update(self, source, tag=None, workers=None):
+        '''Adds or replaces the ENTRYs of a transmission file or a directory of .x4 files in the
+        stores and the index and bumps the tag, see exfor_updater.updateDatabase'''
+        from .exfor_updater import updateDatabase
+        return updateDatabase(self, source, tag, workers)
+
+    def clearCaches(self):
+        '''Empties the in-memory caches of .x4 files, parsed entries and query results, the accession
+        numbers and the columns of the index'''
+        with self.__lock:
+            if self.__database_dict is not None:
+                self.__database_dict.clear()
+            if self.__entryCache is not None:
+                self.__entryCache.clear()
+            if self.__queryCache is not None:
+                self.__queryCache.clear()
+            self.__accessions = None
+            self.__tagFile = None
+            self.__indexColumns = None
+
+    def buildIndex(self, workers=None, full=False):
+        '''Builds or updates the index file and the pickled summaries from the .x4 files of the
+        store, parsing only the files that changed, see exfor_indexer.buildIndex'''
+        from .exfor_indexer import buildIndex
+        report = buildIndex(self, workers, full)
+        self.clearCaches()
+        return report
+
+    def entryStamp(self, enum):
+        '''Changes when the tag file or the .x4 file of ENTRY enum changes'''
+        tagFile = self.dbTagFile
+        tagStamp = None if tagFile is None else (tagFile.name, tagFile.stat().st_mtime_ns)
+        return (tagStamp, self.store.stamp(enum))
+
+    def entryFileName(self, enum):
+        return os.path.join(self.fullDBPath, enum[:3], enum + '.x4')
+
+    def readEntry(self, enum):
+        '''Returns the lines of the .x4 file of ENTRY enum'''
+        return decodeEntry(self.store.read(enum))
+
+    @property
+    def database_dict(self):
+        '''In-memory cache of the .x4 files, see x4i3.DataBaseCache'''
+        with self.__lock:
+            if self.__database_dict is None:
+                self.__database_dict = x4i3.DataBaseCache(self.fullDBPath, self.cacheBytes, self.store)
+        return self.__database_dict
+
+    @property
+    def accessions(self):
+        '''
+        The ENTRY and SUBENT accession numbers of the index as an
+        exfor_index.X4AccessionSet, which is read on first use and read again
+        when the tag changes, like the results of queryCache
+        '''
+        tag = self.tag
+        accessions = self.__accessions
+        if accessions is None or accessions[0] != tag:
+            with self.__lock:
+                accessions = self.__accessions
+                if accessions is None or accessions[0] != tag:
+                    accessions = (tag, exfor_index.X4AccessionSet.fromIndex(self.connect()))
+                    self.__accessions = accessions
+        return accessions[1]
+
+    @property
+    def entryCache(self):
+        '''
+        Cache of parsed entries of the managers, keyed by (tag, ENTRY, SUBENTs).
+        The entries are kept pickled, so that every lookup returns a new copy
+        and the size of the cache is known exactly.
+        '''
+        with self.__lock:
+            if self.__entryCache is None:
+                self.__entryCache = X4LRUCache(self.entryCacheBytes)
+        return self.__entryCache
+
+    @property
+    def queryCache(self):
+        '''
+        Cache of the results of the queries of the managers, keyed by the tag
+        and the normalized criteria of exfor_manager.X4DBManagerPlainFS.queryCriteria,
+        so that a new tag invalidates all results. Its size is counted in results.
+        '''
+        with self.__lock:
+            if self.__queryCache is None:
+                self.__queryCache = X4LRUCache(self.queryCacheSize, lambda result: 1, self.queryCacheTTL)
+        return self.__queryCache
+
+
+# Databases opened by path, so that managers created with the same paths
+# share the database and its caches
+_databases = {}
+
+# Databases unpickled in this process, see X4Database.__reduce__
+_opened = {}
+
+
+def _openDatabase(*options):
+    if options not in _opened:
+        _opened[options] = X4Database(*options[:-1], **dict(options[-1]))
+    return _opened[options]
+
+
+def getDatabase(DATAPATH=None, fullDBPath=None, fullIndexFileName=None, store='files', **kw):
+    """
+    Returns the shared X4Database for the given paths. Without DATAPATH,
+    the paths that are not given are taken from the default database, which
+    is verified (and downloaded) with x4i3.check_database() in this case.
+    """
+    if DATAPATH is None:
+        if fullDBPath is None or fullIndexFileName is None:
+            x4i3.check_database()
+            fullDBPath = x4i3.fullDBPath if fullDBPath is None else fullDBPath
+            fullIndexFileName = x4i3.fullIndexFileName if fullIndexFileName is None else fullIndexFileName
+        DATAPATH = pathlib.Path(fullIndexFileName).parent
+    key = (str(DATAPATH), str(fullDBPath), str(fullIndexFileName), store, tuple(sorted(kw.items())))
+    if key not in _databases:
+        _databases[key] = X4Database(DATAPATH, fullDBPath, fullIndexFileName, store, **kw)
+    return _databases[key]
@@ -27,13 +27,114 @@
 exfor_dicts module - Class and Methods for Server that gives look-up tables for abbreviations in EXFOR files
 """
 
+import marshal
 import os
-from . import __path__
+import sys
+import tempfile
+from . import __path__, CACHEPATH
+
+# Parsed dictionaries are memoized for the lifetime of the process and
+# persisted in a single marshal file, so that a new process does not need
+# to parse the dictNN.txt files again.  Both are keyed on the file name and
+# validated against the modification time and the SHA-256 of the file.
+# The dictionaries are shared between all callers, so don't modify them.
+dictionaryCacheFile = os.path.join(str(CACHEPATH), 'x4dicts.marshal')
+_dictionaryMemo = {}
+_persistedDictionaries = None
+_CACHEVERSION = (1, marshal.version, sys.version_info[:2])
+
+
+def _fileKey(filename):
+    st = os.stat(filename)
+    return st.st_mtime_ns, st.st_size
+
+
+def _fileHash(filename):
+    import hashlib
+    with open(filename, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def _loadPersistedDictionaries():
+    global _persistedDictionaries
+    if _persistedDictionaries is None:
+        try:
+            with open(dictionaryCacheFile, 'rb') as f:
+                version, _persistedDictionaries = marshal.loads(f.read())
+            if version != _CACHEVERSION:
+                raise ValueError('Incompatible cache file')
+        except (OSError, EOFError, ValueError, TypeError):
+            _persistedDictionaries = {}
+    return _persistedDictionaries
+
+
+def _savePersistedDictionaries():
+    """Writes the cache file atomically through a temporary file of its own, so that
+    threads and processes saving at the same time do not mix their writes, and fails
+    silently if CACHEPATH is not writeable"""
+    tmpfile = None
+    try:
+        os.makedirs(os.path.dirname(dictionaryCacheFile), exist_ok=True)
+        fd, tmpfile = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(dictionaryCacheFile))
+        with os.fdopen(fd, 'wb') as f:
+            marshal.dump((_CACHEVERSION, _persistedDictionaries), f)
+        os.replace(tmpfile, dictionaryCacheFile)
+    except OSError:
+        if tmpfile is not None and os.path.exists(tmpfile):
+            os.remove(tmpfile)
+
+
+def _loadDictionary(filename, VERBOSELEVEL=0):
+    """
+    Returns the dictionary in filename from the memo, the cache file or by
+    parsing the file, in this order, and whether the cache file needs to be
+    updated
+    """
+    try:
+        key = _fileKey(filename)
+    except OSError:
+        if VERBOSELEVEL > 0:
+            print("Dictionary file " + filename + " not found")
+        return None, False
+    if filename in _dictionaryMemo and _dictionaryMemo[filename][0] == key:
+        return _dictionaryMemo[filename][1], False
+
+    persisted = _loadPersistedDictionaries()
+    changed = False
+    filehash = None
+    if filename in persisted and persisted[filename][0] == key:
+        d = persisted[filename][2]
+    else:
+        filehash = _fileHash(filename)
+        if filename in persisted and persisted[filename][1] == filehash:
+            d = persisted[filename][2]
+        else:
+            d = parseDictionary(filename, VERBOSELEVEL=VERBOSELEVEL)
+        persisted[filename] = (key, filehash, d)
+        changed = True
+    _dictionaryMemo[filename] = (key, d)
+    return d, changed
 
 # ---------- getDictionary ----------
 
 
 def getDictionary(filename, VERBOSELEVEL=0):
+    """
+    Retrieve the dictionary stored in filename, parsed with parseDictionary.
+    The result is cached (see dictionaryCacheFile) and must not be modified.
+    """
+    if not isinstance(filename, str):
+        raise TypeError(
+            'Variable filename is supposed to be a string, got a ' + str(type(filename)))
+    d, changed = _loadDictionary(filename, VERBOSELEVEL=VERBOSELEVEL)
+    if changed:
+        _savePersistedDictionaries()
+    return d
+
+# ---------- parseDictionary ----------
+
+
+def parseDictionary(filename, VERBOSELEVEL=0):
     if not isinstance(filename, str):
         raise TypeError(
             'Variable filename is supposed to be a string, got a ' + str(type(filename)))
@@ -195,8 +296,14 @@ class X4DictionaryServer:
         if VERBOSELEVEL > 1:
             print('Loading EXFOR Dictionaries:')
         dictmap = {}
+        anychanged = False
         for i in self.DictionaryNames:
-            tmp = self.getDictionary(i[0], VERBOSELEVEL=VERBOSELEVEL)
+            tmp, changed = _loadDictionary(
+                self.pathToDictionaryFiles + self.getDictionaryFilename(i[0]),
+                VERBOSELEVEL=VERBOSELEVEL)
+            anychanged = anychanged or changed
             if tmp is not None:
                 dictmap[i[1]] = tmp
+        if anychanged:
+            _savePersistedDictionaries()
         return dictmap
@@ -52,29 +52,15 @@ from x4i3 import exfor_dataset
 from x4i3 import exfor_exceptions
 import os
 from x4i3.exfor_utilities import COMMENTSTRING
-from x4i3 import DATAPATH, fullDBPath
+from x4i3 import DATAPATH, fullDBPath, check_database
 
 
-def x4EntryFactory(enum, subentsList=None, rawEntry=False, customDBPath=None):
+def splitX4Entry(entry, subentsList=None):
     '''
-    This function takes an EXFOR ENTRY number (enum), retrieves the corresponding file 
-    from disk, and constructs a valid X4Entry.  The rawEntry=True flag returns optionally 
-    just the unparsed list of SUBENTs, each as strings.
+    Splits the lines of an EXFOR ENTRY into SUBENTs, each as a string. Only the
+    SUBENTs in subentsList are kept, unless it is None.
     '''
-    if len(enum) != 5:
-        raise ValueError(
-            "A valid EXFOR ENTRY is a string with exactly 5 characters")
     result = []  # the entry, split into subentries
-
-    dbPath = fullDBPath if customDBPath is None else customDBPath
-    try:
-        with open(os.path.join(dbPath, enum[:3], enum + '.x4'),
-            mode='r', newline=None, encoding='latin1') as f:
-            entry = f.readlines()
-    except TypeError:
-        with open(os.path.join(dbPath, enum[:3], enum + '.x4'),
-            mode='rU') as f:
-            entry = f.readlines()
     subent = ''
     for line in entry:
         if line.startswith('ENTRY') or line.startswith('ENDENTRY') or line.startswith('NOSUBENT'):
@@ -87,38 +73,63 @@ def x4EntryFactory(enum, subentsList=None, rawEntry=False, customDBPath=None):
             if subentsList == None or subent[14:22].strip() in subentsList:
                 result.append(subent)
             subent = ''
+    return result
+
+
+def x4EntryFactory(enum, subentsList=None, rawEntry=False, customDBPath=None, database=None):
+    '''
+    This function takes an EXFOR ENTRY number (enum), retrieves the corresponding file 
+    from disk, and constructs a valid X4Entry.  The rawEntry=True flag returns optionally 
+    just the unparsed list of SUBENTs, each as strings.
+
+    The file is read from database (an exfor_database.X4Database), from the
+    db/ tree in customDBPath or from the default database, in this order.
+    '''
+    if len(enum) != 5:
+        raise ValueError(
+            "A valid EXFOR ENTRY is a string with exactly 5 characters")
+
+    if database is not None:
+        entry = database.readEntry(enum)
+    else:
+        if customDBPath is None:
+            check_database()
+            dbPath = fullDBPath
+        else:
+            dbPath = customDBPath
+        try:
+            with open(os.path.join(dbPath, enum[:3], enum + '.x4'),
+                mode='r', newline=None, encoding='latin1') as f:
+                entry = f.readlines()
+        except TypeError:
+            with open(os.path.join(dbPath, enum[:3], enum + '.x4'),
+                mode='rU') as f:
+                entry = f.readlines()
+    result = splitX4Entry(entry, subentsList)
     if rawEntry:
         return result
     return X4Entry(result)
 
 
-def x4DictionaryEntryFactory(enum, subentsList=None, rawEntry=False):
+def x4DictionaryEntryFactory(enum, subentsList=None, rawEntry=False, database=None):
     '''
     This function takes an EXFOR ENTRY number (enum), loads the compressed dictionary of
     x4 file contents, and constructs a valid X4Entry.  The rawEntry=True flag returns optionally 
-    just the unparsed list of SUBENTs, each as strings. Th
+    just the unparsed list of SUBENTs, each as strings. The dictionary of
+    database (an exfor_database.X4Database) is used if given.
     '''
     # global __database_dict
     from x4i3 import database_dict
+    if database is not None:
+        database_dict = database.database_dict
     if len(enum) != 5:
         raise ValueError(
             "A valid EXFOR ENTRY is a string with exactly 5 characters: ", enum, len(enum))
-    result = []  # the entry, split into subentries
 
     #entry = open( os.sep.join( [ DATAPATH, 'db', enum[:3], enum + '.x4' ] ), mode = 'rU' ).readlines()
-    entry = database_dict[enum[:3] + '/' + enum + '.x4']
-    subent = ''
-    for line in entry:
-        if line.startswith('ENTRY') or line.startswith('ENDENTRY') or line.startswith('NOSUBENT'):
-            pass
-        elif line.startswith('SUBENT'):
-            subent = line
-        else:
-            subent += line
-        if line.startswith('ENDSUBENT'):
-            if subentsList == None or subent[14:22].strip() in subentsList:
-                result.append(subent)
-            subent = ''
+    entry = [line.decode('latin1').replace('\r\n', '\n')
+             for line in database_dict[enum[:3] + '/' + enum + '.x4']]
+    result = splitX4Entry(entry, subentsList)
     if rawEntry:
         return result
     return X4Entry(result)
@@ -198,3 +198,50 @@ class NoHopeForUncertaintyError(DataSectionParsingError):
 class NoValuesGivenError(DataSectionParsingError):
     def __init__(self, value=''):
         self.value = 'No value column for ' + repr(value)
+
+
+# -------------------------------------------
+#
+# DatabaseInstallError
+#
+# -------------------------------------------
+class DatabaseInstallError(Exception):
+    """Raise this when the database archive can't be downloaded, verified or unpacked"""
+
+    def __init__(self, value=''):
+        self.value = value
+
+    def __str__(self):
+        return repr(self.value)
+
+
+# -------------------------------------------
+#
+# IndexUpgradeError
+#
+# -------------------------------------------
+class IndexUpgradeError(Exception):
+    """Raise this when the index file lacks a table or column that a query needs,
+    or when X4Database.upgradeIndex can't add them"""
+
+    def __init__(self, value=''):
+        self.value = value
+
+    def __str__(self):
+        return str(self.value)
+
+
+# -------------------------------------------
+#
+# RetrievalError
+#
+# -------------------------------------------
+class RetrievalError(Exception):
+    """Raise this when an entry can't be read or parsed in a worker process;
+    value is the exfor_manager.X4RetrievalError record of the failure"""
+
+    def __init__(self, value=''):
+        self.value = value
+
+    def __str__(self):
+        return repr(self.value)
@@ -29,16 +29,17 @@ exfor_grammers module - Collection of pyparsing grammers for parsing Exfor objec
 __version__ = "0.0.1"
 __author__ = "David Brown <brown170@llnl.gov>"
 
+import re
 import sys
 
 if sys.version_info < (3, 0, 0):
     from .pyparsing2 import (Literal, Optional, Word, Combine, Group,
         delimitedList, alphanums, ZeroOrMore, Forward, restOfLine,
-        OneOrMore, nestedExpr, alphas, commaSeparatedList)
+        OneOrMore, nestedExpr, alphas, commaSeparatedList, Regex)
 else:
     from .pyparsing3 import (Literal, Optional, Word, Combine, Group,
         delimitedList, alphanums, ZeroOrMore, Forward, restOfLine,
-        OneOrMore, nestedExpr, alphas, commaSeparatedList)
+        OneOrMore, nestedExpr, alphas, commaSeparatedList, Regex)
 
 from .exfor_dicts import X4DictionaryServer
 
@@ -71,20 +72,73 @@ mathop_noshow = dashorplus ^ Literal(
 altmultop = mult | doubleslash | div | equals
 altaddop = plus | minus
 
+
+# ------------------------------------------------------
+# Longest match of a list of literal strings
+# ------------------------------------------------------
+def trieRegexPattern(words):
+    """
+    Builds a regular expression that matches the longest of the given words,
+    like an Or ('^') of Literals would.  The words are stored in a trie first,
+    so that common prefixes are only matched once, e.g. ['A', 'AB', 'AC']
+    becomes 'A(?:B|C)?'.
+    @type  words: iterable of strings
+    @param words: the literal strings to match
+    @rtype: string
+    @return: the regular expression pattern
+    """
+    trie = {}
+    for w in words:
+        node = trie
+        for c in w:
+            node = node.setdefault(c, {})
+        node[''] = None
+
+    def pattern(node):
+        alternatives = [re.escape(c) + pattern(node[c])
+                        for c in sorted(node) if c != '']
+        if not alternatives:
+            return ''
+        if len(alternatives) > 1 or '' in node:
+            result = '(?:' + '|'.join(alternatives) + ')'
+        else:
+            result = alternatives[0]
+        if '' in node:
+            # greedy, so that the longer words are tried first
+            result += '?'
+        return result
+
+    return pattern(trie)
+
+
+def x4LongestMatch(words, name=None):
+    """
+    A single precompiled pyparsing element that matches the longest of the
+    given words, see trieRegexPattern
+    """
+    words = list(words)
+    if '' in words:
+        raise ValueError('Cannot match an empty string')
+    result = Regex(trieRegexPattern(words))
+    if name is not None:
+        result.setName(name)
+    return result
+
+
 # ------------------------------------------------------
 # Define the grammer of an Exfor Reaction Field ...
 # ------------------------------------------------------
 x4isomer_modifier = Word('mMgGTL', max=1) + Optional(Word(nums))
 
-x4basicparticle = Optional(Literal(
-    'X')) + eval('^'.join(['Literal( \"' + x + '\" )' for x in list(X4DictionaryServer()["Particles"].keys())]))
+x4basicparticle = Optional(Literal('X')) + x4LongestMatch(
+    X4DictionaryServer()["Particles"].keys(), name='x4basicparticle')
 x4particle = Combine(Word(alphas) + Optional(Word(nums)))
 x4element = Word(capsStar, alphas, min=1, max=2) ^ Literal(
     "PI") ^ Literal("K0") ^ Literal("PIM") ^ Literal("PIP") ^ Literal("P0")
 x4nucleus = Word(nums) + dash + x4element + dash + Word(nums) + \
     ZeroOrMore(mathop + x4isomer_modifier)
-x4chemical_compound = eval(
-    '^'.join(['Literal( \"' + x + '\" )' for x in list(X4DictionaryServer()["Compounds"].keys())]))
+x4chemical_compound = x4LongestMatch(
+    X4DictionaryServer()["Compounds"].keys(), name='x4chemical_compound')
 
 x4projectile = Group(x4nucleus) ^ x4particle ^ Literal('0')
 x4target = Group(x4chemical_compound | x4nucleus) ^ Literal(
@@ -0,0 +1,508 @@
+# Copyright (c) 2020, Anatoli Fedynitch <afedynitch@gmail.com>
+
+# This file is part of the fork (x4i3) of the EXFOR Interface (x4i)
+
+# Please read the LICENCE.txt included in this distribution including "Our [LLNL's]
+# Notice and the GNU General Public License", which applies also to this fork.
+
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License (as published by the
+# Free Software Foundation) version 2, dated June 1991.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the IMPLIED WARRANTY OF
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# terms and conditions of the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+
+# module exfor_index.py
+"""
+exfor_index module - Extensions of the SQLite index of the database, in
+particular the mapping of EXFOR reactions to ENDF MF/MT numbers, the
+full-text index of the BIB sections and the set of accession numbers
+"""
+
+import array
+import bisect
+import math
+import re
+
+from . import exfor_column_parsing
+from .exfor_exceptions import BrokenNumberError, IsomerMathParsingError, ParticleParsingError
+from .exfor_utilities import parseFORTRANNumber
+
+# Outgoing particles of EXFOR reaction codes (SF3) and their ENDF MT numbers,
+# as defined in the ENDF-6 formats manual for a projectile z, e.g. (z,2n)
+ENDFMT = {
+    (('N', 1),): 4,
+    (('D', 1), ('N', 2)): 11,
+    (('N', 2),): 16,
+    (('N', 3),): 17,
+    (('A', 1), ('N', 1)): 22,
+    (('A', 3), ('N', 1)): 23,
+    (('A', 1), ('N', 2)): 24,
+    (('A', 1), ('N', 3)): 25,
+    (('N', 1), ('P', 1)): 28,
+    (('A', 2), ('N', 1)): 29,
+    (('A', 2), ('N', 2)): 30,
+    (('D', 1), ('N', 1)): 32,
+    (('N', 1), ('T', 1)): 33,
+    (('HE3', 1), ('N', 1)): 34,
+    (('A', 2), ('D', 1), ('N', 1)): 35,
+    (('A', 2), ('N', 1), ('T', 1)): 36,
+    (('N', 4),): 37,
+    (('N', 2), ('P', 1)): 41,
+    (('N', 3), ('P', 1)): 42,
+    (('N', 1), ('P', 2)): 44,
+    (('A', 1), ('N', 1), ('P', 1)): 45,
+    (('G', 1),): 102,
+    (('P', 1),): 103,
+    (('D', 1),): 104,
+    (('T', 1),): 105,
+    (('HE3', 1),): 106,
+    (('A', 1),): 107,
+    (('A', 2),): 108,
+    (('A', 3),): 109,
+    (('P', 2),): 111,
+    (('A', 1), ('P', 1)): 112,
+    (('A', 2), ('T', 1)): 113,
+    (('A', 2), ('D', 1)): 114,
+    (('D', 1), ('P', 1)): 115,
+    (('P', 1), ('T', 1)): 116,
+    (('A', 1), ('D', 1)): 117,
+}
+
+# Columns of theworks added by addReactionColumns
+REACTIONCOLUMNS = ['product', 'MF', 'MT']
+
+# EXFOR reaction codes (SF3) that are not lists of outgoing particles
+ENDFMTPROCESS = {'TOT': 1, 'EL': 2, 'NON': 3, 'X': 5, 'F': 18, 'ABS': 27}
+
+# ENDF MF numbers of EXFOR quantities (SF6)
+ENDFMF = {'SIG': 3, 'DA': 4, 'DE': 5, 'DA/DE': 6}
+
+_PARTICLE = re.compile(r'^(\d*)(N|P|D|T|HE3|A|G)$')
+
+# A reaction without combinations: (target(projectile,process)product,SF5,SF6...
+_REACTION = re.compile(r'([^(),\s]+)\(([^(),]+),([^(),]+)\)([^(),]*),')
+
+
+def endfMT(projectile, process):
+    '''
+    ENDF MT number of the EXFOR reaction (projectile,process), e.g.
+    endfMT('N', '2N') == 16, or None if there is none
+    '''
+    if process in ENDFMTPROCESS:
+        return ENDFMTPROCESS[process]
+    if process == 'INL':
+        process = projectile
+    counts = {}
+    for particle in process.split('+'):
+        m = _PARTICLE.match(particle)
+        if m is None:
+            return None
+        counts[m.group(2)] = counts.get(m.group(2), 0) + int(m.group(1) or 1)
+    return ENDFMT.get(tuple(sorted(counts.items())))
+
+
+def endfMFMT(projectile, process, quantity):
+    '''
+    ENDF (MF, MT) of an EXFOR reaction with quantity SF6, e.g. ('N', '2N',
+    'SIG') gives (3, 16). Both are None if there is no ENDF equivalent; MT
+    is given without MF for quantities that ENDF does not tabulate.
+    '''
+    if process == 'F' and quantity == 'NU':
+        return 1, 452
+    MT = endfMT(projectile, process)
+    if MT is None:
+        return None, None
+    return ENDFMF.get(quantity), MT
+
+
+def stripZ(nuclide):
+    '''Drops Z from an EXFOR nuclide, 26-FE-56 becomes FE-56 as in the index'''
+    parts = nuclide.split('-', 1)
+    if len(parts) == 2 and parts[0].isdigit():
+        return parts[1]
+    return nuclide
+
+
+def reactionFields(lines):
+    '''
+    Returns the REACTION fields of the lines of an ENTRY as
+    { SUBENT:{ pointer:text } }
+    '''
+    result = {}
+    subent = None
+    field = None
+    for line in lines:
+        tag = line[0:10].strip()
+        if line.startswith('SUBENT'):
+            subent = line[14:22].strip()
+        elif tag == 'REACTION':
+            field = result.setdefault(subent, {})
+            pointer = line[10] if line[10:11] not in ('', ' ') else ' '
+            field[pointer] = line[11:66].rstrip()
+            continue
+        elif field is not None and tag == '':
+            if line[10:11] not in ('', ' '):
+                pointer = line[10]
+                field[pointer] = line[11:66].rstrip()
+            else:
+                field[pointer] += ' ' + line[11:66].strip()
+            continue
+        field = None
+    return result
+
+
+def simpleReactions(text):
+    '''
+    The simple reactions in the text of a REACTION field as tuples
+    (target, projectile, process, product) without the Z of the nuclides
+    '''
+    return [(stripZ(m.group(1)), m.group(2), m.group(3), stripZ(m.group(4)))
+            for m in _REACTION.finditer(text)]
+
+
+def indexProcess(reaction):
+    '''
+    The process (SF3) and product (SF4) in the reaction column of the index,
+    which appends the product to some processes, e.g. N,X+2-HE-4
+    '''
+    process = reaction.split(',', 1)[-1]
+    head, sep, tail = process.partition('+')
+    if sep and ('-' in tail or '/' in tail or head in ENDFMTPROCESS):
+        return head, stripZ(tail)
+    return process, None
+
+
+def rowProcess(text, target, reaction):
+    '''
+    The process (SF3) and product (SF4) of a row of the index with target
+    and reaction, taken from the text of its REACTION field if it has a
+    matching simple reaction, or else from the reaction column
+    '''
+    process, product = indexProcess(reaction)
+    best = ''
+    for t, p, sf3, sf4 in simpleReactions(text):
+        code = p + ',' + sf3
+        if t == target and reaction.startswith(code) and len(code) > len(best):
+            best, process, product = code, sf3, sf4 or None
+    return process, product
+
+
+def hasColumns(connection, table, columns):
+    existing = set(row[1] for row in connection.execute('pragma table_info(%s)' % table))
+    return all(c in existing for c in columns)
+
+
+def addReactionColumns(connection, db):
+    '''
+    Adds the columns product, MF and MT to the theworks table and the ENDF
+    mapping table x4endf. The process and product are taken from the
+    REACTION fields of the .x4 files of db; for entries without file they
+    are taken from the reaction column. Run it in a transaction.
+    '''
+    connection.execute('alter table theworks add column product text')
+    connection.execute('alter table theworks add column MF integer')
+    connection.execute('alter table theworks add column MT integer')
+    connection.execute('create table if not exists x4endf '
+                       '(projectile text, process text, quantity text, MF integer, MT integer)')
+    mapping = {}
+    updates = []
+    entries = [row[0] for row in connection.execute('select distinct entry from theworks')]
+    for enum in entries:
+        try:
+            fields = reactionFields(db.readEntry(enum))
+        except (KeyError, IOError):
+            fields = {}
+        rows = connection.execute(
+            'select rowid, subent, pointer, target, reaction, projectile, quantity '
+            'from theworks where entry = ?', (enum,)).fetchall()
+        for rowid, subent, pointer, target, reaction, projectile, quantity in rows:
+            field = fields.get(subent) or fields.get(enum + '001') or {}
+            process, product = rowProcess(field.get(pointer or ' ', ''), target, reaction)
+            key = (projectile, process, quantity)
+            if key not in mapping:
+                mapping[key] = endfMFMT(projectile, process, quantity)
+            updates.append((product,) + mapping[key] + (rowid,))
+    connection.executemany('update theworks set product = ?, MF = ?, MT = ? where rowid = ?', updates)
+    connection.executemany('insert into x4endf values (?, ?, ?, ?, ?)',
+                           [k + v for k, v in sorted(mapping.items(), key=str) if v[1] is not None])
+
+
+# BIB keywords of the full-text index and the columns of table x4bib
+BIBTEXTFIELDS = ['TITLE', 'FACILITY', 'DETECTOR', 'METHOD', 'ERR-ANALYS']
+BIBTEXTCOLUMNS = [k.lower().replace('-', '_') for k in BIBTEXTFIELDS]
+
+
+def bibFields(lines, keywords=BIBTEXTFIELDS):
+    '''
+    Returns the text of the BIB fields with the given keywords of the lines
+    of an ENTRY as { SUBENT:{ keyword:text } }
+    '''
+    result = {}
+    subent = None
+    keyword = None
+    inBib = False
+    for line in lines:
+        tag = line[0:10].strip()
+        if line.startswith('SUBENT'):
+            subent = line[14:22].strip()
+        elif tag == 'BIB':
+            inBib = True
+        elif tag == 'ENDBIB':
+            inBib = False
+        elif inBib and tag in keywords:
+            keyword = tag
+            field = result.setdefault(subent, {})
+            text = line[10:66].strip()
+            field[keyword] = field[keyword] + ' ' + text if keyword in field else text
+            continue
+        elif inBib and keyword is not None and tag == '':
+            result[subent][keyword] += ' ' + line[10:66].strip()
+            continue
+        keyword = None
+    return result
+
+
+def hasFTS5(connection):
+    '''Whether SQLite was built with the full-text search extension FTS5'''
+    import sqlite3
+    try:
+        connection.execute('create virtual table temp.x4fts5check using fts5(text)')
+    except sqlite3.OperationalError:
+        return False
+    connection.execute('drop table temp.x4fts5check')
+    return True
+
+
+def addBibText(connection, db):
+    '''
+    Creates the FTS5 table x4bib with the BIB fields BIBTEXTFIELDS of every
+    SUBENT of the .x4 files of db, one row per SUBENT with the columns entry,
+    subent and BIBTEXTCOLUMNS. Run it in a transaction.
+    '''
+    connection.execute('create virtual table x4bib using fts5(entry unindexed, subent unindexed, '
+                       + ', '.join(BIBTEXTCOLUMNS) + ')')
+    rows = []
+    entries = [row[0] for row in connection.execute('select distinct entry from theworks')]
+    for enum in entries:
+        try:
+            fields = bibFields(db.readEntry(enum))
+        except (KeyError, IOError):
+            continue
+        for subent in sorted(fields):
+            rows.append((enum, subent) + tuple(fields[subent].get(k) for k in BIBTEXTFIELDS))
+    connection.executemany('insert into x4bib values (' + ', '.join('?' * (2 + len(BIBTEXTFIELDS))) + ')', rows)
+
+
+# Columns of theworks added by addRangeColumns: the ranges of the incident
+# energy (EN) and outgoing energy (E) in MeV and of the angle (ANG) in degrees
+RANGECOLUMNS = ['enmin', 'enmax', 'emin', 'emax', 'angmin', 'angmax']
+
+# Labels of the COMMON and DATA columns that contribute to the ranges, as in
+# the parser lists of exfor_column_parsing
+RANGELABELS = {
+    'en': ['EN' + s for s in exfor_column_parsing.variableSuffix] + ['EN-MIN', 'EN-MAX'],
+    'e': ['E' + s for s in exfor_column_parsing.variableSuffix] + ['E-MIN', 'E-MAX'],
+    'ang': [b + s for b in exfor_column_parsing.baseAngleKeys
+            for s in exfor_column_parsing.variableSuffix + exfor_column_parsing.frameSuffix],
+}
+RANGEUNITS = {
+    'en': 'MeV',
+    'e': 'MeV',
+    'ang': 'degrees',
+}
+
+
+def _tableFields(lines):
+    '''The 11 character fields of the lines of a COMMON or DATA section'''
+    return [line[i:i + 11] for line in lines for i in range(0, 66, 11)]
+
+
+def _rangeValue(label, unit, field):
+    '''The value of a COMMON or DATA field in the units of RANGEUNITS as (quantity, value)'''
+    for quantity, labels in RANGELABELS.items():
+        if label in labels:
+            break
+    else:
+        return None, None
+    try:
+        value = parseFORTRANNumber(field)
+    except BrokenNumberError:
+        return None, None
+    if value is None:
+        return None, None
+    if quantity == 'ang' and label.startswith('COS'):
+        if abs(value) > 1.0:
+            return None, None
+        return quantity, math.degrees(math.acos(value))
+    factor, canonical = exfor_column_parsing.X4ColumnParser().getConversion(unit)
+    if canonical != RANGEUNITS[quantity]:
+        return None, None
+    return quantity, value * factor
+
+
+def dataRanges(lines):
+    '''
+    Returns the ranges of the incident energy, the outgoing energy and the
+    angle in the COMMON and DATA sections of the lines of an ENTRY as
+    { SUBENT:{ quantity:(min, max) } }, with the quantities 'en', 'e' and
+    'ang' of RANGELABELS. The COMMON section of the documentation subentry
+    applies to all SUBENTs.
+    '''
+    result = {}
+    subent = None
+    section = None
+    for line in lines:
+        tag = line[0:10].strip()
+        if section is None:
+            if line.startswith('SUBENT'):
+                subent = line[14:22].strip()
+            elif tag in ('COMMON', 'DATA'):
+                section = (int(line[11:22]), [])
+        elif tag in ('ENDCOMMON', 'ENDDATA'):
+            ncols, body = section
+            nlines = -(-ncols // 6)
+            fields = _tableFields(body)
+            rowLength = 6 * nlines
+            labels = [f[0:10].strip() for f in fields[0:rowLength]][0:ncols]
+            units = [f.strip() for f in fields[rowLength:2 * rowLength]][0:ncols]
+            ranges = result.setdefault(subent, {})
+            for start in range(2 * rowLength, len(fields), rowLength):
+                for label, unit, field in zip(labels, units, fields[start:start + ncols]):
+                    quantity, value = _rangeValue(label, unit, field)
+                    if quantity is not None:
+                        low, high = ranges.get(quantity, (value, value))
+                        ranges[quantity] = (min(low, value), max(high, value))
+            section = None
+        else:
+            section[1].append(line.rstrip('\n'))
+    for subent in result:
+        common = result.get(subent[0:5] + '001', {})
+        for quantity, (low, high) in common.items():
+            if subent[5:] != '001':
+                low0, high0 = result[subent].get(quantity, (low, high))
+                result[subent][quantity] = (min(low, low0), max(high, high0))
+    return result
+
+
+def addRangeColumns(connection, db):
+    '''
+    Adds the columns RANGECOLUMNS to the theworks table, filled with the
+    ranges of dataRanges of the .x4 files of db, or NULL where a SUBENT has
+    no such column. Run it in a transaction.
+    '''
+    for column in RANGECOLUMNS:
+        connection.execute('alter table theworks add column %s real' % column)
+    updates = []
+    entries = [row[0] for row in connection.execute('select distinct entry from theworks')]
+    for enum in entries:
+        try:
+            ranges = dataRanges(db.readEntry(enum))
+        except (KeyError, IOError, ValueError):
+            continue
+        for subent in sorted(ranges):
+            values = []
+            for quantity in ['en', 'e', 'ang']:
+                values.extend(ranges[subent].get(quantity, (None, None)))
+            if any(v is not None for v in values):
+                updates.append(tuple(values) + (subent,))
+    connection.executemany('update theworks set ' + ', '.join(c + ' = ?' for c in RANGECOLUMNS)
+                           + ' where subent = ?', updates)
+
+
+# Columns of theworks added by addTargetColumns: charge and mass number of
+# the target (A = 0 for natural elements) and its isomeric state
+TARGETCOLUMNS = ['Z', 'A', 'isomer']
+
+
+def targetZAI(target):
+    '''
+    Decomposes a target of the index, e.g. U-238, 92-U-238 or HF-178-M2,
+    into (Z, A, isomer) with exfor_particle.X4Isomer. The isomer is 0 for
+    the ground state or if no state is given, n for the state Mn, and None
+    if several states are given; all three are None for targets that are
+    not nuclei, e.g. compounds.
+    '''
+    from .endl_Z import endl_SymbolZ
+    from .exfor_particle import X4Isomer
+    parts = target.split('-')
+    if not parts[0].isdigit():
+        Z = endl_SymbolZ(parts[0].capitalize())
+        if Z is None:
+            return None, None, None
+        target = str(Z) + '-' + target
+    try:
+        nucleus = X4Isomer(target, IgnoreIsomerMath=True)
+    except (ParticleParsingError, IsomerMathParsingError, ValueError):
+        return None, None, None
+    if len(nucleus.isomers) > 1:
+        return int(nucleus.Z), int(nucleus.A), None
+    return int(nucleus.Z), int(nucleus.A), int(nucleus.isomers[0]) if nucleus.isomers else 0
+
+
+def addTargetColumns(connection, db):
+    '''
+    Adds the columns TARGETCOLUMNS to the theworks table, filled from the
+    target column with targetZAI; the files of db are not needed. Run it in
+    a transaction.
+    '''
+    for column in TARGETCOLUMNS:
+        connection.execute('alter table theworks add column %s integer' % column)
+    targets = [row[0] for row in connection.execute('select distinct target from theworks')]
+    connection.executemany('update theworks set Z = ?, A = ?, isomer = ? where target = ?',
+                           [targetZAI(t) + (t,) for t in targets if t is not None])
+
+
+def accessionNumber(key):
+    '''
+    The integer of an ENTRY or SUBENT accession number, e.g. 10001 or
+    E0783002, read as a number in base 36, or None if it is not one
+    '''
+    if not isinstance(key, str):
+        key = str(key)
+    if len(key) not in (5, 8) or not key.isalnum() or not key.isascii():
+        return None
+    return int(key, 36)
+
+
+class X4AccessionSet:
+    """
+    The ENTRY and SUBENT accession numbers of an index, as two sorted arrays
+    of 64 bit integers (see accessionNumber), i.e. 8 bytes per SUBENT. The
+    operator in takes ints or strings of 5 (ENTRY) or 8 (SUBENT) characters
+    and finds them by bisection, in about a microsecond.
+    """
+
+    def __init__(self, entries=(), subents=()):
+        self.entries = array.array('q', sorted(set(map(accessionNumber, entries))))
+        self.subents = array.array('q', sorted(set(map(accessionNumber, subents))))
+
+    @classmethod
+    def fromIndex(cls, connection):
+        '''
+        The ENTRYs and SUBENTs of theworks, together with the documentation
+        SUBENT 001 of every ENTRY, which has no rows of its own
+        '''
+        entries = [row[0] for row in connection.execute('select distinct entry from theworks')]
+        subents = [row[0] for row in connection.execute('select distinct subent from theworks')]
+        return cls(entries, subents + [e + '001' for e in entries])
+
+    def __contains__(self, key):
+        number = accessionNumber(key)
+        if number is None:
+            return False
+        numbers = self.entries if len(str(key)) == 5 else self.subents
+        i = bisect.bisect_left(numbers, number)
+        return i < len(numbers) and numbers[i] == number
+
+    def __len__(self):
+        return len(self.entries) + len(self.subents)
+
+    def nbytes(self):
+        return (len(self.entries) + len(self.subents)) * self.entries.itemsize
@@ -0,0 +1,406 @@
+# Copyright (c) 2020, Anatoli Fedynitch <afedynitch@gmail.com>
+
+# This file is part of the fork (x4i3) of the EXFOR Interface (x4i)
+
+# Please read the LICENCE.txt included in this distribution including "Our [LLNL's]
+# Notice and the GNU General Public License", which applies also to this fork.
+
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License (as published by the
+# Free Software Foundation) version 2, dated June 1991.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the IMPLIED WARRANTY OF
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# terms and conditions of the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+
+# module exfor_indexer.py
+"""
+exfor_indexer module - Builds the SQLite index and the pickled reaction
+summaries of a database from its .x4 files, in parallel and incrementally
+"""
+
+import collections
+import hashlib
+import os
+import pickle
+import re
+
+from . import exfor_index
+from .exfor_database import INDEXEDCOLUMNS
+from .exfor_entry import X4Entry, splitX4Entry
+from .exfor_reactions import X4Reaction, x4QuantityMap
+from .exfor_store import decodeEntry, openTemporary
+
+# Columns of theworks and their types: those of the index files of the
+# database tarballs followed by the columns of exfor_database.COLUMNUPGRADES
+THEWORKS = ([(c, 'text') for c in ['entry', 'subent', 'pointer', 'author', 'reaction',
+                                   'projectile', 'target', 'quantity']]
+            + [('rxncombo', 'bool'), ('monitored', 'bool')]
+            + [(c, 'integer' if c in ('MF', 'MT') else 'text') for c in exfor_index.REACTIONCOLUMNS]
+            + [(c, 'real') for c in exfor_index.RANGECOLUMNS]
+            + [(c, 'integer') for c in exfor_index.TARGETCOLUMNS])
+
+# The quantities (SF6) of the EXFOR dictionary, which tell the quantity of a
+# reaction apart from the branch (SF5) and the modifiers that surround it
+QUANTITIES = set(k.split(',')[1] for k in x4QuantityMap if ',' in k)
+
+# File with the DOIs and NSR keys of the references in the database
+DOIFILENAME = 'x4doi.txt'
+
+_DOIFIELD = re.compile(r'\$(REF|ENTRY|NSR|DOI)=(\S*)')
+
+
+def reactionQuantity(reaction):
+    '''The quantity (SF6) of an exfor_reactions.X4Reaction, e.g. SIG for (...,CUM,SIG)'''
+    for q in reaction.quantity:
+        if q in QUANTITIES:
+            return q
+    return reaction.quantity[0] if reaction.quantity else None
+
+
+def reactionColumn(reaction):
+    '''The reaction column of the index of an X4Reaction, e.g. N,2N or N,F+ELEM/MASS'''
+    return (repr(reaction.proj) + ',' + '+'.join(map(repr, reaction.products))).replace("'", '').upper()
+
+
+def reactionKey(reaction):
+    '''
+    The key of an X4Reaction in the pickled summaries, e.g. ('PU-239(N,2N)', 'SIG'). As in the summaries
+    of the database tarballs, the residual is not part of the key, that of (5-B-10(N,A)3-LI-7,,SIG) is
+    ('B-10(N,A)', 'SIG')
+    '''
+    return (exfor_index.stripZ(repr(reaction.targ).upper()) + '(' + reactionColumn(reaction) + ')',
+            reactionQuantity(reaction))
+
+
+def indexEntry(enum, data):
+    '''
+    Parses the .x4 file of ENTRY enum with the contents data and returns
+    the rows for the index as a dictionary with the keys
+
+        - works: the rows of theworks, with the columns THEWORKS
+        - bib: the rows of x4bib (see exfor_index.addBibText)
+        - endf: the ENDF mapping { (projectile, process, quantity):(MF, MT) }
+        - summary: the contributions of the ENTRY to the pickled summaries
+
+    There is a row of theworks for every author and every reaction of the
+    REACTION fields, with rxncombo set for the reactions of combinations and
+    monitored for those with a MONITOR field. If the ENTRY cannot be parsed,
+    it has no rows and the error message is given in the summary.
+    '''
+    summary = {'error': None, 'coupled': {}, 'monitored': {}, 'reactions': collections.Counter()}
+    result = {'works': [], 'bib': [], 'endf': {}, 'summary': summary}
+    lines = decodeEntry(data)
+    try:
+        entry = X4Entry(splitX4Entry(lines))
+        fields = exfor_index.reactionFields(lines)
+        try:
+            ranges = exfor_index.dataRanges(lines)
+        except ValueError:
+            ranges = {}
+        first = entry[enum + '001'].get('BIB', {}) if enum + '001' in entry else {}
+        for subent in sorted(entry):
+            bib = entry[subent].get('BIB', {})
+            if 'REACTION' not in bib:
+                continue
+            authors = bib.get('AUTHOR') or first.get('AUTHOR')
+            authors = (authors.author_family_names if authors is not None else []) or [None]
+            monitors = bib.get('MONITOR') or first.get('MONITOR')
+            field = fields.get(subent) or fields.get(enum + '001') or {}
+            values = []
+            for quantity in ['en', 'e', 'ang']:
+                values.extend(ranges.get(subent, {}).get(quantity, (None, None)))
+            for pointer in bib['REACTION'].reactions:
+                key = (enum, subent, pointer)
+                combination = not isinstance(bib['REACTION'].reactions[pointer][0], X4Reaction)
+                monitored = monitors is not None and pointer in monitors.reactions
+                reactions = bib['REACTION'].getX4ReactionList(pointer)
+                if combination:
+                    summary['coupled'][key] = [reactionKey(r) for r in reactions]
+                if monitored:
+                    summary['monitored'][key] = [reactionKey(m[0]) for m in monitors.reactions[pointer]
+                                                 if isinstance(m[0], X4Reaction)]
+                    summary['reactions'].update(summary['monitored'][key])
+                    summary['monitored'][key] += [reactionKey(r) for r in reactions]
+                for r in reactions:
+                    summary['reactions'][reactionKey(r)] += 1
+                    target = exfor_index.stripZ(repr(r.targ).upper())
+                    projectile = repr(r.proj).replace("'", '').upper()
+                    reaction = reactionColumn(r)
+                    quantity = reactionQuantity(r)
+                    process, product = exfor_index.rowProcess(field.get(pointer, ''), target, reaction)
+                    MF, MT = exfor_index.endfMFMT(projectile, process, quantity)
+                    if MT is not None:
+                        result['endf'][(projectile, process, quantity)] = (MF, MT)
+                    row = ((enum, subent, pointer, None, reaction, projectile, target, quantity,
+                            combination, monitored, product, MF, MT) + tuple(values)
+                           + exfor_index.targetZAI(target))
+                    result['works'].extend(row[:3] + (a,) + row[4:] for a in authors)
+        fields = exfor_index.bibFields(lines)
+        result['bib'] = [(enum, subent) + tuple(fields[subent].get(k) for k in exfor_index.BIBTEXTFIELDS)
+                         for subent in sorted(fields)]
+    except Exception as err:
+        summary['error'] = type(err).__name__ + ': ' + str(err)
+        result['works'], result['bib'], result['endf'] = [], [], {}
+        summary['coupled'], summary['monitored'], summary['reactions'] = {}, {}, collections.Counter()
+    return result
+
+
+def _indexChunk(db, enums):
+    '''Indexes the ENTRYs enums of db; also runs in the worker processes of buildIndex'''
+    result = []
+    for enum in enums:
+        # a copy, since the parsers may keep the frames of indexEntry alive, which must
+        # not hold on to the memoryviews of a packed store
+        data = bytes(db.store.read(enum))
+        result.append((enum, hashlib.sha256(data).hexdigest(), indexEntry(enum, data)))
+    return result
+
+
+def createTables(connection, fullText=True):
+    '''Creates the tables of the index that do not exist, x4bib only with fullText'''
+    connection.execute('create table if not exists theworks ('
+                       + ', '.join(c + ' ' + t for c, t in THEWORKS) + ')')
+    connection.execute('create table if not exists doiXref (entry text, nsr text, doi text, reference text )')
+    connection.execute('create table if not exists x4endf '
+                       '(projectile text, process text, quantity text, MF integer, MT integer)')
+    connection.execute('create table if not exists x4files (entry text primary key, sha256 text, summary blob)')
+    if fullText:
+        connection.execute('create virtual table if not exists x4bib using fts5(entry unindexed, '
+                           'subent unindexed, ' + ', '.join(exfor_index.BIBTEXTCOLUMNS) + ')')
+
+
+def readDOIs(fileName):
+    '''The rows of doiXref (entry, nsr, doi, reference) in the file x4doi.txt of the IAEA'''
+    rows = []
+    with open(fileName, encoding='latin1') as f:
+        for line in f:
+            fields = dict(_DOIFIELD.findall(line))
+            if 'ENTRY' in fields:
+                rows.append((fields['ENTRY'], fields.get('NSR'), fields.get('DOI'), fields.get('REF')))
+    return rows
+
+
+def _writePickle(obj, fileName):
+    '''Replaces fileName with the pickled obj at once, so that readers never see a partial file'''
+    f, tmpFileName = openTemporary(fileName)
+    try:
+        with f:
+            pickle.dump(obj, f)
+        os.replace(tmpFileName, fileName)
+    except BaseException:
+        os.remove(tmpFileName)
+        raise
+
+
+def writeSummaries(connection, db):
+    '''
+    Writes the pickled summaries of db, error-entries.pickle ({ ENTRY:message }),
+    coupled-entries.pickle and monitored-entries.pickle ({ (ENTRY, SUBENT,
+    pointer):[ (reaction, quantity), ... ] }) and reaction-count.pickle
+    ({ (reaction, quantity):count }), from the table x4files of the index
+    '''
+    errors, coupled, monitored, reactions = {}, {}, {}, collections.Counter()
+    for enum, blob in connection.execute('select entry, summary from x4files order by entry'):
+        summary = pickle.loads(blob)
+        if summary['error'] is not None:
+            errors[enum] = summary['error']
+        coupled.update(summary['coupled'])
+        monitored.update(summary['monitored'])
+        reactions.update(summary['reactions'])
+    _writeSummaries(db, errors, coupled, monitored, reactions)
+
+
+def updateSummaries(db, old, new):
+    '''
+    Updates the pickled summaries of db (see writeSummaries) in place, for
+    an index whose table x4files has not got all ENTRYs: the contributions
+    old { ENTRY:summary } of the replaced and removed ENTRYs are taken out
+    and those of the new ENTRYs new { ENTRY:summary } (see indexEntry) are
+    added
+    '''
+    summaries = []
+    for fileName in [db.fullErrorFileName, db.fullCoupledFileName, db.fullMonitoredFileName,
+                     db.fullReactionCountFileName]:
+        try:
+            with open(fileName, 'rb') as f:
+                summaries.append(pickle.load(f))
+        except FileNotFoundError:
+            summaries.append({})
+    errors, coupled, monitored, reactions = summaries
+    reactions = collections.Counter(reactions)
+    enums = set(old) | set(new)
+    for enum in enums:
+        errors.pop(enum, None)
+    coupled = {k: v for k, v in coupled.items() if k[0] not in enums}
+    monitored = {k: v for k, v in monitored.items() if k[0] not in enums}
+    for summary in old.values():
+        reactions.subtract(summary['reactions'])
+    for enum, summary in new.items():
+        if summary['error'] is not None:
+            errors[enum] = summary['error']
+        coupled.update(summary['coupled'])
+        monitored.update(summary['monitored'])
+        reactions.update(summary['reactions'])
+    _writeSummaries(db, errors, coupled, monitored, +reactions)
+
+
+def _writeSummaries(db, errors, coupled, monitored, reactions):
+    _writePickle(errors, db.fullErrorFileName)
+    _writePickle(coupled, db.fullCoupledFileName)
+    _writePickle(monitored, db.fullMonitoredFileName)
+    _writePickle(dict(reactions), db.fullReactionCountFileName)
+
+
+def buildIndex(db, workers=None, full=False, chunksize=None):
+    '''
+    Builds or updates the index file and the pickled summaries of db (an
+    exfor_database.X4Database) from the .x4 files of its store.
+
+    The SHA-256 of every .x4 file is kept in the table x4files of the index,
+    so that only new and changed files are parsed again; the rows of ENTRYs
+    that were removed from the store are deleted. With full, or if the index
+    has no table x4files yet, e.g. as shipped with the database tarballs,
+    all tables are made anew. The files are parsed by workers processes (by
+    default one per CPU, none with workers=0 or 1) in chunks of chunksize
+    ENTRYs. DOIs are taken from x4doi.txt in DATAPATH if it exists.
+
+    Returns the numbers of ENTRYs as a dictionary with the keys entries,
+    parsed, removed and errors.
+    '''
+    connection = db.openConnection()
+    try:
+        full = full or not _hasTable(connection, 'x4files')
+        known = {} if full else dict(connection.execute('select entry, sha256 from x4files'))
+        changed = [enum for enum in db.store.keys()
+                   if known.pop(enum, None) != hashlib.sha256(db.store.read(enum)).hexdigest()]
+        return _indexEntries(connection, db, changed, sorted(known), full, workers, chunksize)
+    finally:
+        connection.close()
+
+
+def updateIndex(db, enums, workers=None, chunksize=None, previous=None):
+    '''
+    Indexes the ENTRYs enums of db again, e.g. after they were replaced in
+    the store, without looking at the other files; ENTRYs that are not in
+    the store are removed. Arguments and result are those of buildIndex.
+
+    The index of the database tarballs has no table x4files. It is added
+    with the rows of enums only, and the pickled summaries are updated with
+    the contributions of enums (updateSummaries), for which the contents of
+    the ENTRYs before the update must be given in previous { ENTRY:contents }
+    if they were in the index. If they are not, the index is built anew
+    with buildIndex. The index file must have the columns THEWORKS, see
+    exfor_database.X4Database.upgradeIndex.
+    '''
+    connection = db.openConnection()
+    try:
+        if not _hasTable(connection, 'theworks'):
+            return buildIndex(db, workers, chunksize=chunksize)
+        db.checkIndex('theworks', [c for c, t in THEWORKS])
+        store = db.store
+        enums = sorted(set(enums))
+        previous = previous or {}
+        if _hasTable(connection, 'x4files'):
+            seeded = set(enum for enum, in connection.execute(
+                'select entry from x4files where entry in (' + ', '.join('?' * len(enums)) + ')', enums))
+        else:
+            seeded = set()
+        for enum in enums:
+            if enum not in seeded and enum not in previous and connection.execute(
+                    'select count(*) from theworks where entry = ?', (enum,)).fetchone()[0] > 0:
+                return buildIndex(db, workers, chunksize=chunksize)
+        changed = [enum for enum in enums if enum in store]
+        removed = [enum for enum in enums if enum not in store]
+        return _indexEntries(connection, db, changed, removed, False, workers, chunksize, previous)
+    finally:
+        connection.close()
+
+
+def _hasTable(connection, table):
+    return connection.execute("select count(*) from sqlite_master where type = 'table' and name = ?",
+                              (table,)).fetchone()[0] > 0
+
+
+def _indexEntries(connection, db, changed, removed, full, workers, chunksize, previous=None):
+    '''Parses the ENTRYs changed, deletes the rows of changed and removed and writes the summaries; see
+    updateIndex for previous'''
+    report = {'parsed': len(changed), 'removed': len(removed), 'errors': 0}
+    old, new = {}, {}
+    fullText = exfor_index.hasFTS5(connection)
+    if workers is None:
+        workers = os.cpu_count()
+    if chunksize is None:
+        chunksize = max(1, -(-len(changed) // (4 * max(1, workers))))
+    chunks = [changed[i:i + chunksize] for i in range(0, len(changed), chunksize)]
+    with connection:
+        if not connection.in_transaction:
+            connection.execute('begin')
+        if full:
+            for table in ['theworks', 'x4bib', 'x4endf', 'x4files']:
+                connection.execute('drop table if exists ' + table)
+        createTables(connection, fullText)
+        # without the x4files rows of all ENTRYs the summaries are updated, not written anew
+        partial = previous is not None and not full and connection.execute(
+            'select count(*) from (select entry from theworks where entry not in '
+            '(select entry from x4files) limit 1)').fetchone()[0] > 0
+        if partial:
+            for enum in removed + changed:
+                row = connection.execute('select summary from x4files where entry = ?', (enum,)).fetchone()
+                if row is not None:
+                    old[enum] = pickle.loads(row[0])
+                elif enum in previous:
+                    old[enum] = indexEntry(enum, bytes(previous[enum]))['summary']
+        mapping = set(row[:3] for row in connection.execute('select * from x4endf'))
+        for enum in removed + ([] if full else changed):
+            connection.execute('delete from theworks where entry = ?', (enum,))
+            connection.execute('delete from x4files where entry = ?', (enum,))
+            if fullText:
+                connection.execute('delete from x4bib where entry = ?', (enum,))
+        if workers <= 1 or len(chunks) <= 1:
+            results = (_indexChunk(db, chunk) for chunk in chunks)
+            executor = None
+        else:
+            from concurrent.futures import ProcessPoolExecutor
+            executor = ProcessPoolExecutor(workers)
+            results = executor.map(_indexChunk, [db] * len(chunks), chunks)
+        try:
+            for chunk in results:
+                for enum, digest, record in chunk:
+                    connection.executemany('insert into theworks values (' + ', '.join('?' * len(THEWORKS))
+                                           + ')', record['works'])
+                    if fullText:
+                        connection.executemany('insert into x4bib values ('
+                                               + ', '.join('?' * (2 + len(exfor_index.BIBTEXTFIELDS)))
+                                               + ')', record['bib'])
+                    for key, value in sorted(record['endf'].items(), key=str):
+                        if key not in mapping:
+                            mapping.add(key)
+                            connection.execute('insert into x4endf values (?, ?, ?, ?, ?)', key + value)
+                    connection.execute('insert into x4files values (?, ?, ?)',
+                                       (enum, digest, pickle.dumps(record['summary'])))
+                    new[enum] = record['summary']
+                    report['errors'] += record['summary']['error'] is not None
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        if os.path.exists(db.DATAPATH / DOIFILENAME):
+            connection.execute('delete from doiXref')
+            connection.executemany('insert into doiXref values (?, ?, ?, ?)',
+                                   readDOIs(db.DATAPATH / DOIFILENAME))
+        for c in INDEXEDCOLUMNS:
+            connection.execute('create index if not exists theworks_%s on theworks (%s)' % (c, c))
+        if full or changed or removed:
+            connection.execute('analyze theworks')
+    report['entries'] = connection.execute(
+        'select count(*) from (select entry from x4files union select entry from theworks)').fetchone()[0]
+    if partial:
+        updateSummaries(db, old, new)
+    else:
+        writeSummaries(connection, db)
+    return report
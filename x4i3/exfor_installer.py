@@ -0,0 +1,311 @@
+# Copyright (c) 2020, Anatoli Fedynitch <afedynitch@gmail.com>
+
+# This file is part of the fork (x4i3) of the EXFOR Interface (x4i)
+
+# Please read the LICENCE.txt included in this distribution including "Our [LLNL's]
+# Notice and the GNU General Public License", which applies also to this fork.
+
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License (as published by the
+# Free Software Foundation) version 2, dated June 1991.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the IMPLIED WARRANTY OF
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# terms and conditions of the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+
+# module exfor_installer.py
+"""
+exfor_installer module - Download, verification and unpacking of the database archives
+"""
+
+import hashlib
+import os
+import pathlib
+import shutil
+import tarfile
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+from urllib.request import url2pathname
+
+import x4i3
+from .exfor_exceptions import DatabaseInstallError
+
+CHUNKSIZE = 1024 * 1024
+# Smaller chunks for the network, since a chunk that is interrupted is lost
+NETCHUNKSIZE = 64 * 1024
+STAGINGDIRNAME = ".x4i3-install"
+
+
+def _local_path(source):
+    """Returns the path for local files and file:// URLs, None for remote URLs"""
+    source = str(source)
+    if os.path.exists(source):
+        return pathlib.Path(source)
+    parsed = urlparse(source)
+    if parsed.scheme == "file":
+        return pathlib.Path(url2pathname(parsed.path))
+    if parsed.scheme in ("http", "https"):
+        return None
+    raise DatabaseInstallError("Database archive " + source + " not found")
+
+
+class _FileSource:
+    """Chunks of a local archive"""
+
+    def __init__(self, path):
+        self.path = path
+        self.total = os.path.getsize(path)
+
+    def __iter__(self):
+        with open(self.path, "rb") as f:
+            for data in iter(lambda: f.read(CHUNKSIZE), b""):
+                yield data
+
+
+class _HTTPSource:
+    """
+    Chunks of a remote archive, which are also appended to partfile. If
+    partfile exists, the download is resumed from its end with a HTTP Range
+    request, and so are connections that break during the download.
+    """
+
+    def __init__(self, url, partfile, retries=5, timeout=60):
+        self.url = url
+        self.partfile = partfile
+        self.retries = retries
+        self.timeout = timeout
+        self.offset = os.path.getsize(partfile) if os.path.exists(partfile) else 0
+        self.response = self._get(self.offset)
+        if self.response.status_code == 416:
+            # The previous download was already complete
+            self.response = None
+            self.total = self.offset
+            return
+        if self.offset > 0 and self.response.status_code != 206:
+            # The server ignored the Range request, start from scratch
+            self.offset = 0
+            open(partfile, "wb").close()
+        self.total = self.offset + int(self.response.headers.get("content-length", 0))
+
+    def _get(self, offset):
+        import requests
+
+        headers = {"Range": "bytes=%d-" % offset} if offset > 0 else {}
+        try:
+            r = requests.get(self.url, stream=True, headers=headers, timeout=self.timeout)
+            if not (offset > 0 and r.status_code == 416):
+                r.raise_for_status()
+        except requests.exceptions.RequestException as err:
+            raise DatabaseInstallError(
+                "Can not download " + self.url + ", got error " + str(err))
+        return r
+
+    def __iter__(self):
+        import requests
+
+        # Bytes from a previous, interrupted download
+        if self.offset > 0:
+            with open(self.partfile, "rb") as f:
+                for data in iter(lambda: f.read(min(CHUNKSIZE, self.offset - f.tell())), b""):
+                    yield data
+        if self.response is None:
+            return
+        retries = self.retries
+        with open(self.partfile, "ab") as part:
+            while True:
+                try:
+                    for data in self.response.iter_content(NETCHUNKSIZE):
+                        part.write(data)
+                        self.offset += len(data)
+                        yield data
+                    if self.offset >= self.total:
+                        return
+                    error = "incomplete response"
+                except requests.exceptions.RequestException as err:
+                    error = str(err)
+                if retries == 0:
+                    raise DatabaseInstallError(
+                        "Download of " + self.url + " failed, got error " + error)
+                retries -= 1
+                part.flush()
+                self.response = self._get(self.offset)
+                if self.offset > 0 and self.response.status_code != 206:
+                    raise DatabaseInstallError(
+                        "Download of " + self.url + " was interrupted and the "
+                        + "server does not support resuming it")
+
+
+class _ArchiveStream:
+    """
+    File-like object that tarfile can read in stream mode. It computes
+    the SHA-256 of all bytes that pass through.
+    """
+
+    def __init__(self, source, progress=None):
+        self.chunks = iter(source)
+        self.buffer = b""
+        self.sha256 = hashlib.sha256()
+        self.progress = progress
+
+    def read(self, size=-1):
+        while not self.buffer:
+            try:
+                self.buffer = next(self.chunks)
+            except StopIteration:
+                return b""
+            self.sha256.update(self.buffer)
+            if self.progress is not None:
+                self.progress.update(len(self.buffer))
+        if size < 0:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+    def drain(self):
+        """Consume the rest of the source, e.g. padding after the end of the archive"""
+        while self.read(CHUNKSIZE):
+            pass
+
+
+def read_manifest(manifest):
+    """
+    Reads a checksum manifest in the format of the sha256sum tool, i.e. one
+    "<hexdigest>  <filename>" per line, from a local file or an URL.
+    @rtype: dict
+    @return: map of file names to SHA-256 hex digests
+    """
+    path = _local_path(manifest)
+    if path is not None:
+        with open(path) as f:
+            text = f.read()
+    else:
+        import requests
+
+        try:
+            r = requests.get(manifest, timeout=60)
+            r.raise_for_status()
+        except requests.exceptions.RequestException as err:
+            raise DatabaseInstallError(
+                "Can not download manifest " + manifest + ", got error " + str(err))
+        text = r.text
+    result = {}
+    for line in text.splitlines():
+        if line.strip() == "":
+            continue
+        digest, name = line.split(None, 1)
+        result[os.path.basename(name.strip().lstrip("*"))] = digest.lower()
+    return result
+
+
+def _member_path(root, member):
+    target = os.path.normpath(os.path.join(root, member.name))
+    if os.path.isabs(member.name) or not target.startswith(str(root) + os.sep):
+        raise DatabaseInstallError(
+            "Refusing to extract " + member.name + " outside of the data directory")
+    return target
+
+
+def _write_file(target, data, mtime):
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    with open(target, "wb") as f:
+        f.write(data)
+    os.utime(target, (mtime, mtime))
+
+
+def _extract(stream, root, workers):
+    """Unpacks the archive, the files are written by a pool of threads"""
+    maxpending = 64 * workers
+    pending = []
+    with ThreadPoolExecutor(workers) as pool, tarfile.open(fileobj=stream, mode="r|*") as tar:
+        for member in tar:
+            target = _member_path(root, member)
+            if member.isdir():
+                os.makedirs(target, exist_ok=True)
+            elif member.isfile():
+                data = tar.extractfile(member).read()
+                pending.append(pool.submit(_write_file, target, data, member.mtime))
+                if len(pending) >= maxpending:
+                    pending.pop(0).result()
+            else:
+                raise DatabaseInstallError(
+                    "Refusing to extract " + member.name + ", not a file or directory")
+        for future in pending:
+            future.result()
+
+
+def install_database(source, datapath, sha256=None, manifest=None, tag=None, workers=8):
+    """
+    Downloads the database archive and unpacks it into datapath.
+
+    The archive is unpacked while it is downloaded. Interrupted downloads are
+    resumed, also across calls, from a partial file in datapath. The
+    contents are unpacked into a staging directory and only moved into
+    datapath once the archive has been verified.
+
+    @param source: URL of the archive, file:// URL or path to a local copy
+    @param datapath: directory to unpack the archive to
+    @param sha256: expected SHA-256 hex digest of the archive
+    @param manifest: path or URL of a sha256sum manifest to look up the expected digest
+    @param tag: name of the tag file to be created in datapath after a successful installation
+    @param workers: number of threads that write the unpacked files
+    """
+    from tqdm import tqdm
+
+    datapath = pathlib.Path(datapath).absolute()
+    tarname = os.path.basename(urlparse(str(source)).path) or os.path.basename(str(source))
+    if sha256 is None and manifest is not None:
+        digests = read_manifest(manifest)
+        if tarname not in digests:
+            raise DatabaseInstallError("No checksum for " + tarname + " in " + str(manifest))
+        sha256 = digests[tarname]
+
+    os.makedirs(datapath, exist_ok=True)
+    partfile = datapath / (tarname + ".part")
+    path = _local_path(source)
+    if path is not None:
+        src = _FileSource(path)
+    else:
+        src = _HTTPSource(str(source), partfile)
+
+    staging = datapath / STAGINGDIRNAME
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    print("Installing database from", source)
+    try:
+        with tqdm(total=src.total or None, unit="B", unit_scale=True) as progress:
+            stream = _ArchiveStream(src, progress)
+            try:
+                _extract(stream, str(staging), workers)
+            except tarfile.TarError as err:
+                raise DatabaseInstallError("Can not unpack " + tarname + ": " + str(err))
+            stream.drain()
+        digest = stream.sha256.hexdigest()
+        if sha256 is not None and digest != sha256.lower():
+            if partfile.exists():
+                os.remove(partfile)
+            raise DatabaseInstallError(
+                "Checksum mismatch for " + tarname + ": expected " + sha256 + ", got " + digest)
+
+        if tag is not None:
+            for tagfile in x4i3._tag_files(datapath):
+                os.remove(tagfile)
+        for item in os.listdir(staging):
+            target = datapath / item
+            if target.is_dir():
+                shutil.rmtree(target)
+            elif target.exists():
+                os.remove(target)
+            os.replace(staging / item, target)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+    if partfile.exists():
+        os.remove(partfile)
+    if tag is not None:
+        open(datapath / tag, "wb").close()
+        print("Installed database version", tag)
+    return digest
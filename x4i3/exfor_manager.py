@@ -49,12 +49,18 @@
 exfor_manager module - Classes and Methods to retrieve Exfor Entries and SubEntries from the database
 """
 
+import collections
+import io
+import itertools
 import os
-import subprocess
+import pickle
+import threading
+import traceback
+import warnings
 import zipfile
 import glob
-from x4i3 import DATAPATH, fullIndexFileName, fullDBPath
-from .exfor_utilities import unique
+from .exfor_database import getDatabase
+from .exfor_exceptions import RetrievalError
 
 EntryLetterConversion = {
     '10': 'A',
@@ -89,6 +95,38 @@ revEntryLetterConversion = {
     'T': '29',
     'V': '31'}
 
+# Record of an entry that could not be retrieved: ENTRY, requested SUBENTs,
+# name of the exception class, message and formatted traceback
+X4RetrievalError = collections.namedtuple(
+    'X4RetrievalError', ['entry', 'subents', 'error', 'message', 'traceback'])
+
+
+def _queryRange(value):
+    '''Returns the bounds (low, high) of a range criterion of query, a tuple (low, high) or a Python range
+    with step 1, or None if value is no range'''
+    if isinstance(value, range) and value.step == 1:
+        return (value.start, value.stop - 1)
+    if isinstance(value, tuple):
+        if len(value) != 2:
+            raise ValueError('A range is a tuple (low, high), not ' + repr(value))
+        return value
+    return None
+
+
+def _retrieveChunk(manager, items, rawEntry, catch):
+    '''Retrieves the (ENTRY, SUBENTs) pairs in items; also runs in the worker processes of retrieveEntries'''
+    result = []
+    for e, subents in items:
+        try:
+            result.append((e, manager.retrieveEntry(e, subents, rawEntry=rawEntry)))
+        except Exception as err:
+            if not catch:
+                raise
+            result.append((e, X4RetrievalError(e, subents, type(err).__name__, str(err),
+                                               traceback.format_exc())))
+    return result
+
+
 # -------------------------------------------
 #
 # X4DBManager
@@ -107,10 +145,12 @@ class X4DBManager:
     All of the other member functions should only be needed by code developers.
     """
 
+    # ---- the Python connection and a cursor, provided by the derived classes ----
+    CONNECTION = None
+    CURSOR = None
+
     def __init__(self, **kw):
-        # ---- the Python connection and a cursor ----
-        self.CONNECTION = None
-        self.CURSOR = None
+        pass
 
     def __fixkey__(self, i):
         '''
@@ -157,31 +197,29 @@ class X4DBManager:
         i = self.__fixkey__(i)
         if len(i) == 5:
             return len(self.query(ENTRY=i)) > 0
-        return len(self.query(SUBENT=i) > 0)
+        return len(self.query(SUBENT=i)) > 0
 
     def decompress_entry(self, s):
-        '''Some databases zip the (Sub)Entries before storing them.  This routine unzips them.'''
-        open('davestmpfile.zip', mode='w').write(s[1])
-        if not zipfile.is_zipfile('davestmpfile.zip'):
+        '''Some databases zip the (Sub)Entries before storing them.  This routine unzips them in memory.'''
+        data = s[1].encode('latin1') if isinstance(s[1], str) else s[1]
+        if not zipfile.is_zipfile(io.BytesIO(data)):
             raise Exception("Cannot decompress entry " + str(s[1]))
-        news = (s[0], ''.join(os.popen('unzip -c davestmpfile.zip').readlines()[2:]))
-        if os.path.exists(s[0] + '.txt'):
-            os.remove(s[0] + '.txt')
-        if os.path.exists('davestmpfile.zip'):
-            os.remove('davestmpfile.zip')
-        return news
-
-    def run_sql_query(self, table, column, condition=None, VERBOSE=False):
-        """Performs the actual SQL query, returns the number of results so you can request that many by calling CURSOR.fetchmany()"""
+        with zipfile.ZipFile(io.BytesIO(data)) as z:
+            return (s[0], ''.join(z.read(name).decode('latin1') for name in z.namelist()))
+
+    def run_sql_query(self, table, column, condition=None, VERBOSE=False, parameters=()):
+        """Performs the actual SQL query, returns the number of results so you can request that many by calling CURSOR.fetchmany().
+        The values of the ? placeholders in condition are given by parameters."""
         q = "select " + column + " from " + table
         if condition is not None:
             q += " where " + condition
         if VERBOSE:
-            print(q)
-        return self.CURSOR.execute(q)
+            print(q, parameters)
+        return self.CURSOR.execute(q, parameters)
 
     def query(self, author=None, reaction=None, target=None, projectile=None, quantity=None,
-              product=None, MF=None, MT=None, C=None, S=None, I=None, SUBENT=None, ENTRY=None):
+              product=None, MF=None, MT=None, C=None, S=None, I=None, SUBENT=None, ENTRY=None,
+              energy=None, outgoingEnergy=None, angle=None, Z=None, A=None, isomer=None):
         '''Use this function to search for all (Sub)Entries matching criteria in query call.
         This function returns a dictionary with the following structure: { ENTRY#0:[ SUBENT001, SUBENT#1, SUBENT#2, ... ], ... }.
         Here ENTRY#0 is the entry number whose subentries match the query.  The SUBENT001 is the documentation subentry number, which is
@@ -189,13 +227,23 @@ class X4DBManager:
         raise NotImplementedError("Do not use X4DBManager directly, use derived class")
 
     def retrieve(self, author=None, reaction=None, target=None, projectile=None, quantity=None,
-                 product=None, MF=None, MT=None, C=None, S=None, I=None, SUBENT=None, ENTRY=None):
+                 product=None, MF=None, MT=None, C=None, S=None, I=None, SUBENT=None, ENTRY=None,
+                 energy=None, outgoingEnergy=None, angle=None, Z=None, A=None, isomer=None):
         '''Execute a query, matching the criteria specified.
         This function returns a dictionary with the following structure: { ENTRY#0:[ SUBENT001, SUBENT#1, SUBENT#2, ... ], ... }.
         Here ENTRY#0 is the entry number whose subentries match the query.  The SUBENT001 is the documentation subentry itself, which is
         always included, and SUBENT#1, ... are the subentries themselves matching the search criteria.'''
         raise NotImplementedError("Do not use X4DBManager directly, use derived class")
 
+    def iter_retrieve(self, rawEntry=False, **kw):
+        '''Execute a query like retrieve, but yield the pairs (ENTRY#0, entry) one at a time instead of returning a dictionary.'''
+        raise NotImplementedError("Do not use X4DBManager directly, use derived class")
+
+    def retrieve_many(self, keys, rawEntry=False):
+        '''Retrieve many ENTRYs and SUBENTs at once. keys is a list of Exfor Accession Numbers, 5 or 8 digits each.
+        Returns the same dictionary as retrieve, with the SUBENTs of all keys grouped by ENTRY.'''
+        raise NotImplementedError("Do not use X4DBManager directly, use derived class")
+
 
 # -------------------------------------------
 #
@@ -203,100 +251,297 @@ class X4DBManager:
 #
 # -------------------------------------------
 class X4DBManagerPlainFS(X4DBManager):
-    """Exfor data base manager for data stored on local filesystem in directory hierarchy."""
+    """Exfor data base manager for data stored on local filesystem in directory hierarchy.
 
-    def __init__(self, **kw):
+    The manager works on db, an exfor_database.X4Database. Without db, the
+    database is selected by the paths to the db/ tree (keyword datapath) and
+    to the index (keyword database), or the default database is used. The
+    keyword store selects the storage backend of the .x4 files, e.g.
+    store='packed' for the memory mapped packed store, see X4Database.
+    """
+
+    def __init__(self, db=None, **kw):
         X4DBManager.__init__(self, **kw)
-        self.DATAPATH = kw.pop('datapath', fullDBPath)
-        self.database = kw.pop('database', fullIndexFileName)
-        import sqlite3
-        self.CONNECTION = sqlite3.connect(self.database, **kw) # pylint: disable=no-member
-        self.CURSOR = self.CONNECTION.cursor()
+        if db is None:
+            db = getDatabase(fullDBPath=kw.pop('datapath', None),
+                             fullIndexFileName=kw.pop('database', None), **kw)
+        self.db = db
+        self.DATAPATH = db.fullDBPath
+        self.database = db.fullIndexFileName
+        self.__cursors = threading.local()
+        db.connect()
+
+    def __reduce__(self):
+        '''Managers are passed to other processes by their database, see X4Database.__reduce__'''
+        return (self.__class__, (self.db,))
+
+    @property
+    def CONNECTION(self):
+        '''The connection to the index of the calling thread, see X4Database.connect'''
+        return self.db.connect()
+
+    @property
+    def CURSOR(self):
+        '''A cursor of the calling thread on CONNECTION'''
+        connection = self.db.connect()
+        cursor = getattr(self.__cursors, 'cursor', None)
+        if cursor is None or cursor.connection is not connection:
+            cursor = self.__cursors.cursor = connection.cursor()
+        return cursor
+
+    def __contains__(self, i):
+        """
+        Check whether an Exfor Entry or SubEntry exists in the database, in the set of accession numbers
+        of the database (X4Database.accessions), which is read from the index on first use
+
+        Input:      i, int or string, Exfor Accession Number, a 5 or 8 digit number (5 == Entry, 8 == SubEntry)
+        Returns:    bool, whether an Exfor Entry or SubEntry exists in the database
+        """
+        return self.__fixkey__(i) in self.db.accessions
 
     def query(self, author=None, reaction=None, target=None, projectile=None, quantity=None,
-              product=None, MF=None, MT=None, C=None, S=None, I=None, SUBENT=None, ENTRY=None):
+              product=None, MF=None, MT=None, C=None, S=None, I=None, SUBENT=None, ENTRY=None,
+              energy=None, outgoingEnergy=None, angle=None, Z=None, A=None, isomer=None):
         '''Use this function to search for all (Sub)Entries matching criteria in query call.
         This function returns a dictionary with the following structure: { ENTRY#0:[ SUBENT001, SUBENT#1, SUBENT#2, ... ], ... }.
         Here ENTRY#0 is the entry number whose subentries match the query.  The SUBENT001 is the documentation subentry number, which is
-        always included, and SUBENT#1, ... are the subentry numbers matching the search criteria.'''
-        # handle the search criteria we aren't ready to use yet
-        for key in ['projectile', 'product', 'MF', 'MT', 'C', 'S', 'I']:
-            if eval(key) is not None:
-                try:
-                    raise NotImplementedError(
-                        "Retrieval critria " + key + " not implemented yet")
-                except NotImplementedError:
-                    pass
+        always included, and SUBENT#1, ... are the subentry numbers matching the search criteria.
+
+        energy, outgoingEnergy and angle select the data sets whose incident energy, outgoing energy (in MeV) or
+        angle (in degrees) overlap a range or contain a single value, see exfor_index.addRangeColumns. Z, A and
+        isomer select targets by their charge, mass number and isomeric state, e.g. Z=range(89, 104) for the
+        actinides, see exfor_index.addTargetColumns. For all of these criteria a range is given as a tuple
+        (low, high), either end of which may be None, or as a Python range, where range(low, high + 1) is the same
+        as (low, high). Z, A and isomer also take a list or set of values, of which the target must have one.
+
+        Results are kept in X4Database.queryCache under the normalized criteria, so that repeated queries,
+        also those that differ only in case or use 'CS' for 'SIG', skip SQLite. Every call returns a new copy.'''
+        criteria, parameters = self.queryCriteria(
+            author=author, reaction=reaction, target=target, projectile=projectile, quantity=quantity,
+            product=product, MF=MF, MT=MT, C=C, S=S, I=I, SUBENT=SUBENT, ENTRY=ENTRY,
+            energy=energy, outgoingEnergy=outgoingEnergy, angle=angle, Z=Z, A=A, isomer=isomer)
+        if criteria == '':
+            return {}
+
+        # Run the big query, unless its result is cached; the tag invalidates the results of older releases
+        def runQuery(key):
+            self.run_sql_query("theworks", "distinct subent", criteria + " order by subent", parameters=parameters)
+            result_map = self.group_subents([x[0] for x in self.CURSOR.fetchall()])
+            return tuple((e, tuple(subents)) for e, subents in result_map.items())
+
+        result = self.db.queryCache.get((self.db.tag, criteria, tuple(parameters)), runQuery)
+        return {e: list(subents) for e, subents in result}
+
+    def query_page(self, limit, after=None, offset=None, **kw):
+        '''Like query with the criteria in kw, but returns only the first limit ENTRYs of the result.
+
+        Pages are selected by ENTRY number: after is the last ENTRY of the previous page, so that each page
+        is found with the index on theworks.entry no matter how deep into the result it is. Alternatively,
+        offset skips that many ENTRYs from the start, which gets slower the further one pages.'''
+        criteria, parameters = self.queryCriteria(**kw)
+        if criteria == '':
+            return {}
+        page = criteria
+        pageParameters = list(parameters)
+        if after is not None:
+            page += " and entry > ?"
+            pageParameters.append(self.__fixkey__(after))
+        page += " order by entry limit ?"
+        pageParameters.append(int(limit))
+        if offset is not None:
+            page += " offset ?"
+            pageParameters.append(int(offset))
+        # the ENTRYs of the page are the outer loop, so that their SUBENTs are looked up by ENTRY
+        self.run_sql_query(
+            "(select distinct entry as pageentry from theworks where " + page + ") cross join theworks",
+            "distinct subent", "entry = pageentry and " + criteria + " order by subent",
+            parameters=pageParameters + parameters)
+        return self.group_subents([x[0] for x in self.CURSOR.fetchall()])
+
+    def search(self, expression, limit=None, **kw):
+        '''Full-text search of the BIB fields exfor_index.BIBTEXTFIELDS, e.g. search('TITLE: polarized AND CYCLO'),
+        see the query syntax of SQLite FTS5. Further criteria of query in kw narrow down the result.
+
+        Returns the dictionary of query, { ENTRY#0:[ SUBENT001, SUBENT#1, ... ], ... }, ordered by relevance
+        with the best matching ENTRY first, and at most limit ENTRYs. A match in the documentation subentry
+        SUBENT001 selects all SUBENTs of the ENTRY. The full-text index is the table x4bib, which
+        X4Database.upgradeIndex adds to the index file.'''
+        self.db.checkIndex('x4bib')
+        criteria, parameters = self.queryCriteria(**kw)
+        self.run_sql_query(
+            "(select entry as bibentry, subent as bibsubent, rank from x4bib where x4bib match ?) "
+            "join theworks on entry = bibentry and (subent = bibsubent or bibsubent = bibentry || '001')",
+            "subent, min(rank)", (criteria + " " if criteria else "1 ") + "group by subent",
+            parameters=[expression] + parameters)
+        ranks = {}
+        subents = []
+        for subent, rank in self.CURSOR.fetchall():
+            subents.append(subent)
+            ranks[subent[0:5]] = min(rank, ranks.get(subent[0:5], rank))
+        result_map = self.group_subents(sorted(subents))
+        best = sorted(result_map, key=lambda e: (ranks[e], e))[:limit]
+        return {e: result_map[e] for e in best}
+
+    def queryCriteria(self, author=None, reaction=None, target=None, projectile=None, quantity=None,
+                      product=None, MF=None, MT=None, C=None, S=None, I=None, SUBENT=None, ENTRY=None,
+                      energy=None, outgoingEnergy=None, angle=None, Z=None, A=None, isomer=None):
+        '''Translates the criteria of query into the where clause on theworks and the values of its ? placeholders.
+        Raises exfor_exceptions.IndexUpgradeError if the index file lacks a column of the criteria.'''
+        # the ENDL designators are not in the index and are ignored, as they always were
+        for key, value in [('C', C), ('S', S), ('I', I)]:
+            if value is not None:
+                warnings.warn("The retrieval criterion " + key + " is ignored and will be removed,"
+                              " use MF and MT instead", DeprecationWarning, stacklevel=3)
 
         criteria = []
+        parameters = []
+        # columns that X4Database.upgradeIndex adds to older index files
+        columns = []
 
         # Search for matching authors
         if author is not None:
-            criteria.append("author = '%s' " % (author.capitalize()))
+            criteria.append("author = ?")
+            parameters.append(author.capitalize())
 
         # Search for matching target
         if target is not None:
-            criteria.append("target = '%s' " % (target.upper()))
+            criteria.append("target = ?")
+            parameters.append(target.upper())
 
         # Search for matching reaction
         if reaction is not None:
             if reaction.find('*') != -1:
-                criteria.append(
-                    "reaction LIKE '%s' " %
-                    (reaction.replace(
-                        '*', '%').upper()))
+                criteria.append("reaction LIKE ?")
+                parameters.append(reaction.replace('*', '%').upper())
             else:
-                criteria.append("reaction = '%s' " % (reaction.upper()))
+                criteria.append("reaction = ?")
+                parameters.append(reaction.upper())
 
         # Search for matching reaction
         if projectile is not None:
-            criteria.append("projectile = '%s' " % (projectile.upper()))
+            criteria.append("projectile = ?")
+            parameters.append(projectile.upper())
 
         # Search for matching quantity
         if quantity is not None:
-            if quantity == 'CS':
-                criteria.append("quantity = '%s' " % ("SIG"))
+            criteria.append("quantity = ?")
+            if quantity.upper() == 'CS':
+                parameters.append("SIG")
             else:
-                criteria.append("quantity = '%s' " % (quantity.upper()))
+                parameters.append(quantity.upper())
+
+        # Search for matching product (residual nucleus or particle considered)
+        if product is not None:
+            columns.append("product")
+            criteria.append("product = ?")
+            parameters.append(product.upper())
+
+        # Search for matching ENDF file and reaction number
+        if MF is not None:
+            columns.append("MF")
+            criteria.append("MF = ?")
+            parameters.append(int(MF))
+        if MT is not None:
+            columns.append("MT")
+            criteria.append("MT = ?")
+            parameters.append(int(MT))
 
         # Search for matching SUBENTRY
         if SUBENT is not None:
-            criteria.append("subent = '%s' " % (SUBENT))
+            criteria.append("subent = ?")
+            parameters.append(str(SUBENT))
 
         # Search for matching ENTRY
         if ENTRY is not None:
-            criteria.append("entry = '%s' " % (ENTRY))
+            criteria.append("entry = ?")
+            parameters.append(str(ENTRY))
+
+        # Search for data sets that overlap the ranges (low, high) of the incident energy and outgoing
+        # energy in MeV and of the angle in degrees; a single number selects the data sets that contain it
+        for column, value, name in [('en', energy, 'energy'), ('e', outgoingEnergy, 'outgoingEnergy'),
+                                    ('ang', angle, 'angle')]:
+            if value is None:
+                continue
+            columns.extend([column + "min", column + "max"])
+            bounds = _queryRange(value)
+            if bounds is None and isinstance(value, (list, set, frozenset, range)):
+                raise TypeError(name + " takes a number or a range, a tuple (low, high) or a range with step 1, "
+                                "not " + repr(value))
+            low, high = bounds or (value, value)
+            if low is not None:
+                criteria.append(column + "max >= ?")
+                parameters.append(float(low))
+            if high is not None:
+                criteria.append(column + "min <= ?")
+                parameters.append(float(high))
+
+        # Search for matching charge, mass number (0 for natural elements) and isomeric state of the target:
+        # a number, a list or set of numbers, or a range (low, high) of which either end may be None
+        for column, value in [('Z', Z), ('A', A), ('isomer', isomer)]:
+            if value is None:
+                continue
+            columns.append(column)
+            bounds = _queryRange(value)
+            if bounds is not None:
+                low, high = bounds
+                if low is not None:
+                    criteria.append(column + " >= ?")
+                    parameters.append(int(low))
+                if high is not None:
+                    criteria.append(column + " <= ?")
+                    parameters.append(int(high))
+            elif isinstance(value, (list, set, frozenset, range)):
+                value = sorted(set(int(v) for v in value))
+                criteria.append(column + " in (" + ", ".join("?" * len(value)) + ")")
+                parameters.extend(value)
+            else:
+                criteria.append(column + " = ?")
+                parameters.append(int(value))
 
-        # Run the big query
-        criteria = ' and '.join(criteria)
-        if criteria != '':
-            self.run_sql_query("theworks", "subent", criteria)
-            result_list = sorted(unique([x[0] for x in self.CURSOR.fetchall()]))
-        else:
-            return {}
+        if len(columns) > 0:
+            self.db.checkIndex('theworks', columns)
+        return ' and '.join(criteria), parameters
 
-        # clean up the list, put it in a map
+    def group_subents(self, result_list):
+        '''Puts a sorted list of distinct SUBENT numbers in the map { ENTRY#0:[ SUBENT001, SUBENT#1, ... ], ... }
+        returned by query'''
         result_map = {}
         for r in result_list:
             e = r[0:5]
             if not e in result_map:
                 result_map[e] = [e + '001']
-            if not r in result_map[e]:
+            if r != e + '001':
                 result_map[e].append(r)
 
         return result_map
 
+    def query_many(self, keys):
+        '''Like query(ENTRY=...) and query(SUBENT=...) for all Exfor Accession Numbers in keys together,
+        resolved with a single SQL statement.'''
+        keys = [(self.__fixkey__(k),) for k in keys]
+        self.CURSOR.execute("create temp table if not exists x4keys (key text primary key)")
+        try:
+            self.CURSOR.executemany("insert or ignore into temp.x4keys values (?)", keys)
+            self.run_sql_query(
+                "theworks", "subent",
+                "entry in (select key from temp.x4keys) union "
+                "select subent from theworks where subent in (select key from temp.x4keys) order by subent")
+            result_list = [x[0] for x in self.CURSOR.fetchall()]
+        finally:
+            self.CURSOR.execute("delete from temp.x4keys")
+            self.CONNECTION.commit()
+        return self.group_subents(result_list)
+
     def retrieve(self, author=None, reaction=None, target=None, projectile=None, quantity=None,
-                 product=None, MF=None, MT=None, C=None, S=None, I=None, SUBENT=None, ENTRY=None, rawEntry=False):
+                 product=None, MF=None, MT=None, C=None, S=None, I=None, SUBENT=None, ENTRY=None, rawEntry=False,
+                 workers=None, errors=None, energy=None, outgoingEnergy=None, angle=None, Z=None, A=None, isomer=None):
         '''Execute a query, matching the criteria specified.
         This function returns a dictionary with the following structure: { ENTRY#0:[ SUBENT001, SUBENT#1, SUBENT#2, ... ], ... }.
         Here ENTRY#0 is the entry number whose subentries match the query.  The SUBENT001 is the documentation subentry itself, which is
         always included, and SUBENT#1, ... are the subentries themselves matching the search criteria.
 
-        If the flag rawEntry is True, the raw text versions of the SUBENTs will be returned, otherwise they will be converted to X4Entry instances.'''
-        from .exfor_entry import x4EntryFactory
-
-        result = {}
+        If the flag rawEntry is True, the raw text versions of the SUBENTs will be returned, otherwise they will be converted to X4Entry instances.
+        See retrieveEntries for workers and errors.'''
         smap = self.query(
             author=author,
             reaction=reaction,
@@ -307,41 +552,250 @@ class X4DBManagerPlainFS(X4DBManager):
             MF=MF, MT=MT,
             C=C, S=S, I=I,
             SUBENT=SUBENT,
-            ENTRY=ENTRY)
+            ENTRY=ENTRY,
+            energy=energy, outgoingEnergy=outgoingEnergy, angle=angle, Z=Z, A=A, isomer=isomer)
+        return self.retrieveEntries(smap, rawEntry, workers, errors)
+
+    def retrieve_many(self, keys, rawEntry=False, workers=None, errors=None):
+        '''Retrieve many ENTRYs and SUBENTs at once. keys is a list of Exfor Accession Numbers, 5 or 8 digits each.
+        Returns the same dictionary as retrieve, with the SUBENTs of all keys grouped by ENTRY. The keys are
+        resolved in one SQL query, each entry file is read once and only the requested SUBENTs are parsed.
+        See retrieveEntries for workers and errors.'''
+        return self.retrieveEntries(self.query_many(keys), rawEntry, workers, errors)
+
+    def iter_retrieve(self, rawEntry=False, errors=None, **kw):
+        '''Like retrieve with the criteria in kw, but yields the pairs (ENTRY, entry) one by one, in the order of
+        the ENTRY numbers. The SUBENT numbers are read from their own cursor while the entries are consumed, so
+        only one entry is held in memory at a time and the caller can stop at any point. See retrieveEntries
+        for errors.'''
+        criteria, parameters = self.queryCriteria(**kw)
+        if criteria == '':
+            return
+        cursor = self.CONNECTION.cursor()
+        try:
+            cursor.execute("select distinct subent from theworks where " + criteria + " order by subent", parameters)
+            for e, rows in itertools.groupby(cursor, lambda row: row[0][0:5]):
+                subents = [e + '001'] + [r[0] for r in rows if r[0] != e + '001']
+                for _, entry in _retrieveChunk(self, [(e, subents)], rawEntry, errors is not None):
+                    if isinstance(entry, X4RetrievalError):
+                        errors.append(entry)
+                    else:
+                        yield e, entry
+        finally:
+            cursor.close()
+
+    def retrieveEntries(self, smap, rawEntry=False, workers=None, errors=None, chunksize=None):
+        '''Retrieves the entries of smap, a dictionary { ENTRY#0:[ SUBENT001, SUBENT#1, ... ], ... } as returned by query.
+
+        With workers, the entries are read and parsed by that many processes, in chunks of chunksize entries
+        (by default four chunks per process). The result is in the order of smap either way.
+
+        If errors is a list, entries that cannot be read or parsed are left out of the result and an
+        X4RetrievalError record is appended to errors for each. Otherwise the first failure is raised,
+        as exfor_exceptions.RetrievalError if it happened in a worker process.'''
+        items = list(smap.items())
+        if workers is None or workers <= 1 or len(items) <= 1:
+            records = _retrieveChunk(self, items, rawEntry, errors is not None)
+        else:
+            from concurrent.futures import ProcessPoolExecutor
+            if chunksize is None:
+                chunksize = max(1, -(-len(items) // (4 * workers)))
+            chunks = [items[i:i + chunksize] for i in range(0, len(items), chunksize)]
+            records = []
+            with ProcessPoolExecutor(workers) as executor:
+                for chunk in executor.map(_retrieveChunk, [self] * len(chunks), chunks,
+                                          [rawEntry] * len(chunks), [True] * len(chunks)):
+                    records.extend(chunk)
+        result = {}
+        for e, entry in records:
+            if not isinstance(entry, X4RetrievalError):
+                result[e] = entry
+            elif errors is not None:
+                errors.append(entry)
+            else:
+                raise RetrievalError(entry)
+        return result
+
+    def entryFactory(self, enum, subentsList, rawEntry):
+        from .exfor_entry import x4EntryFactory
+        return x4EntryFactory(enum, subentsList, rawEntry=rawEntry, database=self.db)
+
+    def retrieveEntry(self, enum, subentsList=None, rawEntry=False):
+        '''Returns ENTRY enum with the SUBENTs in subentsList. Parsed entries
+        are taken from the caches of the database; each call returns a new
+        copy, which callers are free to change.'''
+        if rawEntry:
+            return self.entryFactory(enum, subentsList, True)
+        key = (self.db.tag, enum, None if subentsList is None else tuple(subentsList))
+        return self.cached(key, lambda: self.entryFactory(enum, subentsList, False))
+
+    def retrieveSimplifiedDataSets(self, makeAllColumns=False, **kw):
+        '''Execute a query like retrieve and return the simplified data sets of the entries found:
+        { ENTRY#0:{ (ENTRY#0, SUBENT#1, pointer):X4DataSet, ... }, ... }. The data sets are cached like
+        the entries, so with the disk cache of the database a warm run does not parse the entries at all.'''
+        result = {}
+        smap = self.query(**kw)
         for e in smap:
-            result[e] = x4EntryFactory(e, smap[e], rawEntry=rawEntry, customDBPath=self.DATAPATH)
+            key = (self.db.tag, e, tuple(smap[e]), 'simplified', makeAllColumns)
+            result[e] = self.cached(key, lambda: self.retrieveEntry(
+                e, smap[e]).getSimplifiedDataSets(makeAllColumns=makeAllColumns))
         return result
 
+    def cached(self, key, make):
+        '''Returns a copy of the value of key, which make() creates on a miss of the
+        in-memory and disk caches of the database. Keys start with the tag and ENTRY.
+        Files of the disk cache that cannot be unpickled count as misses.'''
+        db = self.db
+
+        def dumps(k):
+            return pickle.dumps(make(), pickle.HIGHEST_PROTOCOL)
+
+        def load(k):
+            if db.diskCache is None:
+                return dumps(k)
+            return db.diskCache.get(k, db.entryStamp(k[1]), dumps)
+        data = db.entryCache.get(key, load)
+        try:
+            return pickle.loads(data)
+        except Exception:
+            if db.diskCache is None:
+                raise
+        data = db.diskCache.get(key, db.entryStamp(key[1]), dumps, refresh=True)
+        db.entryCache.put(key, data)
+        return pickle.loads(data)
 
-class X4DBManagerMemoryCached(X4DBManagerPlainFS):
-    """This derived manager class uses the compressed dictionary instead of the
-    plain file system for access to entry x4 files."""
 
-    def retrieve(self, author=None, reaction=None, target=None, projectile=None, quantity=None,
-                 product=None, MF=None, MT=None, C=None, S=None, I=None, SUBENT=None, ENTRY=None, rawEntry=False):
-        '''Execute a query, matching the criteria specified.
-        This function returns a dictionary with the following structure: { ENTRY#0:[ SUBENT001, SUBENT#1, SUBENT#2, ... ], ... }.
-        Here ENTRY#0 is the entry number whose subentries match the query.  The SUBENT001 is the documentation subentry itself, which is
-        always included, and SUBENT#1, ... are the subentries themselves matching the search criteria.
+class X4DBManagerMemoryCached(X4DBManagerPlainFS):
+    """This derived manager class keeps the entry x4 files in the in-memory
+    cache of the database (see x4i3.DataBaseCache) instead of reading them
+    from the plain file system for each access. Combine it with
+    store='compressed' to read the files from the compressed store."""
 
-        If the flag rawEntry is True, the raw text versions of the SUBENTs will be returned, otherwise they will be converted to X4Entry instances.'''
+    def entryFactory(self, enum, subentsList, rawEntry):
         from .exfor_entry import x4DictionaryEntryFactory
+        return x4DictionaryEntryFactory(enum, subentsList, rawEntry=rawEntry, database=self.db)
+
 
+# -------------------------------------------
+#
+# AsyncX4DBManager
+#
+# -------------------------------------------
+class AsyncX4DBManager:
+    """asyncio front end of a manager, for applications that must not block their event loop.
+
+    The queries of the index run in a pool of concurrency threads. The entries are parsed in a pool of
+    workers processes (by default one per CPU), or with workers=0 in a single thread, so that parsing,
+    which holds the GIL, does not occupy the threads of the queries. Raw entries are read in the thread
+    pool. At most concurrency entries are in progress at a time for every call of retrieve or
+    iter_retrieve, and cancelling the awaiting task cancels the entries that have not started yet.
+
+    The manager is manager, or an X4DBManagerPlainFS created with the keywords kw. Use it as
+    "async with AsyncX4DBManager(...) as mgr:" or call close() to shut down the pools.
+    """
+
+    def __init__(self, manager=None, workers=None, concurrency=8, **kw):
+        self.manager = manager if manager is not None else X4DBManagerPlainFS(**kw)
+        self.workers = os.cpu_count() if workers is None else workers
+        self.concurrency = concurrency
+        self.__threads = None
+        self.__parsers = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close()
+
+    def close(self):
+        '''Shuts down the thread and process pools'''
+        for executor in [self.__threads, self.__parsers]:
+            if executor is not None:
+                executor.shutdown(wait=False)
+        self.__threads = None
+        self.__parsers = None
+
+    @property
+    def threads(self):
+        if self.__threads is None:
+            from concurrent.futures import ThreadPoolExecutor
+            self.__threads = ThreadPoolExecutor(self.concurrency)
+        return self.__threads
+
+    @property
+    def parsers(self):
+        if self.__parsers is None:
+            from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+            if self.workers == 0:
+                self.__parsers = ThreadPoolExecutor(1)
+            else:
+                self.__parsers = ProcessPoolExecutor(self.workers)
+        return self.__parsers
+
+    def __run(self, executor, f, *args):
+        import asyncio
+        return asyncio.get_running_loop().run_in_executor(executor, f, *args)
+
+    async def query(self, **kw):
+        '''Like X4DBManagerPlainFS.query, run in the thread pool'''
+        return await self.__run(self.threads, lambda: self.manager.query(**kw))
+
+    async def query_many(self, keys):
+        '''Like X4DBManagerPlainFS.query_many, run in the thread pool'''
+        return await self.__run(self.threads, self.manager.query_many, keys)
+
+    async def retrieveEntry(self, enum, subentsList=None, rawEntry=False, errors=None):
+        '''Returns ENTRY enum with the SUBENTs in subentsList. If errors is a list, failures are appended to
+        it and None is returned, otherwise they raise exfor_exceptions.RetrievalError.'''
+        executor = self.threads if rawEntry else self.parsers
+        (e, entry), = await self.__run(executor, _retrieveChunk, self.manager, [(enum, subentsList)],
+                                       rawEntry, True)
+        if isinstance(entry, X4RetrievalError):
+            if errors is None:
+                raise RetrievalError(entry)
+            errors.append(entry)
+            return None
+        return entry
+
+    async def retrieve(self, rawEntry=False, errors=None, **kw):
+        '''Like X4DBManagerPlainFS.retrieve with the criteria in kw, see retrieveEntry for errors'''
         result = {}
-        smap = self.query(
-            author=author,
-            reaction=reaction,
-            target=target,
-            projectile=projectile,
-            quantity=quantity,
-            product=product,
-            MF=MF, MT=MT,
-            C=C, S=S, I=I,
-            SUBENT=SUBENT,
-            ENTRY=ENTRY)
-        for e in smap:
-            result[e] = x4DictionaryEntryFactory(e, smap[e], rawEntry=rawEntry)
+        async for e, entry in self.iter_retrieve(rawEntry=rawEntry, errors=errors, **kw):
+            result[e] = entry
         return result
 
+    async def retrieve_many(self, keys, rawEntry=False, errors=None):
+        '''Like X4DBManagerPlainFS.retrieve_many, see retrieveEntry for errors'''
+        result = {}
+        async for e, entry in self.iterEntries(await self.query_many(keys), rawEntry, errors):
+            result[e] = entry
+        return result
+
+    async def iter_retrieve(self, rawEntry=False, errors=None, **kw):
+        '''Asynchronous generator of the pairs (ENTRY, entry) of a query with the criteria in kw, in the
+        order of the ENTRY numbers'''
+        async for item in self.iterEntries(await self.query(**kw), rawEntry, errors):
+            yield item
+
+    async def iterEntries(self, smap, rawEntry=False, errors=None):
+        '''Asynchronous generator of the entries of smap, a dictionary as returned by query. The next
+        concurrency entries are retrieved while the caller works on the current one.'''
+        import asyncio
+        pending = collections.deque()
+        items = iter(smap.items())
+        try:
+            while True:
+                for e, subents in itertools.islice(items, self.concurrency - len(pending)):
+                    pending.append((e, asyncio.ensure_future(self.retrieveEntry(e, subents, rawEntry, errors))))
+                if len(pending) == 0:
+                    break
+                e, future = pending.popleft()
+                entry = await future
+                if entry is not None:
+                    yield e, entry
+        finally:
+            for e, future in pending:
+                future.cancel()
+
 
 X4DBManagerDefault = X4DBManagerPlainFS
@@ -0,0 +1,320 @@
+# Copyright (c) 2020, Anatoli Fedynitch <afedynitch@gmail.com>
+
+# This file is part of the fork (x4i3) of the EXFOR Interface (x4i)
+
+# Please read the LICENCE.txt included in this distribution including "Our [LLNL's]
+# Notice and the GNU General Public License", which applies also to this fork.
+
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License (as published by the
+# Free Software Foundation) version 2, dated June 1991.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the IMPLIED WARRANTY OF
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# terms and conditions of the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+
+# module exfor_store.py
+"""
+exfor_store module - Storage backends for the .x4 files of an EXFOR database
+"""
+
+import collections
+import io
+import mmap
+import os
+import struct
+import threading
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+PACKMAGIC = b'X4PACK02'
+COMPRESSEDMAGIC = b'X4ZPACK2'
+# accession number, offset and length of an entry in the pack file
+PACKINDEXRECORD = struct.Struct('<5sQI')
+# offset of the index records at the end of the pack file
+PACKTRAILER = struct.Struct('<Q')
+# codec name and length of the shared dictionary of a compressed pack file
+COMPRESSEDHEADER = struct.Struct('<4sI')
+# zlib accepts preset dictionaries of up to 32 KiB
+ZLIBDICTSIZE = 32 * 2**10
+ZSTDDICTSIZE = 112 * 2**10
+# number of entries used to train the shared dictionary
+TRAININGSAMPLES = 2000
+
+
+def decodeEntry(data):
+    '''
+    Converts the raw bytes of an .x4 file to a list of lines, like reading
+    the file in text mode with universal newlines does
+    '''
+    text = str(data, 'latin1')
+    if '\r' in text:
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+    return io.StringIO(text).readlines()
+
+
+def openTemporary(fileName):
+    '''
+    Creates a new file next to fileName under a random name, which threads
+    and processes writing fileName at the same time never share, and
+    returns it open for writing together with its name. The file gets the
+    permissions of a file made by open, unlike those of tempfile.mkstemp,
+    since it replaces a file of the database.
+    '''
+    while True:
+        tmpFileName = '%s.%s.tmp' % (fileName, os.urandom(6).hex())
+        try:
+            return open(tmpFileName, 'xb'), tmpFileName
+        except FileExistsError:
+            continue
+
+
+class X4FileSystemStore:
+    """The .x4 files in the db/ tree of a database, one per ENTRY in three character directories"""
+
+    def __init__(self, dbPath):
+        self.dbPath = dbPath
+
+    def fileName(self, enum):
+        return os.path.join(self.dbPath, enum[:3], enum + '.x4')
+
+    def read(self, enum):
+        '''Returns the contents of the .x4 file of ENTRY enum'''
+        with open(self.fileName(enum), 'rb') as f:
+            return f.read()
+
+    def __contains__(self, enum):
+        return os.path.exists(self.fileName(enum))
+
+    def stamp(self, enum):
+        '''Changes when the .x4 file of ENTRY enum changes'''
+        st = os.stat(self.fileName(enum))
+        return (st.st_mtime_ns, st.st_size)
+
+    def keys(self):
+        '''All ENTRYs in sorted order'''
+        result = []
+        for sd in os.listdir(self.dbPath):
+            if not os.path.isdir(os.path.join(self.dbPath, sd)):
+                continue
+            for x4f in os.listdir(os.path.join(self.dbPath, sd)):
+                if x4f.endswith('.x4'):
+                    result.append(x4f[:-3])
+        return sorted(result)
+
+    def close(self):
+        pass
+
+
+class X4PackedStore:
+    """
+    All .x4 files of a database packed in a single file, followed by an
+    index of the offset and length of each ENTRY. The file is memory
+    mapped, so that reading an entry does not need a system call, and
+    entries are returned as memoryviews into the map without copying.
+    Since the index is part of the file, a new version of the store
+    replaces the old one with a single rename.
+
+    Create the file with buildPackedStore.
+    """
+    magic = PACKMAGIC
+
+    def __init__(self, packFileName):
+        self.packFileName = str(packFileName)
+        with open(self.packFileName, 'rb') as f:
+            if f.read(len(self.magic)) != self.magic:
+                raise IOError('Not a packed EXFOR database: ' + self.packFileName)
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            st = os.fstat(f.fileno())
+            self.fileStamp = (st.st_mtime_ns, st.st_size)
+        end = len(self.mmap) - PACKTRAILER.size
+        start, = PACKTRAILER.unpack_from(self.mmap, end)
+        self.offsets = {}
+        for accnum, offset, length in PACKINDEXRECORD.iter_unpack(self.mmap[start:end]):
+            self.offsets[accnum.decode('ascii')] = (offset, length)
+        self.view = memoryview(self.mmap)
+
+    def read(self, enum):
+        '''Returns the contents of the .x4 file of ENTRY enum as a memoryview'''
+        offset, length = self.offsets[enum]
+        return self.view[offset:offset + length]
+
+    def __contains__(self, enum):
+        return enum in self.offsets
+
+    def stamp(self, enum):
+        '''Changes when ENTRY enum or the pack file changes'''
+        return self.fileStamp + self.offsets[enum]
+
+    def keys(self):
+        '''All ENTRYs in sorted order'''
+        return sorted(self.offsets)
+
+    def close(self):
+        '''Unmaps the data file, fails if memoryviews of entries are still in use'''
+        self.view.release()
+        self.mmap.close()
+
+
+class X4CompressedStore(X4PackedStore):
+    """
+    Like X4PackedStore, but each entry is compressed on its own, with zlib
+    or, if the zstandard package is installed, zstd. All entries share a
+    dictionary trained on the database, which makes up for the small size
+    of the single entries. Entries are decompressed in memory on read, so
+    the store needs a fraction of the memory of the plain .x4 files.
+
+    Create the file with buildCompressedStore.
+    """
+    magic = COMPRESSEDMAGIC
+
+    def __init__(self, packFileName):
+        X4PackedStore.__init__(self, packFileName)
+        start = len(self.magic)
+        codec, size = COMPRESSEDHEADER.unpack_from(self.mmap, start)
+        start += COMPRESSEDHEADER.size
+        self.codec = codec.decode('ascii')
+        self.zdict = self.mmap[start:start + size]
+        if self.codec == 'zstd':
+            if zstandard is None:
+                raise ImportError('The zstandard package is needed to read ' + self.packFileName)
+            self.__local = threading.local()
+        elif self.codec != 'zlib':
+            raise IOError('Unknown codec ' + repr(self.codec) + ' in ' + self.packFileName)
+
+    def read(self, enum):
+        '''Returns the decompressed contents of the .x4 file of ENTRY enum'''
+        blob = X4PackedStore.read(self, enum)
+        if self.codec == 'zlib':
+            return zlib.decompressobj(zdict=self.zdict).decompress(blob)
+        # ZstdDecompressor instances must not be shared between threads
+        decompressor = getattr(self.__local, 'decompressor', None)
+        if decompressor is None:
+            decompressor = self.__local.decompressor = zstandard.ZstdDecompressor(
+                dict_data=zstandard.ZstdCompressionDict(self.zdict) if self.zdict else None)
+        return decompressor.decompress(blob)
+
+    def compressedSize(self, enum):
+        return self.offsets[enum][1]
+
+
+def trainZlibDictionary(samples, size=ZLIBDICTSIZE):
+    '''
+    Builds a preset dictionary for zlib from the lines that are found in
+    several samples. The line numbers in columns 67-80 are left out, as they
+    differ between all lines. The most useful lines come last in the
+    dictionary, where deflate reaches them with the shortest distances.
+    '''
+    counts = collections.Counter()
+    for data in samples:
+        counts.update(set(line[:66] for line in io.BytesIO(data)))
+    common = [line for line, n in counts.items() if n > 1]
+    common.sort(key=lambda line: counts[line] * len(line), reverse=True)
+    result = []
+    total = 0
+    for line in common:
+        if total + len(line) > size:
+            continue
+        result.append(line)
+        total += len(line)
+    return b''.join(reversed(result))
+
+
+def _writePack(fileName, header, blobs):
+    '''
+    Writes header, the (accession number, blob) pairs of blobs and their
+    index to a new pack file, which replaces fileName atomically
+    '''
+    index = []
+    f, tmpFileName = openTemporary(fileName)
+    try:
+        with f:
+            f.write(header)
+            for enum, data in blobs:
+                index.append(PACKINDEXRECORD.pack(enum.encode('ascii'), f.tell(), len(data)))
+                f.write(data)
+            start = f.tell()
+            f.write(b''.join(index))
+            f.write(PACKTRAILER.pack(start))
+        os.replace(tmpFileName, fileName)
+    except BaseException:
+        os.remove(tmpFileName)
+        raise
+
+
+def buildPackedStore(source, packFileName):
+    '''
+    Packs all entries of source, e.g. an X4FileSystemStore, into a new pack
+    file. The file is replaced atomically.
+    '''
+    _writePack(packFileName, PACKMAGIC, ((enum, source.read(enum)) for enum in source.keys()))
+
+
+def buildCompressedStore(source, packFileName, codec=None, level=9):
+    '''
+    Compresses all entries of source into a new pack file for
+    X4CompressedStore. The codec is 'zstd' if the zstandard package is
+    installed and 'zlib' otherwise, unless given.
+    '''
+    if codec is None:
+        codec = 'zlib' if zstandard is None else 'zstd'
+    keys = source.keys()
+    step = max(1, len(keys) // TRAININGSAMPLES)
+    samples = [bytes(source.read(enum)) for enum in keys[::step]]
+    if codec == 'zlib':
+        zdict = trainZlibDictionary(samples)
+    elif codec == 'zstd':
+        if zstandard is None:
+            raise ImportError('The zstandard package is needed for zstd compression')
+        try:
+            zdict = zstandard.train_dictionary(ZSTDDICTSIZE, samples).as_bytes()
+        except zstandard.ZstdError:
+            # too few samples to train a dictionary
+            zdict = b''
+    else:
+        raise ValueError('Unknown codec ' + repr(codec))
+    compress = _compressor(codec, zdict, level)
+    header = COMPRESSEDMAGIC + COMPRESSEDHEADER.pack(codec.encode('ascii'), len(zdict)) + zdict
+    _writePack(packFileName, header, ((enum, compress(source.read(enum))) for enum in keys))
+
+
+def _compressor(codec, zdict, level):
+    '''Function that compresses an entry with codec and the shared dictionary zdict'''
+    if codec == 'zlib':
+        def compress(data):
+            c = zlib.compressobj(level, zdict=zdict)
+            return c.compress(data) + c.flush()
+        return compress
+    if zstandard is None:
+        raise ImportError('The zstandard package is needed for zstd compression')
+    return zstandard.ZstdCompressor(
+        level=level, dict_data=zstandard.ZstdCompressionDict(zdict) if zdict else None).compress
+
+
+def updatePackedStore(store, entries, level=9):
+    '''
+    Adds or replaces the entries { ENTRY:contents } in the file of store, an
+    X4PackedStore or X4CompressedStore. The other entries are copied as they
+    are, new entries of a compressed store are compressed with its codec and
+    dictionary. The file is replaced atomically, store keeps reading the
+    old file until it is closed.
+    '''
+    if isinstance(store, X4CompressedStore):
+        zdict = bytes(store.zdict)
+        header = (COMPRESSEDMAGIC + COMPRESSEDHEADER.pack(store.codec.encode('ascii'), len(zdict)) + zdict)
+        compress = _compressor(store.codec, zdict, level)
+    else:
+        header = PACKMAGIC
+        compress = bytes
+    _writePack(store.packFileName, header,
+               ((enum, compress(entries[enum]) if enum in entries else X4PackedStore.read(store, enum))
+                for enum in sorted(set(store.keys()) | set(entries))))
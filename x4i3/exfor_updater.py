@@ -0,0 +1,146 @@
+# Copyright (c) 2020, Anatoli Fedynitch <afedynitch@gmail.com>
+
+# This file is part of the fork (x4i3) of the EXFOR Interface (x4i)
+
+# Please read the LICENCE.txt included in this distribution including "Our [LLNL's]
+# Notice and the GNU General Public License", which applies also to this fork.
+
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License (as published by the
+# Free Software Foundation) version 2, dated June 1991.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the IMPLIED WARRANTY OF
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# terms and conditions of the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+
+# module exfor_updater.py
+"""
+exfor_updater module - Applies EXFOR update transmissions to an installed
+database, without downloading and unpacking the whole database again
+"""
+
+import datetime
+import os
+import pathlib
+
+from .exfor_store import X4PackedStore, X4CompressedStore, updatePackedStore, openTemporary
+
+
+def splitTransmission(data):
+    '''
+    Splits the contents of a transmission file, or of an .x4 file, into its
+    ENTRYs and returns them as { ENTRY:contents }. The records outside of
+    ENTRYs, e.g. TRANS and ENDTRANS, are dropped.
+    '''
+    result = {}
+    entry = None
+    for line in bytes(data).splitlines(True):
+        if line.startswith(b'ENTRY '):
+            enum = line[14:22].strip().decode('ascii')
+            if len(enum) != 5:
+                raise ValueError('Invalid EXFOR ENTRY record: ' + repr(line))
+            entry = [line]
+        elif entry is not None:
+            entry.append(line)
+            if line.startswith(b'ENDENTRY'):
+                result[enum] = b''.join(entry)
+                entry = None
+    if entry is not None:
+        raise ValueError('ENTRY ' + enum + ' has no ENDENTRY record')
+    return result
+
+
+def readTransmission(source):
+    '''
+    Returns the ENTRYs { ENTRY:contents } of source, which is a transmission
+    file or a directory, whose .x4 files and transmission files (.txt, .trans)
+    are read in sorted order. Later ENTRYs replace earlier ones.
+    '''
+    source = pathlib.Path(source)
+    if not source.is_dir():
+        with open(source, 'rb') as f:
+            return splitTransmission(f.read())
+    result = {}
+    for fileName in sorted(source.rglob('*')):
+        if fileName.suffix.lower() in ('.x4', '.txt', '.trans'):
+            with open(fileName, 'rb') as f:
+                result.update(splitTransmission(f.read()))
+    return result
+
+
+def nextTag(tag, today=None):
+    '''
+    The tag X4-YYYY-MM-DD of an update made today; a suffix -2, -3, ... is
+    added if the database already has the tag of today, so that the tag
+    changes with every update
+    '''
+    new = 'X4-' + (today or datetime.date.today()).isoformat()
+    if tag is None or not tag.startswith(new):
+        return new
+    count = tag[len(new) + 1:]
+    return new + '-' + str(int(count) + 1 if count.isdigit() else 2)
+
+
+def updateDatabase(db, source, tag=None, workers=None):
+    '''
+    Adds or replaces the ENTRYs of source (see readTransmission, or a
+    dictionary { ENTRY:contents }) in db, an exfor_database.X4Database.
+
+    The ENTRYs are replaced in the db/ tree and in the packed and compressed
+    stores of db, those that exist. Every .x4 file is replaced atomically,
+    after all new files have been written. The rows of the ENTRYs in the
+    index and the pickled summaries are updated with
+    exfor_indexer.updateIndex (parsing with workers processes), and the tag
+    file is renamed to tag, by default nextTag, which invalidates the
+    caches of parsed entries. The index of the database tarballs is not
+    built anew, see updateIndex. If the update is interrupted, buildIndex
+    brings the index up to date with the files.
+
+    Returns the report of updateIndex with the new tag under the key tag.
+    '''
+    from .exfor_indexer import updateIndex
+    entries = source if isinstance(source, dict) else readTransmission(source)
+    # the old contents update the pickled summaries of an index without table x4files
+    previous = {enum: bytes(db.store.read(enum)) for enum in entries if enum in db.store}
+    if os.path.isdir(db.fullDBPath):
+        written = []
+        try:
+            for enum, data in sorted(entries.items()):
+                directory = os.path.join(db.fullDBPath, enum[:3])
+                os.makedirs(directory, exist_ok=True)
+                fileName = os.path.join(directory, enum + '.x4')
+                f, tmpFileName = openTemporary(fileName)
+                written.append((tmpFileName, fileName))
+                with f:
+                    f.write(data)
+        except BaseException:
+            for tmpFileName, fileName in written:
+                os.remove(tmpFileName)
+            raise
+        for tmpFileName, fileName in written:
+            os.replace(tmpFileName, fileName)
+    for storeType, fileName in [(X4PackedStore, db.fullPackFileName),
+                                (X4CompressedStore, db.fullCompressedFileName)]:
+        if os.path.exists(fileName):
+            store = storeType(fileName)
+            try:
+                updatePackedStore(store, entries)
+            finally:
+                store.close()
+    # the open store still reads the replaced files
+    db.close()
+    db.clearCaches()
+    report = updateIndex(db, list(entries), workers, previous=previous)
+    oldTagFile = db.dbTagFile
+    report['tag'] = tag or nextTag(None if oldTagFile is None else oldTagFile.name)
+    if oldTagFile is None:
+        open(db.DATAPATH / report['tag'], 'wb').close()
+    else:
+        # one rename, so that there is a single tag file at any time
+        os.replace(oldTagFile, db.DATAPATH / report['tag'])
+    return report
@@ -94,10 +94,19 @@ def allWithinXPercent(aL, bL, percent=1.0, absTol=1e-14):
 
 # ---------- unique ----------
 def unique(l):
+    '''The elements of l without repetitions, in the order of their first occurrence'''
     newl = []
+    seen = set()
     for x in l:
-        if not x in newl:
-            newl.append(x)
+        try:
+            if x in seen:
+                continue
+            seen.add(x)
+        except TypeError:
+            # unhashable elements, e.g. lists, are compared one by one
+            if x in newl:
+                continue
+        newl.append(x)
     return newl
 
 
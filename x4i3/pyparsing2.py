@@ -69,6 +69,7 @@ import sys
 import warnings
 import re
 import sre_constants
+import threading
 #~ sys.stderr.write( "testing pyparsing module, version %s, %s\n" % (__version__,__versionTime__ ) )
 
 __all__ = [
@@ -648,6 +649,10 @@ def nullDebugAction(*args):
     """'Do-nothing' debug action, to suppress debugging output during parsing."""
     pass
 
+# serializes the arity detection of the wrappers of _trim_arity, so that threads
+# running a parse action for the first time do not skip the right arity
+_trim_arity_lock = threading.Lock()
+
 'decorator to trim function calls to match the arity of the target'
 def _trim_arity(func, maxargs=2):
     if func in singleArgBuiltins:
@@ -656,13 +661,19 @@ def _trim_arity(func, maxargs=2):
     foundArity = [False]
     def wrapper(*args):
         while 1:
+            tried = limit[0]
             try:
-                ret = func(*args[limit[0]:])
+                ret = func(*args[tried:])
                 foundArity[0] = True
                 return ret
             except TypeError:
-                if limit[0] <= maxargs and not foundArity[0]:
-                    limit[0] += 1
+                if foundArity[0] and limit[0] == tried:
+                    raise
+                # another thread may have moved on already, retry with its limit
+                with _trim_arity_lock:
+                    if limit[0] == tried and tried <= maxargs and not foundArity[0]:
+                        limit[0] += 1
+                if limit[0] != tried:
                     continue
                 raise
     return wrapper
@@ -108,6 +108,7 @@ import re
 import sre_constants
 import collections
 import pprint
+import threading
 import traceback
 import types
 from datetime import datetime
@@ -1278,6 +1279,10 @@ def nullDebugAction(*args):
                 #~ continue
     #~ return wrapper
 
+# serializes the arity detection of the wrappers of _trim_arity, so that threads
+# running a parse action for the first time do not skip the right arity
+_trim_arity_lock = threading.Lock()
+
 # this version is Python 2.x-3.x cross-compatible
 'decorator to trim function calls to match the arity of the target'
 def _trim_arity(func, maxargs=2):
@@ -1304,7 +1309,7 @@ def _trim_arity(func, maxargs=2):
     # synthesize what would be returned by traceback.extract_stack at the call to
     # user's parse action 'func', so that we don't incur call penalty at parse time
 
-    LINE_DIFF = 6
+    LINE_DIFF = 7
     # IF ANY CODE CHANGES, EVEN JUST COMMENTS OR BLANK LINES, BETWEEN THE NEXT LINE AND
     # THE CALL TO FUNC INSIDE WRAPPER, LINE_DIFF MUST BE MODIFIED!!!!
     this_line = extract_stack(limit=2)[-1]
@@ -1312,13 +1317,14 @@ def _trim_arity(func, maxargs=2):
 
     def wrapper(*args):
         while 1:
+            tried = limit[0]
             try:
-                ret = func(*args[limit[0]:])
+                ret = func(*args[tried:])
                 foundArity[0] = True
                 return ret
             except TypeError:
                 # re-raise TypeErrors if they did not come from our arity testing
-                if foundArity[0]:
+                if foundArity[0] and limit[0] == tried:
                     raise
                 else:
                     try:
@@ -1331,8 +1337,11 @@ def _trim_arity(func, maxargs=2):
                         except NameError:
                             pass
 
-                if limit[0] <= maxargs:
-                    limit[0] += 1
+                # another thread may have moved on already, retry with its limit
+                with _trim_arity_lock:
+                    if limit[0] == tried and tried <= maxargs and not foundArity[0]:
+                        limit[0] += 1
+                if limit[0] != tried:
                     continue
                 raise
 
@@ -0,0 +1,272 @@
+# Copyright (c) 2020, Anatoli Fedynitch <afedynitch@gmail.com>
+
+# This file is part of the fork (x4i3) of the EXFOR Interface (x4i)
+
+# Please read the LICENCE.txt included in this distribution including "Our [LLNL's]
+# Notice and the GNU General Public License", which applies also to this fork.
+
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License (as published by the
+# Free Software Foundation) version 2, dated June 1991.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the IMPLIED WARRANTY OF
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# terms and conditions of the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from x4i3 import DataBaseCache, exfor_cache, exfor_database, exfor_entry, exfor_manager
+from x4i3 import testDBPath, testIndexFileName, TESTDATAPATH
+
+
+class TestX4LRUCache(unittest.TestCase):
+    def test_eviction(self):
+        cache = exfor_cache.X4LRUCache(maxBytes=10)
+        cache.put('a', b'12345')
+        cache.put('b', b'1234')
+        self.assertEqual(cache.get('a', None), b'12345')
+        cache.put('c', b'123')
+        # b is the least recently used
+        self.assertNotIn('b', cache)
+        self.assertIn('a', cache)
+        self.assertEqual(cache.cache_info(), (1, 0, 1, 8, 10, 2))
+
+    def test_get(self):
+        loaded = []
+        cache = exfor_cache.X4LRUCache(maxBytes=4)
+        load = lambda key: loaded.append(key) or key * 2
+        self.assertEqual(cache.get('ab', load), 'abab')
+        self.assertEqual(cache.get('ab', load), 'abab')
+        self.assertEqual(loaded, ['ab'])
+        # too large to be cached
+        self.assertEqual(cache.get('abc', load), 'abcabc')
+        self.assertNotIn('abc', cache)
+        info = cache.cache_info()
+        self.assertEqual((info.hits, info.misses, info.currbytes), (1, 2, 4))
+
+    def test_unbounded(self):
+        cache = exfor_cache.X4LRUCache(maxBytes=None)
+        for i in range(100):
+            cache.put(i, b'x' * 1000)
+        self.assertEqual(len(cache), 100)
+        cache.clear()
+        self.assertEqual(cache.cache_info().currbytes, 0)
+
+    def test_ttl(self):
+        cache = exfor_cache.X4LRUCache(maxBytes=None, ttl=0)
+        cache.put('a', b'1')
+        self.assertEqual(cache.get('a', lambda key: b'2'), b'2')
+        self.assertEqual((cache.expirations, cache.cache_info().evictions), (1, 1))
+        cache.ttl = 60
+        self.assertEqual(cache.get('a', None), b'2')
+        self.assertEqual(cache.expirations, 1)
+
+
+class TestDataBaseCache(unittest.TestCase):
+    def test_lazy(self):
+        cache = DataBaseCache(testDBPath)
+        lines = cache['E07/E0783.x4']
+        with open(os.path.join(testDBPath, 'E07', 'E0783.x4'), 'rb') as f:
+            self.assertEqual(lines, f.readlines())
+        self.assertEqual(len(cache), 1)
+        self.assertRaises(KeyError, cache.__getitem__, '999/99999.x4')
+
+    def test_budget(self):
+        size = os.path.getsize(os.path.join(testDBPath, 'E07', 'E0783.x4'))
+        cache = DataBaseCache(testDBPath, maxBytes=size)
+        cache['E07/E0783.x4']
+        cache['100/10036.x4']
+        cache['E07/E0783.x4']
+        info = cache.cache_info()
+        self.assertEqual((info.hits, info.misses), (0, 3))
+        self.assertLessEqual(info.currbytes, size)
+        self.assertGreaterEqual(info.evictions, 1)
+
+    def test_database(self):
+        db = exfor_database.X4Database(TESTDATAPATH, cacheBytes=2**20)
+        self.assertEqual(db.database_dict.maxBytes, 2**20)
+        exfor_entry.x4DictionaryEntryFactory('E0783', database=db)
+        exfor_entry.x4DictionaryEntryFactory('E0783', database=db)
+        self.assertEqual(db.database_dict.cache_info().hits, 1)
+
+
+class TestEntryCache(unittest.TestCase):
+    def setUp(self):
+        self.db = exfor_database.X4Database(TESTDATAPATH)
+        self.mgr = exfor_manager.X4DBManagerPlainFS(self.db)
+
+    def test_hits(self):
+        first = self.mgr.retrieve(SUBENT='E0783002')
+        second = self.mgr.retrieve(SUBENT='E0783002')
+        self.assertEqual(str(first), str(second))
+        info = self.db.entryCache.cache_info()
+        self.assertEqual((info.hits, info.misses), (1, 1))
+        self.assertEqual(info.hitrate, 0.5)
+        # a different subentry filter is a different key
+        self.mgr.retrieveEntry('E0783', ['E0783001'])
+        self.assertEqual(self.db.entryCache.cache_info().misses, 2)
+
+    def test_mutation(self):
+        entry = self.mgr.retrieve(ENTRY='E0783')['E0783']
+        del entry['E0783002']
+        self.assertIn('E0783002', self.mgr.retrieve(ENTRY='E0783')['E0783'])
+
+    def test_shared(self):
+        self.mgr.retrieve(ENTRY='E0783')
+        exfor_manager.X4DBManagerMemoryCached(self.db).retrieve(ENTRY='E0783')
+        self.assertEqual(self.db.entryCache.cache_info().hits, 1)
+
+    def test_raw(self):
+        self.mgr.retrieve(ENTRY='E0783', rawEntry=True)
+        self.assertEqual(len(self.db.entryCache), 0)
+
+    def test_budget(self):
+        db = exfor_database.X4Database(TESTDATAPATH, entryCacheBytes=0)
+        mgr = exfor_manager.X4DBManagerPlainFS(db)
+        mgr.retrieve(ENTRY='E0783')
+        mgr.retrieve(ENTRY='E0783')
+        self.assertEqual(db.entryCache.cache_info().hits, 0)
+
+
+class TestQueryCache(unittest.TestCase):
+    def setUp(self):
+        self.db = exfor_database.X4Database(TESTDATAPATH)
+        self.mgr = exfor_manager.X4DBManagerPlainFS(self.db)
+
+    def test_normalized(self):
+        first = self.mgr.query(reaction='N,2N', quantity='CS')
+        self.assertGreater(len(first), 0)
+        self.assertEqual(self.mgr.query(quantity='sig', reaction='n,2n'), first)
+        self.assertEqual(self.mgr.query(reaction='N,2N', quantity='cs'), first)
+        self.assertEqual(self.mgr.query(Z={92, 94}), self.mgr.query(Z=[94, 92, 94]))
+        info = self.db.queryCache.cache_info()
+        self.assertEqual((info.hits, info.misses, info.length), (3, 2, 2))
+
+    def test_mutation(self):
+        result = self.mgr.query(ENTRY='E0783')
+        result['E0783'].append('E0783999')
+        del result['E0783']
+        self.assertEqual(self.mgr.query(ENTRY='E0783'), {'E0783': ['E0783001', 'E0783002']})
+
+    def test_eviction(self):
+        db = exfor_database.X4Database(TESTDATAPATH, queryCacheSize=1, queryCacheTTL=60)
+        mgr = exfor_manager.X4DBManagerPlainFS(db)
+        mgr.query(ENTRY='E0783')
+        mgr.query(ENTRY='10036')
+        mgr.query(ENTRY='E0783')
+        info = db.queryCache.cache_info()
+        self.assertEqual((info.hits, info.misses, info.evictions), (0, 3, 2))
+        db = exfor_database.X4Database(TESTDATAPATH, queryCacheSize=0)
+        exfor_manager.X4DBManagerPlainFS(db).query(ENTRY='E0783')
+        self.assertEqual(len(db.queryCache), 0)
+
+    def test_tag(self):
+        release = tempfile.mkdtemp()
+        try:
+            tagFile = os.path.join(release, 'X4-2023-12-31')
+            open(tagFile, 'w').close()
+            db = exfor_database.X4Database(release, testDBPath, testIndexFileName)
+            mgr = exfor_manager.X4DBManagerPlainFS(db)
+            mgr.query(ENTRY='E0783')
+            mgr.query(ENTRY='E0783')
+            os.rename(tagFile, os.path.join(release, 'X4-2024-01-01'))
+            self.assertEqual(db.tag, 'X4-2024-01-01')
+            mgr.query(ENTRY='E0783')
+            info = db.queryCache.cache_info()
+            self.assertEqual((info.hits, info.misses), (1, 2))
+            db.clearCaches()
+            self.assertEqual(len(db.queryCache), 0)
+        finally:
+            shutil.rmtree(release)
+
+
+class TestDiskCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.release = os.path.join(self.tmpdir, 'release')
+        os.makedirs(os.path.join(self.release, 'db', 'E07'))
+        shutil.copy(testIndexFileName, self.release)
+        shutil.copy(os.path.join(testDBPath, 'E07', 'E0783.x4'), os.path.join(self.release, 'db', 'E07'))
+        open(os.path.join(self.release, 'X4-2000-01-01'), 'w').close()
+        self.cachedir = os.path.join(self.tmpdir, 'cache')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def manager(self):
+        # a new database, so that the in-memory cache is empty
+        return exfor_manager.X4DBManagerPlainFS(exfor_database.X4Database(self.release, diskCache=self.cachedir))
+
+    def test_warm(self):
+        cold = self.manager()
+        entry = cold.retrieve(ENTRY='E0783')
+        datasets = cold.retrieveSimplifiedDataSets(ENTRY='E0783')
+        self.assertEqual(cold.db.diskCache.cache_info().misses, 2)
+        self.assertTrue(os.path.isdir(os.path.join(self.cachedir, 'X4-2000-01-01', 'E07')))
+        warm = self.manager()
+        warm.entryFactory = None  # must not parse
+        self.assertEqual(str(warm.retrieveSimplifiedDataSets(ENTRY='E0783')), str(datasets))
+        self.assertEqual(str(warm.retrieve(ENTRY='E0783')), str(entry))
+        self.assertEqual(warm.db.diskCache.cache_info().hits, 2)
+
+    def test_changed_entry(self):
+        self.manager().retrieve(ENTRY='E0783')
+        fname = os.path.join(self.release, 'db', 'E07', 'E0783.x4')
+        with open(fname) as f:
+            text = f.read()
+        with open(fname, 'w') as f:
+            f.write(text.replace('THE RCNP CYCLOTRON', 'THE NEW CYCLOTRON'))
+        mgr = self.manager()
+        self.assertIn('THE NEW CYCLOTRON', str(mgr.retrieve(ENTRY='E0783')))
+        self.assertEqual(mgr.db.diskCache.cache_info().hits, 0)
+
+    def test_changed_tag(self):
+        self.manager().retrieve(ENTRY='E0783')
+        os.rename(os.path.join(self.release, 'X4-2000-01-01'), os.path.join(self.release, 'X4-2001-01-01'))
+        mgr = self.manager()
+        mgr.retrieve(ENTRY='E0783')
+        self.assertEqual(mgr.db.diskCache.cache_info().misses, 1)
+
+    def test_damaged(self):
+        entry = self.manager().retrieve(ENTRY='E0783')
+        for dirpath, dirnames, filenames in os.walk(self.cachedir):
+            for fname in filenames:
+                with open(os.path.join(dirpath, fname), 'r+b') as f:
+                    header = f.read(64)
+                    f.truncate(len(header))
+        mgr = self.manager()
+        self.assertEqual(str(mgr.retrieve(ENTRY='E0783')), str(entry))
+        self.assertEqual(mgr.db.diskCache.cache_info().misses, 1)
+        # the file is made again
+        self.assertEqual(str(self.manager().retrieve(ENTRY='E0783')), str(entry))
+
+    def test_threads(self):
+        import threading
+        cache = exfor_cache.X4DiskCache(self.cachedir)
+        key = ('X4-2000-01-01', 'E0783')
+        values = [bytes([i]) * 2**20 for i in range(8)]
+        threads = [threading.Thread(target=cache.get, args=(key, 1, lambda k, v=v: v)) for v in values]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertIn(cache.get(key, 1, None), values)
+        self.assertEqual(os.listdir(os.path.dirname(cache.fileName(key))), [os.path.basename(cache.fileName(key))])
+
+    def test_unwritable(self):
+        open(self.cachedir, 'w').close()
+        mgr = self.manager()
+        mgr.retrieve(ENTRY='E0783')
+        self.assertEqual(mgr.db.diskCache.cache_info().misses, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
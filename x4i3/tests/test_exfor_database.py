@@ -0,0 +1,205 @@
+# Copyright (c) 2020, Anatoli Fedynitch <afedynitch@gmail.com>
+
+# This file is part of the fork (x4i3) of the EXFOR Interface (x4i)
+
+# Please read the LICENCE.txt included in this distribution including "Our [LLNL's]
+# Notice and the GNU General Public License", which applies also to this fork.
+
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License (as published by the
+# Free Software Foundation) version 2, dated June 1991.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the IMPLIED WARRANTY OF
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# terms and conditions of the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+
+import concurrent.futures
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import unittest
+
+from x4i3 import exfor_database, exfor_manager, TESTDATAPATH, testDBPath, testIndexFileName
+from x4i3.exfor_exceptions import IndexUpgradeError
+from x4i3.pyparsing3 import nestedExpr, restOfLine
+
+
+class TestX4Database(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # A second release, in which E0783 was changed
+        cls.tmpdir = tempfile.mkdtemp()
+        cls.release = os.path.join(cls.tmpdir, 'X4-2000-01-01-release')
+        os.makedirs(os.path.join(cls.release, 'db', 'E07'))
+        shutil.copy(testIndexFileName, cls.release)
+        with open(os.path.join(testDBPath, 'E07', 'E0783.x4')) as f:
+            text = f.read()
+        with open(os.path.join(cls.release, 'db', 'E07', 'E0783.x4'), 'w') as f:
+            f.write(text.replace('THE RCNP CYCLOTRON', 'THE NEW CYCLOTRON'))
+        open(os.path.join(cls.release, 'X4-2000-01-01'), 'w').close()
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmpdir)
+
+    def test_paths(self):
+        db = exfor_database.X4Database(TESTDATAPATH)
+        self.assertEqual(db.fullDBPath, testDBPath)
+        self.assertEqual(db.fullIndexFileName, testIndexFileName)
+        self.assertIsNone(db.tag)
+        self.assertEqual(exfor_database.X4Database(self.release).tag, 'X4-2000-01-01')
+
+    def test_two_releases(self):
+        old = exfor_manager.X4DBManagerPlainFS(exfor_database.X4Database(TESTDATAPATH))
+        new = exfor_manager.X4DBManagerPlainFS(exfor_database.X4Database(self.release))
+        oldentry = old.retrieve(ENTRY='E0783', rawEntry=True)['E0783']
+        newentry = new.retrieve(ENTRY='E0783', rawEntry=True)['E0783']
+        self.assertIn('THE RCNP CYCLOTRON', oldentry[0])
+        self.assertIn('THE NEW CYCLOTRON', newentry[0])
+        self.assertEqual(oldentry[1], newentry[1])
+
+    def test_shared_database(self):
+        a = exfor_manager.X4DBManagerPlainFS(datapath=testDBPath, database=testIndexFileName)
+        b = exfor_manager.X4DBManagerMemoryCached(datapath=testDBPath, database=testIndexFileName)
+        self.assertIs(a.db, b.db)
+        self.assertIs(a.CONNECTION, b.CONNECTION)
+        self.assertEqual(a.DATAPATH, testDBPath)
+        self.assertEqual(a.retrieve(SUBENT='E0783002', rawEntry=True),
+                         b.retrieve(SUBENT='E0783002', rawEntry=True))
+
+    def test_threads(self):
+        db = exfor_database.X4Database(TESTDATAPATH)
+        mgr = exfor_manager.X4DBManagerPlainFS(db)
+        queries = [dict(target='PU-239'), dict(author='Panitkin'), dict(reaction='N,F', quantity='CS'),
+                   dict(ENTRY='13787')] * 8
+        expected = [mgr.query(**q) for q in queries]
+        connections = set()
+
+        def run(q):
+            connections.add(id(mgr.CONNECTION))
+            return mgr.query(**q)
+        with concurrent.futures.ThreadPoolExecutor(8) as executor:
+            self.assertEqual(list(executor.map(run, queries)), expected)
+        self.assertNotIn(id(mgr.CONNECTION), connections)
+        # the connections of other threads are read-only and closed when the threads end
+        with concurrent.futures.ThreadPoolExecutor(1) as executor:
+            connection = executor.submit(db.connect).result()
+            self.assertRaises(sqlite3.OperationalError, connection.execute, "delete from theworks")
+        self.assertRaises(sqlite3.ProgrammingError, connection.execute, "select 1")
+        connections = []
+        for i in range(20):
+            thread = threading.Thread(target=lambda: connections.append(mgr.CONNECTION))
+            thread.start()
+            thread.join()
+        for connection in connections:
+            self.assertRaises(sqlite3.ProgrammingError, connection.execute, "select 1")
+        # close() closes those of running threads
+        with concurrent.futures.ThreadPoolExecutor(1) as executor:
+            connection = executor.submit(db.connect).result()
+            db.close()
+            self.assertRaises(sqlite3.ProgrammingError, connection.execute, "select 1")
+        self.assertEqual(mgr.query(ENTRY='13787'), expected[3])
+        db.close()
+
+    def test_retrieve_threads(self):
+        # the parse actions of a new grammar find their arity while threads run them
+        for i in range(10):
+            grammar = nestedExpr() + restOfLine
+            barrier = threading.Barrier(8)
+
+            def parse(k):
+                barrier.wait()
+                return grammar.parseString('(A.B,C.) text').asList()
+            with concurrent.futures.ThreadPoolExecutor(8) as executor:
+                self.assertEqual(list(executor.map(parse, range(8))), [[['A.B,C.'], ' text']] * 8)
+        db = exfor_database.X4Database(TESTDATAPATH, entryCacheBytes=0)
+        mgr = exfor_manager.X4DBManagerPlainFS(db)
+        entries = sorted(mgr.query(target='PU-239')) * 4
+        expected = [str(mgr.retrieve(ENTRY=e)[e]) for e in entries]
+        with concurrent.futures.ThreadPoolExecutor(16) as executor:
+            self.assertEqual(list(executor.map(lambda e: str(mgr.retrieve(ENTRY=e)[e]), entries)), expected)
+        db.close()
+
+
+class TestUpgradeIndex(unittest.TestCase):
+    def setUp(self):
+        # an index file as shipped with the database tarballs
+        self.tmpdir = tempfile.mkdtemp()
+        self.index = os.path.join(self.tmpdir, 'index.tbl')
+        connection = sqlite3.connect(self.index)
+        connection.execute('attach database ? as src', (str(testIndexFileName),))
+        connection.execute('create table theworks as select entry, subent, pointer, author, reaction, '
+                           'projectile, target, quantity, rxncombo, monitored from src.theworks')
+        connection.execute('create table doiXref as select * from src.doiXref')
+        connection.commit()
+        connection.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def indexes(self):
+        connection = sqlite3.connect(self.index)
+        result = set(row[0] for row in connection.execute(
+            "select name from sqlite_master where type = 'index'"))
+        connection.close()
+        return result
+
+    def test_upgrade(self):
+        db = exfor_database.X4Database(self.tmpdir, testDBPath)
+        mgr = exfor_manager.X4DBManagerPlainFS(db)
+        # connecting and querying leave the index file alone
+        self.assertEqual(mgr.query(SUBENT='10001015'), {'10001': ['10001001', '10001015']})
+        self.assertEqual(self.indexes(), set())
+        with self.assertRaisesRegex(IndexUpgradeError, 'no column MT in theworks'):
+            mgr.query(target='PU-239', MT=16)
+        self.assertRaisesRegex(IndexUpgradeError, 'no table x4bib', mgr.search, 'LANSCE')
+        self.assertFalse(db.upgradeIndex())
+        self.assertEqual(self.indexes(), set('theworks_' + c for c in exfor_database.INDEXEDCOLUMNS))
+        # the first statement after the upgrade reads the new schema
+        self.assertGreater(db.connect().execute("select count(*) from sqlite_stat1").fetchone()[0], 0)
+        plan = db.connect().execute(
+            "explain query plan select subent from theworks where target = ?", ('PU-239',)).fetchall()
+        self.assertIn('theworks_target', str(plan))
+        self.assertEqual(mgr.query(target='PU-239', MT=16, product='PU-238'),
+                         mgr.query(target='PU-239', reaction='N,2N'))
+        self.assertTrue(db.upgradeIndex())
+        db.close()
+
+    def test_readonly(self):
+        db = exfor_database.X4Database(self.tmpdir, testDBPath, 'file:' + self.index + '?mode=ro', uri=True)
+        self.assertRaises(IndexUpgradeError, db.upgradeIndex)
+        mgr = exfor_manager.X4DBManagerPlainFS(db)
+        self.assertEqual(mgr.query(SUBENT='10001015'), {'10001': ['10001001', '10001015']})
+        self.assertRaisesRegex(IndexUpgradeError, 'no column Z', mgr.query, Z=94)
+        db.close()
+
+    def test_locked(self):
+        writer = sqlite3.connect(self.index)
+        writer.execute('begin')
+        writer.execute('alter table theworks add column product text')
+        try:
+            db = exfor_database.X4Database(self.tmpdir, testDBPath, timeout=0.2)
+            self.assertRaisesRegex(IndexUpgradeError, 'locked', db.upgradeIndex)
+            mgr = exfor_manager.X4DBManagerPlainFS(db)
+            self.assertRaisesRegex(IndexUpgradeError, 'no column MT', mgr.query, MT=16)
+            db.close()
+        finally:
+            writer.rollback()
+            writer.close()
+
+    def test_parameters(self):
+        mgr = exfor_manager.X4DBManagerPlainFS(exfor_database.X4Database(self.tmpdir, testDBPath))
+        self.assertEqual(mgr.query(author="O'Brien"), {})
+        self.assertEqual(mgr.query(target="PU-239' or '1' = '1"), {})
+        mgr.db.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+# Copyright (c) 2020, Anatoli Fedynitch <afedynitch@gmail.com>
+
+# This file is part of the fork (x4i3) of the EXFOR Interface (x4i)
+
+# Please read the LICENCE.txt included in this distribution including "Our [LLNL's]
+# Notice and the GNU General Public License", which applies also to this fork.
+
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License (as published by the
+# Free Software Foundation) version 2, dated June 1991.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the IMPLIED WARRANTY OF
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# terms and conditions of the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+
+import concurrent.futures
+import os
+import shutil
+import tempfile
+import unittest
+
+from x4i3 import exfor_dicts
+
+
+class TestX4DictionaryCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.oldCacheFile = exfor_dicts.dictionaryCacheFile
+        exfor_dicts.dictionaryCacheFile = os.path.join(self.tmpdir, 'cache', 'x4dicts.marshal')
+        exfor_dicts._persistedDictionaries = None
+        self.server = exfor_dicts.X4DictionaryServer()
+        self.dictfile = os.path.join(self.tmpdir, 'dict33.txt')
+        shutil.copy(self.server.pathToDictionaryFiles + 'dict33.txt', self.dictfile)
+
+    def tearDown(self):
+        exfor_dicts.dictionaryCacheFile = self.oldCacheFile
+        exfor_dicts._persistedDictionaries = None
+        exfor_dicts._dictionaryMemo.pop(self.dictfile, None)
+        shutil.rmtree(self.tmpdir)
+
+    def test_memo(self):
+        d = exfor_dicts.getDictionary(self.dictfile)
+        self.assertIs(exfor_dicts.getDictionary(self.dictfile), d)
+        self.assertEqual(d, exfor_dicts.parseDictionary(self.dictfile))
+        self.assertEqual(d['A'], ['Alphas'])
+
+    def test_persisted(self):
+        d = exfor_dicts.getDictionary(self.dictfile)
+        self.assertTrue(os.path.exists(exfor_dicts.dictionaryCacheFile))
+        exfor_dicts._dictionaryMemo.clear()
+        exfor_dicts._persistedDictionaries = None
+        self.assertEqual(exfor_dicts.getDictionary(self.dictfile), d)
+
+    def test_threads(self):
+        d = exfor_dicts.getDictionary(self.dictfile)
+        with concurrent.futures.ThreadPoolExecutor(8) as executor:
+            list(executor.map(lambda i: exfor_dicts._savePersistedDictionaries(), range(64)))
+        self.assertEqual(os.listdir(os.path.dirname(exfor_dicts.dictionaryCacheFile)), ['x4dicts.marshal'])
+        exfor_dicts._dictionaryMemo.clear()
+        exfor_dicts._persistedDictionaries = None
+        self.assertEqual(exfor_dicts.getDictionary(self.dictfile), d)
+
+    def test_touched_file(self):
+        d = exfor_dicts.getDictionary(self.dictfile)
+        st = os.stat(self.dictfile)
+        os.utime(self.dictfile, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+        self.assertIs(exfor_dicts.getDictionary(self.dictfile), d)
+
+    def test_modified_file(self):
+        exfor_dicts.getDictionary(self.dictfile)
+        with open(self.dictfile, 'a') as f:
+            f.write('\nXYZ        Some new particle\n')
+        st = os.stat(self.dictfile)
+        os.utime(self.dictfile, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+        self.assertIn('XYZ', exfor_dicts.getDictionary(self.dictfile))
+
+    def test_missing_file(self):
+        self.assertIsNone(exfor_dicts.getDictionary(os.path.join(self.tmpdir, 'dict99.txt')))
+
+
+if __name__ == "__main__":
+    unittest.main()
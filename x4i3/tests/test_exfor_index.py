@@ -0,0 +1,200 @@
+# Copyright (c) 2020, Anatoli Fedynitch <afedynitch@gmail.com>
+
+# This file is part of the fork (x4i3) of the EXFOR Interface (x4i)
+
+# Please read the LICENCE.txt included in this distribution including "Our [LLNL's]
+# Notice and the GNU General Public License", which applies also to this fork.
+
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License (as published by the
+# Free Software Foundation) version 2, dated June 1991.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the IMPLIED WARRANTY OF
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# terms and conditions of the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+
+import unittest
+
+from x4i3 import exfor_index, exfor_manager, testDBPath, testIndexFileName
+
+
+class TestENDFMapping(unittest.TestCase):
+    def test_endfMT(self):
+        self.assertEqual(exfor_index.endfMT('N', 'TOT'), 1)
+        self.assertEqual(exfor_index.endfMT('N', 'EL'), 2)
+        self.assertEqual(exfor_index.endfMT('N', 'INL'), 4)
+        self.assertEqual(exfor_index.endfMT('P', 'INL'), 103)
+        self.assertEqual(exfor_index.endfMT('P', 'N'), 4)
+        self.assertEqual(exfor_index.endfMT('N', '2N'), 16)
+        self.assertEqual(exfor_index.endfMT('N', 'N+P'), 28)
+        self.assertEqual(exfor_index.endfMT('N', 'P+N'), 28)
+        self.assertEqual(exfor_index.endfMT('N', '2N+A'), 24)
+        self.assertEqual(exfor_index.endfMT('N', 'G'), 102)
+        self.assertEqual(exfor_index.endfMT('N', 'HE3'), 106)
+        self.assertIsNone(exfor_index.endfMT('N', 'SCT'))
+        self.assertIsNone(exfor_index.endfMT('N', '5N+7P'))
+
+    def test_endfMFMT(self):
+        self.assertEqual(exfor_index.endfMFMT('N', 'F', 'SIG'), (3, 18))
+        self.assertEqual(exfor_index.endfMFMT('N', 'F', 'NU'), (1, 452))
+        self.assertEqual(exfor_index.endfMFMT('N', 'EL', 'DA'), (4, 2))
+        self.assertEqual(exfor_index.endfMFMT('N', 'X', 'DA/DE'), (6, 5))
+        self.assertEqual(exfor_index.endfMFMT('N', 'G', 'WID'), (None, 102))
+        self.assertEqual(exfor_index.endfMFMT('D', 'ETA', 'SIG'), (None, None))
+
+    def test_indexProcess(self):
+        self.assertEqual(exfor_index.indexProcess('N,X+2-HE-4'), ('X', 'HE-4'))
+        self.assertEqual(exfor_index.indexProcess('N,F+ELEM/MASS'), ('F', 'ELEM/MASS'))
+        self.assertEqual(exfor_index.indexProcess('D,N+P'), ('N+P', None))
+
+    def test_reactionFields(self):
+        lines = ['SUBENT        13787002   20050926\n',
+                 'BIB                  2          2\n',
+                 'REACTION  1(94-PU-239(N,2N)94-PU-238,,SIG)\n',
+                 '          2(94-PU-239(N,3N)\n',
+                 '            94-PU-237,,SIG) free text\n',
+                 'STATUS     (TABLE)\n']
+        fields = exfor_index.reactionFields(lines)
+        self.assertEqual(fields, {'13787002': {'1': '(94-PU-239(N,2N)94-PU-238,,SIG)',
+                                               '2': '(94-PU-239(N,3N) 94-PU-237,,SIG) free text'}})
+        self.assertEqual(exfor_index.simpleReactions(fields['13787002']['1']),
+                         [('PU-239', 'N', '2N', 'PU-238')])
+        self.assertEqual(exfor_index.simpleReactions(
+            '((94-PU-239(N,F)0-NN-1,PR,KE)/(92-U-235(N,F)0-NN-1,PR,KE))'),
+            [('PU-239', 'N', 'F', 'NN-1'), ('U-235', 'N', 'F', 'NN-1')])
+
+
+class TestReactionQueries(unittest.TestCase):
+    def setUp(self):
+        self.dbMgr = exfor_manager.X4DBManagerPlainFS(datapath=testDBPath, database=testIndexFileName)
+
+    def test_MT(self):
+        self.assertEqual(self.dbMgr.query(target="PU-239", MT=16, MF=3),
+                         self.dbMgr.query(target="PU-239", reaction="N,2N", quantity="CS"))
+
+    def test_product(self):
+        self.assertEqual(self.dbMgr.query(target="PU-239", product="PU-238"),
+                         self.dbMgr.query(target="PU-239", reaction="N,2N", quantity="CS"))
+        self.assertEqual(self.dbMgr.query(product="al-28"), {'10001': ['10001001', '10001002']})
+
+    def test_projectile(self):
+        self.assertEqual(self.dbMgr.query(projectile='P', MT=2, quantity='DA').keys(),
+                         self.dbMgr.query(reaction='P,EL', quantity='DA').keys())
+
+    def test_endl(self):
+        with self.assertWarns(DeprecationWarning):
+            self.assertEqual(self.dbMgr.query(target="PU-239", C=11), self.dbMgr.query(target="PU-239"))
+
+
+class TestBibText(unittest.TestCase):
+    def setUp(self):
+        self.dbMgr = exfor_manager.X4DBManagerPlainFS(datapath=testDBPath, database=testIndexFileName)
+
+    def test_bibFields(self):
+        lines = ['SUBENT        13787001   20050926\n',
+                 'BIB                  2          2\n',
+                 'TITLE      Measurement of the\n',
+                 '           Pu-239(n,2n) cross section\n',
+                 'METHOD     (ACTIV)\n',
+                 'ENDBIB               2\n',
+                 'NOCOMMON             0          0\n',
+                 'ENDSUBENT            5\n']
+        self.assertEqual(exfor_index.bibFields(lines), {'13787001': {
+            'TITLE': 'Measurement of the Pu-239(n,2n) cross section', 'METHOD': '(ACTIV)'}})
+
+    def test_search(self):
+        # TITLE of the documentation subentry selects all SUBENTs
+        self.assertEqual(self.dbMgr.search('title: horizontal'), {'E0783': ['E0783001', 'E0783002']})
+        self.assertEqual(self.dbMgr.search('err_analys: (scanned figure)'), {'E0783': ['E0783001', 'E0783002']})
+        result = self.dbMgr.search('cyclotron')
+        self.assertIn('E0783', result)
+        self.assertEqual(list(self.dbMgr.search('cyclotron', limit=2).keys()), list(result.keys())[:2])
+        selected = self.dbMgr.query(target='H-1', quantity='POL/DA')
+        self.assertEqual(self.dbMgr.search('cyclotron', target='H-1', quantity='POL/DA'),
+                         {e: selected[e] for e in selected if e in result})
+        self.assertEqual(self.dbMgr.search('nonexistingword'), {})
+
+
+class TestDataRanges(unittest.TestCase):
+    def setUp(self):
+        self.dbMgr = exfor_manager.X4DBManagerPlainFS(datapath=testDBPath, database=testIndexFileName)
+
+    def test_dataRanges(self):
+        lines = ['SUBENT        13787001   20050926\n',
+                 'COMMON               1          3\n',
+                 'EN\n',
+                 'KEV\n',
+                 ' 14100.\n',
+                 'ENDCOMMON            3\n',
+                 'ENDSUBENT            5\n',
+                 'SUBENT        13787002   20050926\n',
+                 'DATA                 3          2\n',
+                 'COS        E-MIN      DATA\n',
+                 'NO-DIM     EV         B\n',
+                 ' 0.5        1.0+6      1.\n',
+                 ' -0.5       2.0+6      1.\n',
+                 'ENDDATA              4\n',
+                 'ENDSUBENT            5\n']
+        ranges = exfor_index.dataRanges(lines)
+        self.assertEqual(ranges['13787001'], {'en': (14.1, 14.1)})
+        self.assertEqual(ranges['13787002']['en'], (14.1, 14.1))
+        self.assertEqual(ranges['13787002']['e'], (1.0, 2.0))
+        self.assertAlmostEqual(ranges['13787002']['ang'][0], 60.0)
+        self.assertAlmostEqual(ranges['13787002']['ang'][1], 120.0)
+
+    def test_query(self):
+        allEnergies = self.dbMgr.query(target='PU-239', reaction='N,2N')
+        selected = self.dbMgr.query(target='PU-239', reaction='N,2N', energy=(14, 15))
+        self.assertTrue(set(selected) < set(allEnergies))
+        for e in selected:
+            ranges = exfor_index.dataRanges(self.dbMgr.db.readEntry(e))
+            for subent in selected[e][1:]:
+                low, high = ranges[subent]['en']
+                self.assertTrue(low <= 15 and high >= 14)
+        self.assertEqual(self.dbMgr.query(target='PU-239', reaction='N,2N', energy=(None, 1e-6)), {})
+        self.assertEqual(self.dbMgr.query(ENTRY='E0783', energy=56.0, angle=(100, None)),
+                         {'E0783': ['E0783001', 'E0783002']})
+        self.assertEqual(self.dbMgr.query(ENTRY='E0783', angle=170.0), {})
+        # ranges are tuples or Python ranges, like those of Z, A and isomer
+        self.assertEqual(self.dbMgr.query(target='PU-239', reaction='N,2N', energy=range(14, 16)), selected)
+        self.assertRaises(TypeError, self.dbMgr.query, target='PU-239', energy=[14, 15])
+        self.assertRaises(ValueError, self.dbMgr.query, target='PU-239', energy=(14, 15, 16))
+
+
+class TestTargetQueries(unittest.TestCase):
+    def setUp(self):
+        self.dbMgr = exfor_manager.X4DBManagerPlainFS(datapath=testDBPath, database=testIndexFileName)
+
+    def test_targetZAI(self):
+        self.assertEqual(exfor_index.targetZAI('U-238'), (92, 238, 0))
+        self.assertEqual(exfor_index.targetZAI('92-U-238'), (92, 238, 0))
+        self.assertEqual(exfor_index.targetZAI('FE-0'), (26, 0, 0))
+        self.assertEqual(exfor_index.targetZAI('AM-242-M'), (95, 242, 1))
+        self.assertEqual(exfor_index.targetZAI('HF-178-M2'), (72, 178, 2))
+        self.assertEqual(exfor_index.targetZAI('CO-58-M+G'), (27, 58, None))
+        self.assertEqual(exfor_index.targetZAI('H2O'), (None, None, None))
+
+    def test_query(self):
+        actinides = {}
+        for target in ['U-0', 'U-233', 'U-235', 'U-238', 'PU-239', 'PU-240', 'AM-241', 'CF-252']:
+            for e, subents in self.dbMgr.query(target=target).items():
+                actinides[e] = sorted(set(actinides.get(e, []) + subents))
+        self.assertEqual(self.dbMgr.query(Z=range(89, 104)), actinides)
+        self.assertEqual(self.dbMgr.query(Z=(89, None)), actinides)
+        self.assertEqual(self.dbMgr.query(Z=26, A=0), self.dbMgr.query(target='FE-0'))
+        self.assertEqual(self.dbMgr.query(Z=[82], A=[0, 208], isomer=0), self.dbMgr.query(Z=82))
+        # a list is a set of values, a tuple a range
+        self.assertEqual(self.dbMgr.query(Z=[92, 94]), self.dbMgr.query(Z={92, 94}))
+        self.assertEqual(self.dbMgr.query(Z=(92, 94)), self.dbMgr.query(Z=[92, 93, 94]))
+        plan = self.dbMgr.CONNECTION.execute(
+            "explain query plan select subent from theworks where Z between ? and ?", (89, 103)).fetchall()
+        self.assertIn('theworks_Z', str(plan))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,159 @@
+# Copyright (c) 2020, Anatoli Fedynitch <afedynitch@gmail.com>
+
+# This file is part of the fork (x4i3) of the EXFOR Interface (x4i)
+
+# Please read the LICENCE.txt included in this distribution including "Our [LLNL's]
+# Notice and the GNU General Public License", which applies also to this fork.
+
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License (as published by the
+# Free Software Foundation) version 2, dated June 1991.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the IMPLIED WARRANTY OF
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# terms and conditions of the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+
+import concurrent.futures
+import os
+import pickle
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from x4i3 import TESTDATAPATH, exfor_database, exfor_indexer, exfor_manager, testDBPath, testIndexFileName
+
+ENTRIES = ['10001', '12326', '13787', '21985']
+
+
+class TestIndexer(unittest.TestCase):
+    def setUp(self):
+        # a database with a few ENTRYs of the test database and without index
+        self.tmpdir = tempfile.mkdtemp()
+        for enum in ENTRIES:
+            os.makedirs(os.path.join(self.tmpdir, 'db', enum[:3]))
+            shutil.copy(os.path.join(testDBPath, enum[:3], enum + '.x4'),
+                        os.path.join(self.tmpdir, 'db', enum[:3]))
+        shutil.copy(os.path.join(TESTDATAPATH, 'x4doi.txt'), self.tmpdir)
+        self.db = exfor_database.X4Database(self.tmpdir)
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.tmpdir)
+
+    def rows(self, fileName):
+        connection = sqlite3.connect(str(fileName))
+        result = sorted(connection.execute(
+            'select * from theworks where entry in (' + ', '.join('?' * len(ENTRIES)) + ')', ENTRIES),
+            key=repr)
+        connection.close()
+        return result
+
+    def fileName(self, enum):
+        return os.path.join(self.tmpdir, 'db', enum[:3], enum + '.x4')
+
+    def test_reactionKey(self):
+        from x4i3.exfor_reactions import X4Reaction
+        reaction = X4Reaction('(94-PU-239(N,F)ELEM/MASS,CUM,SIG)')
+        self.assertEqual(exfor_indexer.reactionColumn(reaction), 'N,F+ELEM/MASS')
+        self.assertEqual(exfor_indexer.reactionKey(reaction), ('PU-239(N,F+ELEM/MASS)', 'SIG'))
+
+    def test_build(self):
+        self.assertEqual(self.db.buildIndex(workers=0),
+                         {'entries': 4, 'parsed': 4, 'removed': 0, 'errors': 0})
+        # the same rows as the index of the database tarballs
+        self.assertEqual(self.rows(self.db.fullIndexFileName), self.rows(testIndexFileName))
+        with open(os.path.join(TESTDATAPATH, 'coupled-entries.pickle'), 'rb') as f:
+            expected = {k: v for k, v in pickle.load(f).items() if k[0] in ENTRIES}
+        with open(self.db.fullCoupledFileName, 'rb') as f:
+            self.assertEqual(pickle.load(f), expected)
+        with open(self.db.fullMonitoredFileName, 'rb') as f:
+            self.assertEqual(pickle.load(f)[('10001', '10001002', ' ')],
+                             [('B-10(N,A)', 'SIG'), ('AL-27(N,G)', 'SIG')])
+        mgr = exfor_manager.X4DBManagerPlainFS(self.db)
+        self.assertEqual(mgr.query(target='PU-239', MT=16), {'13787': ['13787001', '13787002']})
+        self.assertIn('13787', mgr.search('facility: LANSCE'))
+        self.assertTrue(self.db.upgradeIndex())
+
+    def test_tarball_summaries(self):
+        # the summaries of all the test ENTRYs are those of the database tarballs, but for
+        # - the MONITORs of 20576, which were deleted from the ENTRY after the summaries were made
+        # - two keys that keep the residual, which the other keys of the tarballs drop
+        shutil.rmtree(os.path.join(self.tmpdir, 'db'))
+        shutil.copytree(testDBPath, os.path.join(self.tmpdir, 'db'))
+        self.assertEqual(self.db.buildIndex(workers=0)['errors'], 0)
+        renamed = {('AL-27(N,P)12-MG-27', 'SIG'): ('AL-27(N,P)', 'SIG'),
+                   ('MO-0(N,EL)42-MO-0', 'DA'): ('MO-0(N,EL)', 'DA')}
+        for fileName, builtFileName in [('error-entries.pickle', self.db.fullErrorFileName),
+                                        ('coupled-entries.pickle', self.db.fullCoupledFileName),
+                                        ('monitored-entries.pickle', self.db.fullMonitoredFileName),
+                                        ('reaction-count.pickle', self.db.fullReactionCountFileName)]:
+            with open(os.path.join(TESTDATAPATH, fileName), 'rb') as f:
+                expected = pickle.load(f)
+            with open(builtFileName, 'rb') as f:
+                built = pickle.load(f)
+            if fileName == 'monitored-entries.pickle':
+                expected = {k: [renamed.get(r, r) for r in v] for k, v in expected.items() if k[0] != '20576'}
+                built = {k: v for k, v in built.items() if k[0] != '20576'}
+            if fileName == 'reaction-count.pickle':
+                expected = {renamed.get(k, k): v for k, v in expected.items()}
+                for k in [('H-1(N,EL)', 'SIG'), ('BE-9(A,N)', 'SIG'), ('H-2(D,N)', 'SIG'),
+                          ('H-3(P,N)', 'SIG'), ('LI-7(P,N)', 'DA')]:
+                    expected[k] -= 3
+                expected = {k: v for k, v in expected.items() if v}
+            self.assertEqual(built, expected, fileName)
+
+    def test_incremental(self):
+        self.db.buildIndex(workers=0)
+        self.assertEqual(self.db.buildIndex(workers=0)['parsed'], 0)
+        with open(self.fileName('10001'), encoding='latin1') as f:
+            text = f.read()
+        with open(self.fileName('10001'), 'w', encoding='latin1') as f:
+            f.write(text.replace('Neutron radiative capture', 'Neutron radiative xyzzy capture'))
+        os.remove(self.fileName('21985'))
+        self.assertEqual(self.db.buildIndex(workers=0),
+                         {'entries': 3, 'parsed': 1, 'removed': 1, 'errors': 0})
+        mgr = exfor_manager.X4DBManagerPlainFS(self.db)
+        self.assertEqual(list(mgr.search('xyzzy')), ['10001'])
+        self.assertEqual(mgr.query(ENTRY='21985'), {})
+        with open(self.db.fullCoupledFileName, 'rb') as f:
+            self.assertFalse(any(k[0] == '21985' for k in pickle.load(f)))
+        # an ENTRY that cannot be parsed has no rows, its error is kept
+        with open(self.fileName('12326'), 'w', encoding='latin1') as f:
+            f.write('ENTRY            12326\nSUBENT        12326001\nBIB\nREACTION   (nonsense)\n')
+        self.assertEqual(self.db.buildIndex(workers=0)['errors'], 1)
+        self.assertEqual(mgr.query(ENTRY='12326'), {})
+        with open(self.db.fullErrorFileName, 'rb') as f:
+            self.assertEqual(list(pickle.load(f)), ['12326'])
+        self.assertEqual(self.db.buildIndex(workers=0)['parsed'], 0)
+
+    def test_writePickle(self):
+        # writers of the same file at the same time use temporary files of their own
+        fileName = os.path.join(self.tmpdir, 'summary.pickle')
+        with concurrent.futures.ThreadPoolExecutor(4) as executor:
+            list(executor.map(lambda i: exfor_indexer._writePickle({i: list(range(10000))}, fileName), range(16)))
+        self.assertEqual(sorted(f for f in os.listdir(self.tmpdir) if 'summary' in f), ['summary.pickle'])
+        with open(fileName, 'rb') as f:
+            self.assertEqual(list(pickle.load(f).values()), [list(range(10000))])
+
+    def test_workers(self):
+        self.assertEqual(self.db.buildIndex(workers=2)['parsed'], 4)
+        self.assertEqual(self.rows(self.db.fullIndexFileName), self.rows(testIndexFileName))
+
+    def test_tarball_index(self):
+        # an index without content hashes is made anew
+        shutil.copy(testIndexFileName, self.db.fullIndexFileName)
+        self.assertEqual(self.db.buildIndex(workers=0)['parsed'], 4)
+        connection = sqlite3.connect(str(self.db.fullIndexFileName))
+        self.assertEqual(connection.execute('select count(distinct entry) from theworks').fetchone()[0], 4)
+        self.assertEqual(connection.execute('select count(*) from doiXref').fetchone()[0], 8663)
+        connection.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,203 @@
+# Copyright (c) 2020, Anatoli Fedynitch <afedynitch@gmail.com>
+
+# This file is part of the fork (x4i3) of the EXFOR Interface (x4i)
+
+# Please read the LICENCE.txt included in this distribution including "Our [LLNL's]
+# Notice and the GNU General Public License", which applies also to this fork.
+
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License (as published by the
+# Free Software Foundation) version 2, dated June 1991.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the IMPLIED WARRANTY OF
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# terms and conditions of the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+
+import hashlib
+import http.server
+import io
+import os
+import pathlib
+import shutil
+import tarfile
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import x4i3
+from x4i3 import exfor_installer, exfor_exceptions, TESTDATAPATH
+
+TARNAME = 'x4i3_X4-2000-01-01.tar.gz'
+
+
+class RangeRequestHandler(http.server.BaseHTTPRequestHandler):
+    """Serves the files of the test server, supports Range requests and
+    drops the connection half way through the first request if asked to"""
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        name = self.path.lstrip('/')
+        if name not in server.files:
+            self.send_error(404)
+            return
+        data = server.files[name]
+        server.requests.append((name, self.headers.get('Range')))
+        start = 0
+        if self.headers.get('Range') is not None:
+            start = int(self.headers['Range'].split('=')[1].split('-')[0])
+            if start >= len(data):
+                self.send_error(416)
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes %d-%d/%d' % (start, len(data) - 1, len(data)))
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', str(len(data) - start))
+        self.end_headers()
+        if server.drop_after is not None:
+            self.wfile.write(data[start:start + server.drop_after])
+            server.drop_after = None
+            self.close_connection = True
+            return
+        self.wfile.write(data[start:])
+
+
+def make_archive(members=None):
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode='w:gz') as tar:
+        tar.add(os.path.join(TESTDATAPATH, 'index.tbl'), arcname='index.tbl')
+        for d in ['100', '137']:
+            tar.add(os.path.join(TESTDATAPATH, 'db', d), arcname='db/' + d)
+        for m, data in (members or {}).items():
+            info = tarfile.TarInfo(m)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    return buf.getvalue()
+
+
+class TestInstallDatabase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.archive = make_archive()
+        cls.digest = hashlib.sha256(cls.archive).hexdigest()
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.datapath = os.path.join(self.tmpdir, 'data')
+        self.tarfile = os.path.join(self.tmpdir, TARNAME)
+        with open(self.tarfile, 'wb') as f:
+            f.write(self.archive)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def start_server(self, files, drop_after=None):
+        server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), RangeRequestHandler)
+        server.files = files
+        server.requests = []
+        server.drop_after = drop_after
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server, 'http://127.0.0.1:%d/' % server.server_address[1]
+
+    def assertInstalled(self):
+        for sd in ['100', '137']:
+            for f in os.listdir(os.path.join(TESTDATAPATH, 'db', sd)):
+                with open(os.path.join(TESTDATAPATH, 'db', sd, f), 'rb') as a, \
+                        open(os.path.join(self.datapath, 'db', sd, f), 'rb') as b:
+                    self.assertEqual(a.read(), b.read())
+        self.assertTrue(os.path.exists(os.path.join(self.datapath, 'index.tbl')))
+        self.assertTrue(os.path.exists(os.path.join(self.datapath, 'X4-2000-01-01')))
+        self.assertEqual(sorted(os.listdir(self.datapath)), ['X4-2000-01-01', 'db', 'index.tbl'])
+
+    def test_local_file(self):
+        digest = exfor_installer.install_database(
+            self.tarfile, self.datapath, sha256=self.digest, tag='X4-2000-01-01')
+        self.assertEqual(digest, self.digest)
+        self.assertInstalled()
+
+    def test_file_url(self):
+        exfor_installer.install_database(
+            'file://' + self.tarfile, self.datapath, tag='X4-2000-01-01', workers=2)
+        self.assertInstalled()
+
+    def test_checksum_mismatch(self):
+        self.assertRaises(exfor_exceptions.DatabaseInstallError,
+                          exfor_installer.install_database, self.tarfile, self.datapath,
+                          sha256=64 * '0', tag='X4-2000-01-01')
+        self.assertEqual(os.listdir(self.datapath), [])
+
+    def test_manifest(self):
+        manifest = os.path.join(self.tmpdir, 'SHA256SUMS')
+        with open(manifest, 'w') as f:
+            f.write('%s  %s\n' % (self.digest, TARNAME))
+        self.assertEqual(exfor_installer.read_manifest(manifest), {TARNAME: self.digest})
+        exfor_installer.install_database(
+            self.tarfile, self.datapath, manifest=manifest, tag='X4-2000-01-01')
+        self.assertInstalled()
+
+    def test_unsafe_member(self):
+        with open(self.tarfile, 'wb') as f:
+            f.write(make_archive({'../evil.txt': b'evil'}))
+        self.assertRaises(exfor_exceptions.DatabaseInstallError,
+                          exfor_installer.install_database, self.tarfile, self.datapath)
+        self.assertFalse(os.path.exists(os.path.join(self.tmpdir, 'evil.txt')))
+
+    def test_http(self):
+        server, url = self.start_server(
+            {TARNAME: self.archive, 'SHA256SUMS': ('%s *%s\n' % (self.digest, TARNAME)).encode()})
+        exfor_installer.install_database(
+            url + TARNAME, self.datapath, manifest=url + 'SHA256SUMS', tag='X4-2000-01-01')
+        self.assertInstalled()
+        self.assertEqual(server.requests, [('SHA256SUMS', None), (TARNAME, None)])
+
+    def test_default(self):
+        # the default download is verified against the manifest published with it
+        server, url = self.start_server({TARNAME: self.archive, 'SHA256SUMS': b''})
+        environ = {k: v for k, v in os.environ.items()
+                   if k not in ['X43I_DATAPATH', 'X43I_DATABASE_MANIFEST']}
+        with mock.patch.dict(os.environ, environ, clear=True), \
+                mock.patch.object(x4i3, 'DATAPATH', pathlib.Path(self.datapath)), \
+                mock.patch.object(x4i3, 'url_manifest', url + 'SHA256SUMS'):
+            self.assertRaises(exfor_exceptions.DatabaseInstallError,
+                              x4i3._download_and_unpack_file, url + TARNAME)
+            self.assertFalse(os.path.exists(os.path.join(self.datapath, 'index.tbl')))
+            server.files['SHA256SUMS'] = ('%s  %s\n' % (self.digest, TARNAME)).encode()
+            x4i3._download_and_unpack_file(url + TARNAME)
+        self.assertTrue(os.path.exists(os.path.join(self.datapath, 'index.tbl')))
+        self.assertTrue(os.path.exists(os.path.join(self.datapath, x4i3.current_tag)))
+
+    def test_http_resume_broken_connection(self):
+        server, url = self.start_server({TARNAME: self.archive}, drop_after=len(self.archive) // 2)
+        exfor_installer.install_database(
+            url + TARNAME, self.datapath, sha256=self.digest, tag='X4-2000-01-01')
+        self.assertInstalled()
+        self.assertEqual(len(server.requests), 2)
+        self.assertEqual(server.requests[0], (TARNAME, None))
+        self.assertTrue(server.requests[1][1].startswith('bytes='))
+        self.assertGreater(int(server.requests[1][1][6:-1]), 0)
+
+    def test_http_resume_partial_file(self):
+        server, url = self.start_server({TARNAME: self.archive})
+        os.makedirs(self.datapath)
+        with open(os.path.join(self.datapath, TARNAME + '.part'), 'wb') as f:
+            f.write(self.archive[:1000])
+        exfor_installer.install_database(
+            url + TARNAME, self.datapath, sha256=self.digest, tag='X4-2000-01-01')
+        self.assertInstalled()
+        self.assertEqual(server.requests, [(TARNAME, 'bytes=1000-')])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -22,12 +22,17 @@
 # along with this program; if not, write to the Free Software Foundation,
 # Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
 
+import asyncio
+import io
 import os
+import shutil
 import sys
+import tempfile
 import unittest
+import zipfile
 
 # Set up the paths to x4i & friends
-from x4i3 import exfor_manager, testDBPath, testIndexFileName
+from x4i3 import exfor_database, exfor_exceptions, exfor_manager, testDBPath, testIndexFileName
 
 ENTRYANSWER = {
     'E0783': [
@@ -115,6 +120,16 @@ class TestX4DBManager(unittest.TestCase):
         self.assertEqual(self.dbMgr.__fixkey__('10001015'), '10001015')
         self.assertRaises(KeyError, self.dbMgr.__fixkey__, '1000101')
 
+    def test_decompress_entry(self):
+        buf = io.BytesIO()
+        with zipfile.ZipFile(buf, 'w', zipfile.ZIP_DEFLATED) as z:
+            z.writestr('E0783.txt', NEWENTRYANSWER['E0783'][0])
+        cwd = os.listdir('.')
+        self.assertEqual(self.dbMgr.decompress_entry(('E0783', buf.getvalue())),
+                         ('E0783', NEWENTRYANSWER['E0783'][0]))
+        self.assertEqual(os.listdir('.'), cwd)
+        self.assertRaises(Exception, self.dbMgr.decompress_entry, ('E0783', b'not a zip file'))
+
     def test_entry_query(self):
         self.assertEqual(self.dbMgr.query(ENTRY=10001),
                          {'10001': ['10001001',
@@ -174,6 +189,98 @@ class TestX4DBManager(unittest.TestCase):
         self.assertEqual(self.dbMgr.retrieve(SUBENT='E0783002', rawEntry=True), {
                          'E0783': [NEWENTRYANSWER['E0783'][0], NEWENTRYANSWER['E0783'][1]]})
 
+    def test_contains(self):
+        for key in ['E0783', 10001, '10001015', 'E0783001', '13787002']:
+            self.assertIn(key, self.dbMgr)
+        for key in ['99999', '10001099', 'E0784002']:
+            self.assertNotIn(key, self.dbMgr)
+        self.assertRaises(KeyError, self.dbMgr.__contains__, '1000')
+        # the same answers as the query
+        self.assertTrue(exfor_manager.X4DBManager.__contains__(self.dbMgr, '10001015'))
+        self.assertFalse(exfor_manager.X4DBManager.__contains__(self.dbMgr, '10001099'))
+        accessions = self.dbMgr.db.accessions
+        self.assertEqual(len(accessions), 122 + 424 + 122)
+        self.assertNotIn('1000!', accessions)
+
+    def test_query_many(self):
+        self.assertEqual(self.dbMgr.query_many(['E0783', 10001015, '10001017', '13787002', '99999']),
+                         {'E0783': ['E0783001', 'E0783002'],
+                          '10001': ['10001001', '10001015', '10001017'],
+                          '13787': ['13787001', '13787002']})
+        self.assertEqual(self.dbMgr.query_many([]), {})
+        self.assertRaises(KeyError, self.dbMgr.query_many, ['1000'])
+
+    def test_retrieve_many(self):
+        result = self.dbMgr.retrieve_many(['E0783002', '10001015', '10001017'], rawEntry=True)
+        self.assertEqual(result['E0783'], NEWENTRYANSWER['E0783'])
+        self.assertEqual([s[14:22] for s in result['10001']], ['10001001', '10001015', '10001017'])
+        parsed = self.dbMgr.retrieve_many(['E0783002', '10001015'])
+        self.assertEqual(str(parsed['E0783']), str(self.dbMgr.retrieve(SUBENT='E0783002')['E0783']))
+        self.assertEqual(sorted(parsed['10001'].keys()), ['10001001', '10001015'])
+
+    def test_workers(self):
+        keys = ['E0783002', '10036', '13787', '10001015']
+        serial = self.dbMgr.retrieve_many(keys)
+        parallel = self.dbMgr.retrieve_many(keys, workers=2)
+        self.assertEqual(list(parallel.keys()), list(serial.keys()))
+        self.assertEqual(str(parallel), str(serial))
+        raw = self.dbMgr.retrieve(target="PU-239", reaction="N,2N", rawEntry=True, workers=2)
+        self.assertEqual(raw, self.dbMgr.retrieve(target="PU-239", reaction="N,2N", rawEntry=True))
+
+    def test_errors(self):
+        # a db/ tree without the file of 10036
+        tmpdir = tempfile.mkdtemp()
+        try:
+            shutil.copytree(os.path.join(testDBPath, 'E07'), os.path.join(tmpdir, 'db', 'E07'))
+            mgr = exfor_manager.X4DBManagerPlainFS(exfor_database.X4Database(
+                tmpdir, os.path.join(tmpdir, 'db'), testIndexFileName))
+            keys = ['10036', 'E0783']
+            errors = []
+            result = mgr.retrieve_many(keys, workers=2, errors=errors)
+            self.assertEqual(list(result.keys()), ['E0783'])
+            self.assertEqual([r.entry for r in errors], ['10036'])
+            self.assertEqual(errors[0].subents, ['10036001', '10036002'])
+            self.assertEqual(errors[0].error, 'FileNotFoundError')
+            self.assertIn('Traceback', errors[0].traceback)
+            self.assertRaises(exfor_exceptions.RetrievalError, mgr.retrieve_many, keys, workers=2)
+            self.assertRaises(FileNotFoundError, mgr.retrieve_many, keys)
+            serial = []
+            mgr.retrieve_many(keys, errors=serial)
+            self.assertEqual([r[:4] for r in serial], [r[:4] for r in errors])
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_query_page(self):
+        full = self.dbMgr.query(reaction="N,*")
+        pages = []
+        after = None
+        while True:
+            page = self.dbMgr.query_page(10, after=after, reaction="N,*")
+            if len(page) == 0:
+                break
+            self.assertLessEqual(len(page), 10)
+            pages.append(page)
+            after = list(page)[-1]
+        merged = {}
+        for page in pages:
+            merged.update(page)
+        self.assertEqual(list(merged.items()), list(full.items()))
+        self.assertEqual(self.dbMgr.query_page(10, offset=10, reaction="N,*"), pages[1])
+        self.assertEqual(self.dbMgr.query_page(1, author="Panitkin", after='40121'),
+                         {'40177': ['40177001', '40177002', '40177003']})
+        self.assertEqual(self.dbMgr.query_page(10), {})
+
+    def test_iter_retrieve(self):
+        stream = self.dbMgr.iter_retrieve(target="PU-239", rawEntry=True)
+        self.assertEqual(list(stream), list(self.dbMgr.retrieve(target="PU-239", rawEntry=True).items()))
+        parsed = self.dbMgr.iter_retrieve(author="Panitkin")
+        e, entry = next(parsed)
+        self.assertEqual(e, '40121')
+        self.assertEqual(str(entry), str(self.dbMgr.retrieve(author="Panitkin")['40121']))
+        # stopping early closes the cursor
+        parsed.close()
+        self.assertEqual(list(self.dbMgr.iter_retrieve()), [])
+
     def test_targ_reaction_cs_quant_query(self):
         self.assertEqual(self.dbMgr.query(target="PU-239", reaction="N,2N", quantity="CS"), {
             '13787': ['13787001', '13787002'],
@@ -302,6 +409,74 @@ class TestX4DBManager(unittest.TestCase):
         })
 
 
+class TestAsyncX4DBManager(unittest.TestCase):
+    def setUp(self):
+        self.dbMgr = exfor_manager.X4DBManagerPlainFS(
+            datapath=testDBPath, database=testIndexFileName)
+
+    def run_async(self, workers, coroutine):
+        async def run():
+            async with exfor_manager.AsyncX4DBManager(self.dbMgr, workers=workers, concurrency=2) as mgr:
+                return await coroutine(mgr)
+        return asyncio.run(run())
+
+    def test_retrieve(self):
+        async def run(mgr):
+            return (await mgr.query(target="PU-239"), await mgr.retrieve(target="PU-239"),
+                    await mgr.retrieve_many(['E0783002', '10001015'], rawEntry=True))
+        smap, entries, raw = self.run_async(0, run)
+        self.assertEqual(smap, self.dbMgr.query(target="PU-239"))
+        self.assertEqual(str(entries), str(self.dbMgr.retrieve(target="PU-239")))
+        self.assertEqual(raw, self.dbMgr.retrieve_many(['E0783002', '10001015'], rawEntry=True))
+
+    def test_processes(self):
+        async def run(mgr):
+            return await mgr.retrieve(ENTRY='E0783')
+        self.assertEqual(str(self.run_async(2, run)), str(self.dbMgr.retrieve(ENTRY='E0783')))
+
+    def test_iter_retrieve(self):
+        async def run(mgr):
+            result = []
+            async for e, entry in mgr.iter_retrieve(reaction="N,*", rawEntry=True):
+                result.append(e)
+                if len(result) == 3:
+                    break
+            return result
+        self.assertEqual(self.run_async(0, run), list(self.dbMgr.query(reaction="N,*"))[:3])
+
+    def test_errors(self):
+        # 10036 is missing in this db/ tree
+        tmpdir = tempfile.mkdtemp()
+        try:
+            shutil.copytree(os.path.join(testDBPath, 'E07'), os.path.join(tmpdir, 'db', 'E07'))
+            self.dbMgr = exfor_manager.X4DBManagerPlainFS(exfor_database.X4Database(
+                tmpdir, os.path.join(tmpdir, 'db'), testIndexFileName))
+            errors = []
+
+            async def run(mgr):
+                return await mgr.retrieve_many(['10036', 'E0783'], errors=errors)
+            self.assertEqual(list(self.run_async(0, run).keys()), ['E0783'])
+            self.assertEqual([r.entry for r in errors], ['10036'])
+
+            async def fail(mgr):
+                return await mgr.retrieve(ENTRY='10036')
+            self.assertRaises(exfor_exceptions.RetrievalError, self.run_async, 0, fail)
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_cancel(self):
+        async def run(mgr):
+            task = asyncio.ensure_future(mgr.retrieve(reaction="N,*"))
+            await asyncio.sleep(0)
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                return True
+            return False
+        self.assertTrue(self.run_async(0, run))
+
+
 if __name__ == "__main__":
     try:
         import xmlrunner
@@ -110,6 +110,22 @@ class TestX4ChemicalCompound(unittest.TestCase):
         self.assertEqual(exfor_particle.X4ChemicalCompound("19-K-CMP").Z, 19)
 
 
+class TestX4LongestMatch(unittest.TestCase):
+    def test_pattern(self):
+        self.assertEqual(exfor_grammers.trieRegexPattern(['A', 'AB', 'AC', 'B+']),
+                         r'(?:A(?:B|C)?|B\+)')
+
+    def test_longest(self):
+        m = exfor_grammers.x4LongestMatch(['A', 'AB', 'ABCD'])
+        self.assertEqual(m.parseString('ABC')[0], 'AB')
+        self.assertEqual(m.parseString('ABCD')[0], 'ABCD')
+        self.assertRaises(exfor_reactions.ParseException, m.parseString, 'B')
+
+    def test_basicparticle(self):
+        self.assertEqual(exfor_grammers.x4basicparticle.parseString('B+').asList(), ['B+'])
+        self.assertEqual(exfor_grammers.x4basicparticle.parseString('XN').asList(), ['X', 'N'])
+
+
 class TextX4Process(unittest.TestCase):
     def test_n2n(self):
         self.assertEqual(str(exfor_reactions.X4Process(
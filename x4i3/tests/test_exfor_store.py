@@ -0,0 +1,161 @@
+# Copyright (c) 2020, Anatoli Fedynitch <afedynitch@gmail.com>
+
+# This file is part of the fork (x4i3) of the EXFOR Interface (x4i)
+
+# Please read the LICENCE.txt included in this distribution including "Our [LLNL's]
+# Notice and the GNU General Public License", which applies also to this fork.
+
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License (as published by the
+# Free Software Foundation) version 2, dated June 1991.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the IMPLIED WARRANTY OF
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# terms and conditions of the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+
+import concurrent.futures
+import os
+import shutil
+import tempfile
+import unittest
+import zlib
+
+from x4i3 import exfor_database, exfor_manager, exfor_store, TESTDATAPATH, testDBPath, testIndexFileName
+
+
+class TestX4PackedStore(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmpdir = tempfile.mkdtemp()
+        cls.db = exfor_database.X4Database(cls.tmpdir, testDBPath, testIndexFileName, store='packed')
+        cls.db.pack()
+        cls.files = exfor_store.X4FileSystemStore(testDBPath)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.db.close()
+        shutil.rmtree(cls.tmpdir)
+
+    def test_files(self):
+        self.assertEqual(os.listdir(self.tmpdir), ['entries.x4pack'])
+
+    def test_keys(self):
+        self.assertEqual(self.db.store.keys(), self.files.keys())
+        self.assertEqual(len(self.files.keys()), 122)
+        self.assertIn('E0783', self.db.store)
+        self.assertNotIn('99999', self.db.store)
+
+    def test_read(self):
+        for enum in self.files.keys():
+            data = self.db.store.read(enum)
+            self.assertIsInstance(data, memoryview)
+            self.assertEqual(data, self.files.read(enum))
+
+    def test_readEntry(self):
+        plain = exfor_database.X4Database(TESTDATAPATH)
+        for enum in ['10001', 'E0783', '13787']:
+            self.assertEqual(self.db.readEntry(enum), plain.readEntry(enum))
+        self.assertRaises(KeyError, self.db.readEntry, '99999')
+
+    def test_manager(self):
+        packed = exfor_manager.X4DBManagerPlainFS(self.db)
+        plain = exfor_manager.X4DBManagerPlainFS(exfor_database.X4Database(TESTDATAPATH))
+        self.assertEqual(packed.retrieve(ENTRY='E0783', rawEntry=True),
+                         plain.retrieve(ENTRY='E0783', rawEntry=True))
+        self.assertEqual(str(packed.retrieve(SUBENT='10001002')['10001']),
+                         str(plain.retrieve(SUBENT='10001002')['10001']))
+
+    def test_memory_cached(self):
+        mgr = exfor_manager.X4DBManagerMemoryCached(self.db)
+        self.assertIs(mgr.db.database_dict.store, self.db.store)
+        self.assertEqual(mgr.retrieve(ENTRY='E0783', rawEntry=True),
+                         exfor_manager.X4DBManagerPlainFS(self.db).retrieve(ENTRY='E0783', rawEntry=True))
+
+    def test_store_keyword(self):
+        mgr = exfor_manager.X4DBManagerPlainFS(datapath=testDBPath, database=testIndexFileName, store='files')
+        self.assertIsInstance(mgr.db.store, exfor_store.X4FileSystemStore)
+        self.assertRaises(ValueError, lambda: exfor_database.X4Database(self.tmpdir, store='zip').store)
+
+    def test_update(self):
+        fileName = os.path.join(self.tmpdir, 'update.x4pack')
+        exfor_store.buildPackedStore(self.files, fileName)
+        old = exfor_store.X4PackedStore(fileName)
+        exfor_store.updatePackedStore(old, {'E0783': b'ENTRY            E0783\nENDENTRY\n'})
+        # the store opened before the update still reads the old version, a new one the new version
+        for enum in ['10001', 'E0783']:
+            self.assertEqual(old.read(enum), self.files.read(enum))
+        new = exfor_store.X4PackedStore(fileName)
+        self.assertEqual(bytes(new.read('E0783')), b'ENTRY            E0783\nENDENTRY\n')
+        self.assertEqual(new.read('10001'), self.files.read('10001'))
+        self.assertEqual(new.keys(), old.keys())
+        old.close()
+        new.close()
+        os.remove(fileName)
+
+    def test_concurrent(self):
+        # builds of the same file at the same time write temporary files of their own
+        directory = tempfile.mkdtemp()
+        fileName = os.path.join(directory, 'entries.x4pack')
+        with concurrent.futures.ThreadPoolExecutor(4) as executor:
+            list(executor.map(lambda i: exfor_store.buildPackedStore(self.files, fileName), range(8)))
+        self.assertEqual(os.listdir(directory), ['entries.x4pack'])
+        store = exfor_store.X4PackedStore(fileName)
+        for enum in self.files.keys():
+            self.assertEqual(store.read(enum), self.files.read(enum))
+        store.close()
+        # a failed build leaves no temporary file behind
+        self.assertRaises(ZeroDivisionError, exfor_store._writePack,
+                          fileName, exfor_store.PACKMAGIC, (('10001', 1 // 0) for i in range(1)))
+        self.assertEqual(os.listdir(directory), ['entries.x4pack'])
+        shutil.rmtree(directory)
+
+    def test_decodeEntry(self):
+        self.assertEqual(exfor_store.decodeEntry(b'A\r\nB\rC\n\xb0'), ['A\n', 'B\n', 'C\n', '\xb0'])
+
+
+class TestX4CompressedStore(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmpdir = tempfile.mkdtemp()
+        cls.db = exfor_database.X4Database(cls.tmpdir, testDBPath, testIndexFileName, store='compressed')
+        cls.db.compress(codec='zlib')
+        cls.files = exfor_store.X4FileSystemStore(testDBPath)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.db.close()
+        shutil.rmtree(cls.tmpdir)
+
+    def test_read(self):
+        self.assertEqual(self.db.store.codec, 'zlib')
+        self.assertEqual(self.db.store.keys(), self.files.keys())
+        for enum in self.files.keys():
+            self.assertEqual(self.db.store.read(enum), self.files.read(enum))
+
+    def test_size(self):
+        # the trained dictionary pays off against compressing the entries on their own
+        store = self.db.store
+        plain = sum(len(zlib.compress(self.files.read(enum), 9)) for enum in store.keys())
+        compressed = sum(store.compressedSize(enum) for enum in store.keys())
+        self.assertLess(compressed, plain)
+        self.assertLess(os.path.getsize(store.packFileName),
+                        sum(len(self.files.read(enum)) for enum in store.keys()) / 3)
+
+    def test_manager(self):
+        packed = exfor_manager.X4DBManagerMemoryCached(self.db)
+        plain = exfor_manager.X4DBManagerPlainFS(exfor_database.X4Database(TESTDATAPATH))
+        self.assertEqual(str(packed.retrieve(SUBENT='10001002')['10001']),
+                         str(plain.retrieve(SUBENT='10001002')['10001']))
+
+    def test_codec(self):
+        self.assertRaises(ValueError, exfor_store.buildCompressedStore, self.files,
+                          os.path.join(self.tmpdir, 'x'), codec='lzma')
+
+
+if __name__ == "__main__":
+    unittest.main()
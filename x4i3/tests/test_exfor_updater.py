@@ -0,0 +1,163 @@
+# Copyright (c) 2020, Anatoli Fedynitch <afedynitch@gmail.com>
+
+# This file is part of the fork (x4i3) of the EXFOR Interface (x4i)
+
+# Please read the LICENCE.txt included in this distribution including "Our [LLNL's]
+# Notice and the GNU General Public License", which applies also to this fork.
+
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License (as published by the
+# Free Software Foundation) version 2, dated June 1991.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the IMPLIED WARRANTY OF
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# terms and conditions of the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+
+import datetime
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+
+from x4i3 import exfor_database, exfor_manager, exfor_store, exfor_updater, testDBPath
+
+ENTRIES = ['10001', '12326', '21985']
+
+
+def readFile(enum):
+    with open(os.path.join(testDBPath, enum[:3], enum + '.x4'), 'rb') as f:
+        return f.read()
+
+
+class TestUpdater(unittest.TestCase):
+    def setUp(self):
+        # a database with a few ENTRYs of the test database
+        self.tmpdir = tempfile.mkdtemp()
+        for enum in ENTRIES:
+            os.makedirs(os.path.join(self.tmpdir, 'db', enum[:3]))
+            shutil.copy(os.path.join(testDBPath, enum[:3], enum + '.x4'),
+                        os.path.join(self.tmpdir, 'db', enum[:3]))
+        open(os.path.join(self.tmpdir, 'X4-2023-12-31'), 'wb').close()
+        # a transmission with a changed and a new ENTRY
+        self.transmission = os.path.join(self.tmpdir, 'trans.txt')
+        with open(self.transmission, 'wb') as f:
+            f.write(b'TRANS         A001   20240115\n')
+            f.write(readFile('10001').replace(b'Neutron radiative capture', b'Neutron radiative xyzzy capture'))
+            f.write(readFile('13787'))
+            f.write(b'ENDTRANS         2\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_splitTransmission(self):
+        with open(self.transmission, 'rb') as f:
+            entries = exfor_updater.splitTransmission(f.read())
+        self.assertEqual(sorted(entries), ['10001', '13787'])
+        self.assertEqual(entries['13787'], readFile('13787'))
+        self.assertRaises(ValueError, exfor_updater.splitTransmission, readFile('13787')[:-20])
+        directory = os.path.join(self.tmpdir, 'changed')
+        os.makedirs(os.path.join(directory, '137'))
+        shutil.copy(os.path.join(testDBPath, '137', '13787.x4'), os.path.join(directory, '137'))
+        self.assertEqual(exfor_updater.readTransmission(directory), {'13787': readFile('13787')})
+
+    def test_nextTag(self):
+        today = datetime.date(2024, 1, 15)
+        self.assertEqual(exfor_updater.nextTag('X4-2023-12-31', today), 'X4-2024-01-15')
+        self.assertEqual(exfor_updater.nextTag('X4-2024-01-15', today), 'X4-2024-01-15-2')
+        self.assertEqual(exfor_updater.nextTag('X4-2024-01-15-2', today), 'X4-2024-01-15-3')
+
+    def check(self, db):
+        mgr = exfor_manager.X4DBManagerPlainFS(db)
+        title = str(mgr.retrieve(ENTRY='10001')['10001']['10001001']['BIB']['TITLE'])
+        self.assertNotIn('Xyzzy', title)
+        self.assertNotIn('13787', mgr)
+        report = db.update(self.transmission, workers=0)
+        self.assertEqual(report, {'entries': 4, 'parsed': 2, 'removed': 0, 'errors': 0,
+                                  'tag': 'X4-' + datetime.date.today().isoformat()})
+        self.assertEqual(db.tag, report['tag'])
+        self.assertEqual(sorted(db.DATAPATH.glob('X4-*')), [db.DATAPATH / report['tag']])
+        # the index, the store and the caches of parsed entries are up to date
+        self.assertEqual(list(mgr.search('xyzzy')), ['10001'])
+        self.assertEqual(mgr.query(target='PU-239', MT=16), {'13787': ['13787001', '13787002']})
+        self.assertIn('13787002', mgr)
+        title = str(mgr.retrieve(ENTRY='10001')['10001']['10001001']['BIB']['TITLE'])
+        self.assertIn('Xyzzy', title)
+        self.assertEqual(bytes(db.store.read('13787')), readFile('13787'))
+        # a second update of the same day gets a new tag
+        self.assertEqual(db.update({'13787': readFile('13787')}, workers=0)['tag'], report['tag'] + '-2')
+        db.close()
+
+    def test_files(self):
+        db = exfor_database.X4Database(self.tmpdir)
+        db.buildIndex(workers=0)
+        self.check(db)
+        self.assertEqual(sorted(os.listdir(os.path.join(self.tmpdir, 'db', '137'))), ['13787.x4'])
+
+    def test_defaultTag(self):
+        # the tag file of a database installed from x4i3.url
+        os.rename(os.path.join(self.tmpdir, 'X4-2023-12-31'), os.path.join(self.tmpdir, 'x4i3_X4-2023-12-31'))
+        db = exfor_database.X4Database(self.tmpdir)
+        self.assertEqual(db.tag, 'x4i3_X4-2023-12-31')
+        self.assertEqual(db.entryStamp('10001')[0][0], 'x4i3_X4-2023-12-31')
+        db.buildIndex(workers=0)
+        self.check(db)
+
+    def test_tarball(self):
+        # an index without the table x4files, like that of the database tarballs
+        db = exfor_database.X4Database(self.tmpdir)
+        db.buildIndex(workers=0)
+        connection = db.openConnection()
+        connection.execute('drop table x4files')
+        connection.commit()
+        connection.close()
+        self.check(db)
+
+        def summaries():
+            result = []
+            for fileName in [db.fullErrorFileName, db.fullCoupledFileName, db.fullMonitoredFileName,
+                             db.fullReactionCountFileName]:
+                with open(fileName, 'rb') as f:
+                    result.append(pickle.load(f))
+            return result
+        updated = summaries()
+        self.assertEqual(updated[3][('PU-239(N,2N)', 'SIG')], 1)
+        self.assertEqual(db.buildIndex(workers=0, full=True)['parsed'], 4)
+        self.assertEqual(updated, summaries())
+        db.close()
+
+    def test_other(self):
+        # an update by another process is seen through the new tag
+        db = exfor_database.X4Database(self.tmpdir)
+        db.buildIndex(workers=0)
+        mgr = exfor_manager.X4DBManagerPlainFS(db)
+        self.assertNotIn('13787', mgr)
+        other = exfor_database.X4Database(self.tmpdir)
+        other.update(self.transmission, workers=0)
+        other.close()
+        self.assertIn('13787002', mgr)
+        self.assertEqual(mgr.query(target='PU-239', MT=16), {'13787': ['13787001', '13787002']})
+        db.close()
+
+    def test_packed(self):
+        db = exfor_database.X4Database(self.tmpdir, store='packed')
+        db.pack()
+        db.buildIndex(workers=0)
+        self.check(db)
+        self.assertEqual(exfor_store.X4FileSystemStore(db.fullDBPath).read('13787'), readFile('13787'))
+
+    def test_compressed(self):
+        db = exfor_database.X4Database(self.tmpdir, store='compressed')
+        db.compress(codec='zlib')
+        db.buildIndex(workers=0)
+        self.check(db)
+        self.assertEqual(db.store.codec, 'zlib')
+
+
+if __name__ == '__main__':
+    unittest.main()
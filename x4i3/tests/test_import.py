@@ -0,0 +1,59 @@
+# Copyright (c) 2020, Anatoli Fedynitch <afedynitch@gmail.com>
+
+# This file is part of the fork (x4i3) of the EXFOR Interface (x4i)
+
+# Please read the LICENCE.txt included in this distribution including "Our [LLNL's]
+# Notice and the GNU General Public License", which applies also to this fork.
+
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License (as published by the
+# Free Software Foundation) version 2, dated June 1991.
+
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the IMPLIED WARRANTY OF
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# terms and conditions of the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from x4i3 import __path__ as x4i3_path
+
+
+class TestLazyImport(unittest.TestCase):
+    def setUp(self):
+        self.env = dict(os.environ)
+        self.env['PYTHONPATH'] = os.path.dirname(x4i3_path[0])
+        self.env['X43I_DATAPATH'] = os.path.join(
+            tempfile.gettempdir(), 'x4i3-not-there')
+
+    def run_python(self, code):
+        return subprocess.run([sys.executable, '-c', code], env=self.env,
+                              capture_output=True, text=True)
+
+    def test_import_is_silent(self):
+        out = self.run_python('import x4i3, x4i3.exfor_manager, x4i3.exfor_entry')
+        self.assertEqual(out.returncode, 0, out.stderr)
+        self.assertEqual(out.stdout, '')
+
+    def test_check_is_deferred(self):
+        out = self.run_python('import x4i3; x4i3.check_database()')
+        self.assertNotEqual(out.returncode, 0)
+        self.assertIn('FileNotFoundError', out.stderr)
+
+    def test_manager_checks_default_database(self):
+        out = self.run_python(
+            'from x4i3 import exfor_manager; exfor_manager.X4DBManagerPlainFS()')
+        self.assertNotEqual(out.returncode, 0)
+        self.assertIn('X43I_DATAPATH', out.stderr)
+
+
+if __name__ == "__main__":
+    unittest.main()